@@ -1,13 +1,31 @@
 import os
+import time
+import uuid
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 from PIL import Image
 
-from logic import load_data, compute_scores, diversify_portfolio, disease_warnings_for_crop
-from database import FarmerDatabase
+from logic import load_data, compute_scores, diversify_portfolio, disease_warnings_for_crop, market_dependencies
+from database import FarmerDatabase, selection_hash
+from features import DRAINAGE_LEVELS, as_dict
+from reuse import DEFAULT_TOLERANCE, FarmProfile, RecommendationIndex, data_fingerprint
+from rotation import plan_rotations
+from supply import SupplyEstimator
+from layout import (
+    CROP_COLORS,
+    DEFAULT_COLOR,
+    discrete_colorscale,
+    farm_grid_labels,
+    grid_shape,
+    partition_field,
+    rect_polygons,
+)
+from tracing import tracer, span
+from weather import CachedWeatherProvider, LocalWeatherProvider, weather_alerts
 
 
 st.set_page_config(page_title="Crop Diversification Advisor", layout="wide")
@@ -15,6 +33,12 @@ st.set_page_config(page_title="Crop Diversification Advisor", layout="wide")
 # Language selection
 language = st.sidebar.selectbox("🌐 Language / भाषा / ಭಾಷೆ", ["English", "हिन्दी", "ಕನ್ನಡ"])
 
+# Optional per-rerun timing breakdown (CROP_TRACE=1 enables tracing for every session)
+show_timings = st.sidebar.checkbox("⏱️ Show timing breakdown", value=False)
+tracer.enable_for_run(show_timings)
+tracer.reset_run()
+rerun_started = time.perf_counter()
+
 # Language translations
 translations = {
     "English": {
@@ -135,11 +159,90 @@ t = translations[language]
 st.title(t["title"])
 st.caption(t["subtitle"])
 
+
+# Expensive stages are cached on their real inputs so that widget changes
+# only recompute what depends on them.
+@st.cache_resource(show_spinner=False)
+def get_data(base_path):
+    # shared read-only across sessions and reruns (no per-call copy)
+    return load_data(base_path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_database():
+    with span("app.db_init"):
+        return FarmerDatabase()
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def get_reuse_index(base_path, supply_items=None):
+    # CROP_REUSE_TOL=0 turns reuse off; every request is then computed in full
+    tolerance = float(os.environ.get("CROP_REUSE_TOL", DEFAULT_TOLERANCE))
+    if tolerance <= 0:
+        return None
+    # runs scored with other supply adjustments belong to another data version
+    return RecommendationIndex(get_database(), data_fingerprint(get_data(base_path), supply_items), tolerance,
+                               supply_items=supply_items)
+
+
+@st.cache_resource(show_spinner=False)
+def get_supply_estimator(base_path):
+    return SupplyEstimator(get_database(), get_data(base_path).get("market"))
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_site_estimate(base_path, lat, lon, season):
+    locator = get_data(base_path)["geo"]
+    return locator.locate(lat, lon, season) if locator is not None else None
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_grid_soil(base_path, lat, lon, farm_area):
+    soil_grid = get_data(base_path).get("soil_grid")
+    return soil_grid.around(lat, lon, farm_area) if soil_grid is not None else None
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_recommendations(base_path, region, season, max_crops, soil_override_items, extra_rain_mm,
+                        climate_override_items=None, supply_items=None, farm_area=None):
+    data = get_data(base_path)
+    scored = compute_scores(
+        region=region,
+        season=season,
+        crops_df=data["crops"],
+        soil_df=data["soil"],
+        climate_df=data["climate"],
+        regions_df=data["regions"],
+        market_df=data.get("market"),
+        soil_override=dict(soil_override_items) if soil_override_items else None,
+        extra_rain_mm=extra_rain_mm,
+        features=data["features"],
+        climate_override=dict(climate_override_items) if climate_override_items else None,
+        catalog=data["catalog"],
+        supply_factor=dict(supply_items) if supply_items else None,
+    )
+    site = None
+    if data["yield_model"] is not None:
+        site = as_dict(data["features"].vector(region, season, dict(soil_override_items or ()), extra_rain_mm,
+                                               dict(climate_override_items or ())))
+
+    def compute():
+        return diversify_portfolio(scored, max_crops=max_crops, yield_model=data["yield_model"], site=site)
+
+    index = get_reuse_index(base_path, supply_items)
+    if index is None:
+        return scored, compute(), None, None
+    profile = FarmProfile.from_site(data["features"], region, season, max_crops, dict(soil_override_items or ()),
+                                    extra_rain_mm, dict(climate_override_items or ()), farm_area)
+    recs, run_id, hit = index.recommend(profile, compute, lambda computed: market_dependencies(scored, computed))
+    return scored, recs, run_id, hit.distance if hit is not None else None
+
+
 base_path = os.getcwd()
-data = load_data(base_path)
+data = get_data(base_path)
 
 # Initialize database
-db = FarmerDatabase()
+db = get_database()
 
 # District data for each state
 district_data = {
@@ -217,14 +320,29 @@ with st.expander("Show input data (for transparency)", expanded=False):
 
 st.subheader(t["site_specifics"])
 soil_col1, soil_col2, soil_col3, soil_col4 = st.columns(4)
+soil_defaults = data["features"].soil_defaults(region) or {"ph": 6.5, "drainage": "moderate", "organic_matter_pct": 2.0}
 with soil_col1:
     use_override = st.checkbox(t["override_soil"], value=False)
 with soil_col2:
-    ph = st.number_input(t["soil_ph"], min_value=4.5, max_value=9.0, value=float(data["soil"].loc[data["soil"]["region"] == region].iloc[0]["ph"]) if region in set(data["soil"]["region"]) else 6.5, step=0.1)
+    ph = st.number_input(t["soil_ph"], min_value=4.5, max_value=9.0, value=soil_defaults["ph"], step=0.1)
 with soil_col3:
-    drainage = st.selectbox(t["drainage"], options=["poor", "moderate", "well"], index=["poor", "moderate", "well"].index(str(data["soil"].loc[data["soil"]["region"] == region].iloc[0]["drainage"])) if region in set(data["soil"]["region"]) else 1)
+    drainage = st.selectbox(t["drainage"], options=list(DRAINAGE_LEVELS), index=DRAINAGE_LEVELS.index(soil_defaults["drainage"]))
 with soil_col4:
-    organic_matter = st.number_input(t["organic_matter"], min_value=0.2, max_value=6.0, value=float(data["soil"].loc[data["soil"]["region"] == region].iloc[0]["organic_matter_pct"]) if region in set(data["soil"]["region"]) else 2.0, step=0.1)
+    organic_matter = st.number_input(t["organic_matter"], min_value=0.2, max_value=6.0, value=soil_defaults["organic_matter_pct"], step=0.1)
+
+use_gps = False
+if data.get("geo") is not None:
+    with st.expander("📍 GPS site lookup", expanded=False):
+        gps_col1, gps_col2, gps_col3 = st.columns(3)
+        with gps_col1:
+            use_gps = st.checkbox("Use GPS soil & climate", value=False,
+                                  help="Estimate soil and seasonal climate from the nearest sample points")
+        with gps_col2:
+            gps_lat = st.number_input("Latitude", min_value=6.0, max_value=37.0, value=12.97, step=0.01, format="%.4f")
+        with gps_col3:
+            gps_lon = st.number_input("Longitude", min_value=68.0, max_value=98.0, value=77.59, step=0.01, format="%.4f")
+        st.caption("⚠️ The bundled soil and climate points are illustrative, synthetically generated values, "
+                   "not survey measurements. Check local soil test results before relying on them.")
 
 irrig_col1, irrig_col2, irrig_col3 = st.columns(3)
 with irrig_col1:
@@ -267,127 +385,395 @@ if region == "Please select region" or season == "Please select season" or growt
     st.stop()
 
 soil_override = {"ph": ph, "drainage": drainage, "organic_matter_pct": organic_matter} if use_override else None
-
-scored = compute_scores(
-    region=region,
-    season=season,
-    crops_df=data["crops"],
-    soil_df=data["soil"],
-    climate_df=data["climate"],
-    regions_df=data["regions"],
-    market_df=data.get("market"),
-    soil_override=soil_override,
-    extra_rain_mm=extra_rain_mm,
+climate_override = None
+if use_gps:
+    with span("app.gps_lookup"):
+        site = get_site_estimate(base_path, gps_lat, gps_lon, season)
+        # the soil raster (averaged over the farm's area) is finer than the sample points
+        grid_soil = get_grid_soil(base_path, gps_lat, gps_lon, farm_area)
+    gps_soil = {**site.soil, **(grid_soil or {})}
+    # manual soil values take precedence over the GPS estimate
+    soil_override = soil_override or gps_soil
+    climate_override = site.climate or None
+    st.caption(
+        f"📍 Nearest sample point (illustrative data): {site.district}, {site.region} ({site.distance_km:.1f} km) · "
+        f"pH {gps_soil['ph']}, {gps_soil['drainage']} drainage, OM {gps_soil['organic_matter_pct']}%"
+        + (" (soil raster)" if grid_soil else "")
+        + (f" · {climate_override['forecast_temp_c']}°C, {climate_override['forecast_rain_mm']} mm" if climate_override else "")
+    )
+    if site.region != region:
+        st.info(f"These coordinates fall in {site.region}; scores still use {region}'s market data.")
+
+# supply factors are read once per region per session: the farmer's own saves must not
+# re-rank the recommendations they are choosing from
+session_supply = st.session_state.setdefault("supply_items", {})
+if region not in session_supply:
+    session_supply[region] = tuple(sorted(get_supply_estimator(base_path).factors(region).items())) or None
+
+scored, recs, run_id, reuse_distance = get_recommendations(
+    base_path,
+    region,
+    season,
+    max_crops,
+    tuple(sorted(soil_override.items())) if soil_override else None,
+    extra_rain_mm,
+    tuple(sorted(climate_override.items())) if climate_override else None,
+    session_supply[region],
+    farm_area,
 )
-
-recs = diversify_portfolio(scored, max_crops=max_crops)
+district_name = district if district != "Please select district" else "Unknown"
 
 st.subheader(t["recommendations"])
-rec_df = pd.DataFrame([
-    {
-        "Crop": r.crop,
-        "Score": round(r.score, 3),
-        "Area Share %": round(r.area_share_pct, 1),
-        "Expected Yield (t/ha)": round(r.expected_yield_t_ha, 2),
-        "Expected Revenue (/ha)": round(r.expected_revenue_per_ha, 0),
-    }
-    for r in recs
-])
+rec_df = recs.to_pandas().round({
+    "score": 3, "area_share_pct": 1, "expected_yield_t_ha": 2, "expected_revenue_per_ha": 0,
+}).rename(columns={
+    "crop": "Crop",
+    "score": "Score",
+    "area_share_pct": "Area Share %",
+    "expected_yield_t_ha": "Expected Yield (t/ha)",
+    "expected_revenue_per_ha": "Expected Revenue (/ha)",
+})[["Crop", "Score", "Area Share %", "Expected Yield (t/ha)", "Expected Revenue (/ha)"]]
 st.dataframe(rec_df, use_container_width=True)
+if data["yield_model"] is not None:
+    st.caption(f"Expected yields from the learned yield model v{data['yield_model'].version}.")
+if reuse_distance is not None:
+    st.caption(f"♻️ Reused recommendation run #{run_id} from a farm with near-identical inputs "
+               f"(profile distance {reuse_distance:.3f}).")
 
 total_revenue = (rec_df["Expected Revenue (/ha)"] * (rec_df["Area Share %"] / 100.0) * farm_area).sum()
 st.metric(label=t["total_revenue"], value=f"{int(total_revenue):,}")
 
-# Crop Selection Section
-st.subheader("🌾 Crop Selection & Planning")
-st.write("Select your preferred crops from the recommendations above:")
+# Create farm field grid visualization
+def create_farm_field_plot(crop_shares, plot_length, plot_width, max_cells=200):
+    # Grid resolution follows the real field shape; the longer side gets max_cells cells
+    rows, cols, cell_size = grid_shape(plot_length, plot_width, max_cells)
+    labels, cells_per_crop = farm_grid_labels([share for _, share in crop_shares], rows, cols)
 
-# Create checkboxes for crop selection
-selected_crops = []
-for i, rec in enumerate(recs):
-    if st.checkbox(f"{rec.crop} - {rec.area_share_pct:.1f}% area, ₹{rec.expected_revenue_per_ha:,.0f}/ha", key=f"crop_{i}"):
-        selected_crops.append({
-            'crop_name': rec.crop,
-            'area_percentage': rec.area_share_pct,
-            'expected_yield': rec.expected_yield_t_ha,
-            'expected_revenue': rec.expected_revenue_per_ha,
-            'growth_duration': int(growth_duration),
-            'season': season
+    crop_legend = {}
+    for (crop_name, area_share), cells_for_crop in zip(crop_shares, cells_per_crop):
+        crop_legend[crop_name] = {
+            'color': CROP_COLORS.get(crop_name, DEFAULT_COLOR),
+            'area_share': area_share,
+            'cells': int(cells_for_crop)
+        }
+
+    return labels, cell_size, crop_legend
+
+
+# Figures are cached on (crop, share) pairs and field size; they are only read after creation
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_farm_field_figure(crop_shares, plot_length, plot_width):
+    labels, cell_size, crop_legend = create_farm_field_plot(crop_shares, plot_length, plot_width)
+    legend_colors = [info['color'] for info in crop_legend.values()]
+    n_crops = len(crop_legend)
+
+    # Single heatmap trace: one label per cell, unassigned cells left blank
+    fig = go.Figure(go.Heatmap(
+        z=np.where(labels >= 0, labels, np.nan),
+        x0=cell_size / 2, dx=cell_size,
+        y0=cell_size / 2, dy=cell_size,
+        zmin=-0.5, zmax=n_crops - 0.5,
+        colorscale=discrete_colorscale(legend_colors),
+        colorbar=dict(
+            tickvals=list(range(n_crops)),
+            ticktext=list(crop_legend.keys()),
+            title="Crop"
+        ),
+        xgap=1 if labels.shape[1] <= 40 else 0,
+        ygap=1 if labels.shape[0] <= 40 else 0,
+        hovertemplate="Position: (%{x:.1f} m, %{y:.1f} m)<extra></extra>"
+    ))
+
+    # Update layout to look like a farm field
+    fig.update_layout(
+        title=f"Your Farm Field Layout (each cell is {cell_size:.2f} m × {cell_size:.2f} m)",
+        xaxis=dict(
+            title="Field Width (m)",
+            showgrid=False,
+            zeroline=False,
+            range=[-0.02 * plot_width, 1.02 * plot_width],
+            constrain="domain"
+        ),
+        yaxis=dict(
+            title="Field Length (m)",
+            showgrid=False,
+            zeroline=False,
+            range=[-0.02 * plot_length, 1.02 * plot_length],
+            scaleanchor="x",
+            scaleratio=1
+        ),
+        plot_bgcolor='#f0f8f0',  # Light green background
+        paper_bgcolor='#f0f8f0',
+        height=600,
+        showlegend=False
+    )
+
+    # Add field boundary
+    fig.add_shape(
+        type="rect",
+        x0=0, y0=0, x1=labels.shape[1] * cell_size, y1=labels.shape[0] * cell_size,
+        line=dict(color="darkgreen", width=3),
+        fillcolor="rgba(0,0,0,0)"
+    )
+    return fig, crop_legend
+
+
+def create_realistic_farm_layout(crop_shares, farm_area, plot_length, plot_width):
+    """Partition the real field into contiguous rectangular plots sized by area share (meters)"""
+    rects = partition_field([share for _, share in crop_shares], plot_length, plot_width)
+
+    # Create plot layout data
+    plot_data = []
+    for (crop_name, area_share), (x0, y0, x1, y1) in zip(crop_shares, rects):
+        plot_data.append({
+            'crop': crop_name,
+            'area_share': area_share,
+            'actual_area': (area_share / 100.0) * farm_area,
+            'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1,
+            'x_center': (x0 + x1) / 2,
+            'y_center': (y0 + y1) / 2,
+            'width': x1 - x0,
+            'height': y1 - y0,
+            'color': CROP_COLORS.get(crop_name, DEFAULT_COLOR)
         })
 
-if selected_crops:
-    st.success(f"Selected {len(selected_crops)} crops for your farming plan!")
-    
-    # Save farmer data to database
-    farmer_data = {
-        'name': 'Farmer User',  # In real app, get from user input
-        'region': region,
-        'district': district if district != "Please select district" else "Unknown",
-        'farm_area': farm_area,
-        'plot_length': plot_length,
-        'plot_width': plot_width,
-        'soil_texture': soil_texture,
-        'soil_moisture': soil_moisture,
-        'soil_compaction': soil_compaction
-    }
-    
-    farmer_id = db.add_farmer(farmer_data)
-    
-    # Save crop selections
-    for crop_data in selected_crops:
-        db.add_crop_selection(farmer_id, crop_data)
-    
-    # Generate detailed farm layout
-    generate_detailed_farm_layout(selected_crops, farm_area, plot_length, plot_width)
-    
-    # Generate systematic farming plan
-    generate_systematic_farming_plan(selected_crops, int(growth_duration), season)
-    
-    # Generate market tracking
-    generate_market_tracking(region, district if district != "Please select district" else "Unknown", selected_crops)
-else:
-    st.warning("Please select at least one crop to see detailed planning and layout options.")
+    return plot_data, rects
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_realistic_layout_figure(crop_shares, farm_area, plot_length, plot_width):
+    plot_data, plot_rects = create_realistic_farm_layout(crop_shares, farm_area, plot_length, plot_width)
+
+    # Create farm plot visualization: one filled outline trace per crop color
+    fig_farm = go.Figure()
+    plot_colors = np.array([plot['color'] for plot in plot_data])
+    for color in dict.fromkeys(plot_colors.tolist()):
+        xs, ys = rect_polygons(plot_rects[plot_colors == color])
+        fig_farm.add_trace(go.Scatter(
+            x=xs, y=ys,
+            mode='lines',
+            fill='toself',
+            fillcolor=color,
+            opacity=0.7,
+            line=dict(color="darkgreen", width=2),
+            hoverinfo='skip'
+        ))
+
+    # Crop labels and hover details in a single text trace; skip labels on slivers
+    min_side = 0.08 * min(plot_length, plot_width)
+    fig_farm.add_trace(go.Scatter(
+        x=[plot['x_center'] for plot in plot_data],
+        y=[plot['y_center'] for plot in plot_data],
+        mode='text',
+        text=[
+            f"<b>{plot['crop']}</b><br>{plot['area_share']:.1f}%<br>{plot['actual_area']:.2f} ha"
+            if min(plot['width'], plot['height']) >= min_side else ""
+            for plot in plot_data
+        ],
+        textfont=dict(size=10, color="black"),
+        customdata=[
+            [plot['crop'], plot['area_share'], plot['actual_area'], plot['width'], plot['height']]
+            for plot in plot_data
+        ],
+        hovertemplate="<b>%{customdata[0]}</b><br>%{customdata[1]:.1f}% · %{customdata[2]:.2f} ha<br>"
+                      "%{customdata[3]:.1f} m × %{customdata[4]:.1f} m<extra></extra>"
+    ))
+
+    # Update layout
+    fig_farm.update_layout(
+        title="Farm Plot Layout (Realistic View)",
+        xaxis=dict(
+            title="Farm Width (m)",
+            showgrid=True,
+            gridcolor='lightgray',
+            zeroline=False,
+            range=[-0.02 * plot_width, 1.02 * plot_width],
+            constrain="domain"
+        ),
+        yaxis=dict(
+            title="Farm Length (m)",
+            showgrid=True,
+            gridcolor='lightgray',
+            zeroline=False,
+            range=[-0.02 * plot_length, 1.02 * plot_length],
+            scaleanchor="x",
+            scaleratio=1
+        ),
+        plot_bgcolor='#f0f8f0',
+        paper_bgcolor='#f0f8f0',
+        height=500,
+        showlegend=False
+    )
+
+    # Add farm boundary
+    fig_farm.add_shape(
+        type="rect",
+        x0=0, y0=0, x1=plot_width, y1=plot_length,
+        line=dict(color="darkgreen", width=4),
+        fillcolor="rgba(0,0,0,0)"
+    )
+    return fig_farm, plot_data
+
+
+def generate_detailed_farm_layout(selected_crops, farm_area, plot_length, plot_width):
+    """Show where each selected crop goes in the field, shares renormalised to the selection"""
+    st.subheader("🗺️ Detailed Layout for Selected Crops")
+    total_pct = sum(c['area_percentage'] for c in selected_crops) or 1.0
+    crop_shares = tuple((c['crop_name'], c['area_percentage'] * 100.0 / total_pct) for c in selected_crops)
+    fig_selected, plot_data = get_realistic_layout_figure(crop_shares, farm_area, plot_length, plot_width)
+    st.plotly_chart(fig_selected, use_container_width=True)
+    st.dataframe(pd.DataFrame([
+        {
+            "Crop": plot['crop'],
+            "Area (%)": round(plot['area_share'], 1),
+            "Area (hectares)": round(plot['actual_area'], 2),
+            "Plot size (m)": f"{plot['width']:.1f} × {plot['height']:.1f}",
+            "Corner (x, y) m": f"({plot['x0']:.1f}, {plot['y0']:.1f})",
+        }
+        for plot in plot_data
+    ]), use_container_width=True)
+
+
+def generate_systematic_farming_plan(selected_crops, duration_months, season):
+    """Month-by-month activity plan for the selected crops"""
+    st.subheader("🗓️ Systematic Farming Plan")
+    phases = [
+        (0.0, "Land preparation, soil testing and sowing"),
+        (0.15, "Establishment: irrigation, weeding, first fertilizer dose"),
+        (0.45, "Vegetative growth: scout for pests and diseases, top dressing"),
+        (0.75, "Flowering/fruiting: critical irrigation, protect from pests"),
+        (0.9, "Harvest, drying and storage"),
+    ]
+    crop_names = ", ".join(c['crop_name'] for c in selected_crops)
+    plan_rows = []
+    for month in range(1, duration_months + 1):
+        progress = (month - 1) / duration_months
+        activity = [name for start, name in phases if progress >= start][-1]
+        plan_rows.append({"Month": month, "Season": season, "Activity": activity, "Crops": crop_names})
+    st.dataframe(pd.DataFrame(plan_rows), use_container_width=True)
+
+
+def generate_market_tracking(region, district, selected_crops):
+    """Recent price trends for the selected crops in the farmer's district"""
+    st.subheader("📈 Market Price Tracking")
+    crop_names = [c['crop_name'] for c in selected_crops]
+    trend_rows = []
+    for crop_name in crop_names:
+        trends = db.get_market_trends(region, district, crop_name)
+        trend_rows.append({
+            "Crop": crop_name,
+            "Trend": trends['trend'],
+            "Average Price (₹/t)": trends['average_price'],
+            "Momentum (%)": trends['price_change'],
+            "Volatility (%)": trends.get('volatility', 0),
+            "Data Points": trends.get('data_points', 0),
+        })
+    st.dataframe(pd.DataFrame(trend_rows), use_container_width=True)
+
+    prices = db.get_market_prices(region, district, days=30)
+    prices = prices[prices["crop_name"].isin(crop_names)]
+    if prices.empty:
+        st.info("No market price data recorded for this district yet.")
+    else:
+        fig_prices = px.line(prices.sort_values("price_date"), x="price_date", y="price_per_ton", color="crop_name",
+                             title="Price per ton (last 30 days)")
+        st.plotly_chart(fig_prices, use_container_width=True)
+
+
+# Crop Selection Section
+# Runs as a fragment: ticking a crop checkbox reruns only this section.
+@st.fragment
+def crop_selection_section(recs, run_id, farmer_data, growth_duration, season):
+    st.subheader("🌾 Crop Selection & Planning")
+    st.write("Select your preferred crops from the recommendations above:")
+
+    # Create checkboxes for crop selection; keyed and labelled by crop alone, so a change in
+    # the figures never turns one into a new (unchecked) widget
+    selected_crops = []
+    for rec in recs:
+        check_col, detail_col = st.columns([1, 3])
+        with check_col:
+            checked = st.checkbox(rec.crop, key=f"crop_{rec.crop}")
+        with detail_col:
+            st.caption(f"{rec.area_share_pct:.1f}% area, ₹{rec.expected_revenue_per_ha:,.0f}/ha")
+        if checked:
+            selected_crops.append({
+                'crop_name': rec.crop,
+                'area_percentage': rec.area_share_pct,
+                'expected_yield': rec.expected_yield_t_ha,
+                'expected_revenue': rec.expected_revenue_per_ha,
+                'growth_duration': int(growth_duration),
+                'season': season
+            })
+
+    if selected_crops:
+        st.success(f"Selected {len(selected_crops)} crops for your farming plan!")
+
+        # Save farmer data and selections once per change; unchanged reruns write nothing
+        state_hash = (tuple(sorted(farmer_data.items())), selection_hash(selected_crops))
+        if st.session_state.get("persisted_state") != state_hash:
+            farmer_id = db.upsert_farmer_session(st.session_state["farmer_session_key"], farmer_data)
+            db.save_crop_selections(farmer_id, selected_crops)
+            if run_id is not None:
+                db.link_recommendation_run(run_id, farmer_id)
+            st.session_state["persisted_state"] = state_hash
+
+        # Generate detailed farm layout
+        generate_detailed_farm_layout(selected_crops, farmer_data['farm_area'], farmer_data['plot_length'], farmer_data['plot_width'])
+
+        # Generate systematic farming plan
+        generate_systematic_farming_plan(selected_crops, int(growth_duration), season)
+
+        # Generate market tracking
+        generate_market_tracking(farmer_data['region'], farmer_data['district'], selected_crops)
+    else:
+        st.warning("Please select at least one crop to see detailed planning and layout options.")
+
+
+# Stable identity for this browser session, used to upsert rather than re-insert
+if "farmer_session_key" not in st.session_state:
+    st.session_state["farmer_session_key"] = uuid.uuid4().hex
+
+farmer_data = {
+    'name': 'Farmer User',  # In real app, get from user input
+    'region': region,
+    'district': district_name,
+    'farm_area': farm_area,
+    'plot_length': plot_length,
+    'plot_width': plot_width,
+    'soil_texture': soil_texture,
+    'soil_moisture': soil_moisture,
+    'soil_compaction': soil_compaction
+}
+with span("app.crop_selection"):
+    crop_selection_section(recs, run_id, farmer_data, growth_duration, season)
 
 # Weather Forecast Section
 st.subheader(f"🌤️ {t['weather_forecast']}")
 
-# Simulate weather data (in real app, this would come from weather API)
-import random
+# Forecasts come from a pluggable provider behind a shared on-disk cache
 import datetime
 
-# Generate 7-day weather forecast
-weather_data = []
-for i in range(7):
-    date = datetime.date.today() + datetime.timedelta(days=i)
-    temp_min = random.randint(15, 25)
-    temp_max = random.randint(25, 35)
-    humidity = random.randint(40, 80)
-    rainfall = random.randint(0, 20) if random.random() < 0.3 else 0
-    wind_speed = random.randint(5, 20)
-    
-    weather_data.append({
-        "Date": date.strftime("%Y-%m-%d"),
-        "Min Temp (°C)": temp_min,
-        "Max Temp (°C)": temp_max,
-        "Humidity (%)": humidity,
-        "Rainfall (mm)": rainfall,
-        "Wind Speed (km/h)": wind_speed
-    })
 
-weather_df = pd.DataFrame(weather_data)
+@st.cache_resource(show_spinner=False)
+def get_weather_provider(base_path):
+    local = LocalWeatherProvider(os.path.join(base_path, "data", "weather.csv"))
+    return CachedWeatherProvider(local, os.path.join(base_path, ".weather_cache"), ttl_s=3 * 3600)
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def get_weather_forecast(region, district, day):
+    weather_df = get_weather_provider(base_path).fetch(region, district, day, days=7)
+    warnings = weather_alerts(weather_df)["message"].tolist()
+    return weather_df, warnings
+
+
+with span("app.weather"):
+    weather_df, warnings = get_weather_forecast(region, district_name, datetime.date.today())
 st.dataframe(weather_df, use_container_width=True)
 
 # Weather warnings
 st.subheader(f"⚠️ {t['weather_warnings']}")
-warnings = []
-
-for _, row in weather_df.iterrows():
-    if row["Rainfall (mm)"] > 15:
-        warnings.append(f"🌧️ Heavy rainfall expected on {row['Date']} - Consider protecting crops")
-    if row["Max Temp (°C)"] > 35:
-        warnings.append(f"🌡️ High temperature warning on {row['Date']} - Ensure adequate irrigation")
-    if row["Wind Speed (km/h)"] > 15:
-        warnings.append(f"💨 Strong winds expected on {row['Date']} - Check crop support structures")
 
 if warnings:
     for warning in warnings:
@@ -398,117 +784,11 @@ else:
 # Visual Area Allocation
 st.subheader(f"🌾 {t['farm_layout']}")
 
-# Create farm field grid visualization
-def create_farm_field_plot(recs, farm_area):
-    # Calculate total grid size (approximate)
-    grid_size = 20  # 20x20 grid for better visualization
-    
-    # Create crop color mapping
-    crop_colors = {
-        'Wheat': '#DAA520',
-        'Rice': '#228B22', 
-        'Maize': '#FFD700',
-        'Chickpea': '#8B4513',
-        'Soybean': '#32CD32',
-        'Groundnut': '#D2691E',
-        'Mustard': '#FFD700',
-        'Cotton': '#F5F5DC',
-        'Sorghum': '#8B4513',
-        'Millet': '#DAA520',
-        'Vegetables': '#32CD32',
-        'Fruits': '#FF6347'
-    }
-    
-    # Create grid data
-    grid_data = []
-    crop_legend = {}
-    current_pos = 0
-    
-    for i, rec in enumerate(recs):
-        crop_name = rec.crop
-        area_share = rec.area_share_pct
-        # Calculate number of grid cells for this crop
-        cells_for_crop = int((area_share / 100.0) * (grid_size * grid_size))
-        
-        # Add cells to grid
-        for cell in range(cells_for_crop):
-            row = current_pos // grid_size
-            col = current_pos % grid_size
-            if row < grid_size:  # Make sure we don't exceed grid
-                grid_data.append({
-                    'row': row,
-                    'col': col,
-                    'crop': crop_name,
-                    'color': crop_colors.get(crop_name, '#CCCCCC')
-                })
-                current_pos += 1
-        
-        # Store legend info
-        crop_legend[crop_name] = {
-            'color': crop_colors.get(crop_name, '#CCCCCC'),
-            'area_share': area_share,
-            'cells': cells_for_crop
-        }
-    
-    return grid_data, crop_legend
+crop_shares = tuple((rec.crop, rec.area_share_pct) for rec in recs)
 
 # Generate farm field data
-grid_data, crop_legend = create_farm_field_plot(recs, farm_area)
-
-# Create farm field visualization
-fig = go.Figure()
-
-# Add grid cells
-for cell in grid_data:
-    fig.add_trace(go.Scatter(
-        x=[cell['col']],
-        y=[cell['row']],
-        mode='markers',
-        marker=dict(
-            size=15,
-            color=cell['color'],
-            line=dict(width=1, color='white'),
-            symbol='square'
-        ),
-        name=cell['crop'],
-        showlegend=False,
-        hovertemplate=f"<b>{cell['crop']}</b><br>" +
-                     f"Position: ({cell['col']}, {cell['row']})<br>" +
-                     f"<extra></extra>"
-    ))
-
-# Update layout to look like a farm field
-fig.update_layout(
-    title="Your Farm Field Layout (Each square represents a plot section)",
-    xaxis=dict(
-        title="Field Width",
-        showgrid=True,
-        gridcolor='lightgray',
-        zeroline=False,
-        range=[-1, 21]
-    ),
-    yaxis=dict(
-        title="Field Length", 
-        showgrid=True,
-        gridcolor='lightgray',
-        zeroline=False,
-        range=[-1, 21],
-        scaleanchor="x",
-        scaleratio=1
-    ),
-    plot_bgcolor='#f0f8f0',  # Light green background
-    paper_bgcolor='#f0f8f0',
-    height=600,
-    showlegend=False
-)
-
-# Add field boundary
-fig.add_shape(
-    type="rect",
-    x0=-0.5, y0=-0.5, x1=19.5, y1=19.5,
-    line=dict(color="darkgreen", width=3),
-    fillcolor="rgba(0,0,0,0)"
-)
+with span("app.plot.farm_field"):
+    fig, crop_legend = get_farm_field_figure(crop_shares, plot_length, plot_width)
 
 st.plotly_chart(fig, use_container_width=True)
 
@@ -552,122 +832,33 @@ for i, rec in enumerate(recs):
 # Realistic Farm Plot Layout
 st.subheader(f"🚜 {t['realistic_layout']}")
 
-def create_realistic_farm_layout(recs, farm_area):
-    """Create a more realistic farm layout with rectangular plots"""
-    # Calculate plot dimensions based on farm area
-    total_plots = len(recs)
-    
-    # Create plot layout data
-    plot_data = []
-    colors = ['#DAA520', '#228B22', '#FFD700', '#8B4513', '#32CD32', '#D2691E', '#FF6347', '#F5F5DC']
-    
-    for i, rec in enumerate(recs):
-        crop_name = rec.crop
-        area_share = rec.area_share_pct
-        actual_area = (area_share / 100.0) * farm_area
-        
-        # Create rectangular plot
-        plot_width = 2 + (area_share / 20)  # Width based on area share
-        plot_height = 1.5 + (area_share / 25)  # Height based on area share
-        
-        # Position plots in a grid
-        row = i // 3
-        col = i % 3
-        
-        x_center = col * 4 + 2
-        y_center = row * 3 + 1.5
-        
-        plot_data.append({
-            'crop': crop_name,
-            'area_share': area_share,
-            'actual_area': actual_area,
-            'x_center': x_center,
-            'y_center': y_center,
-            'width': plot_width,
-            'height': plot_height,
-            'color': colors[i % len(colors)]
-        })
-    
-    return plot_data
-
 # Generate realistic farm layout
-plot_data = create_realistic_farm_layout(recs, farm_area)
+with span("app.plot.realistic_layout"):
+    fig_farm, plot_data = get_realistic_layout_figure(crop_shares, farm_area, plot_length, plot_width)
 
-# Create farm plot visualization
-fig_farm = go.Figure()
+st.plotly_chart(fig_farm, use_container_width=True)
 
-# Add farm plots as rectangles
-for plot in plot_data:
-    # Add rectangle for the plot
-    fig_farm.add_shape(
-        type="rect",
-        x0=plot['x_center'] - plot['width']/2,
-        y0=plot['y_center'] - plot['height']/2,
-        x1=plot['x_center'] + plot['width']/2,
-        y1=plot['y_center'] + plot['height']/2,
-        line=dict(color="darkgreen", width=2),
-        fillcolor=plot['color'],
-        opacity=0.7
-    )
-    
-    # Add crop label
-    fig_farm.add_annotation(
-        x=plot['x_center'],
-        y=plot['y_center'],
-        text=f"<b>{plot['crop']}</b><br>{plot['area_share']:.1f}%<br>{plot['actual_area']:.2f} ha",
-        showarrow=False,
-        font=dict(size=10, color="white"),
-        bgcolor="rgba(0,0,0,0.5)",
-        bordercolor="white",
-        borderwidth=1
-    )
+# Area allocation bar chart
+st.subheader(f"📊 {t['area_comparison']}")
 
-# Update layout
-fig_farm.update_layout(
-    title="Farm Plot Layout (Realistic View)",
-    xaxis=dict(
-        title="Farm Width",
-        showgrid=True,
-        gridcolor='lightgray',
-        zeroline=False,
-        range=[0, 12]
-    ),
-    yaxis=dict(
-        title="Farm Length",
-        showgrid=True,
-        gridcolor='lightgray', 
-        zeroline=False,
-        range=[0, 8],
-        scaleanchor="x",
-        scaleratio=1
-    ),
-    plot_bgcolor='#f0f8f0',
-    paper_bgcolor='#f0f8f0',
-    height=500,
-    showlegend=False
-)
 
-# Add farm boundary
-fig_farm.add_shape(
-    type="rect",
-    x0=0.2, y0=0.2, x1=11.8, y1=7.8,
-    line=dict(color="darkgreen", width=4),
-    fillcolor="rgba(0,0,0,0)"
-)
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_area_bar_figure(crop_shares):
+    bar_df = pd.DataFrame({"Crop": [c for c, _ in crop_shares], "Area Share %": [round(s, 1) for _, s in crop_shares]})
+    fig_bar = px.bar(
+        bar_df,
+        x="Crop",
+        y="Area Share %",
+        title="Area Share Percentage by Crop",
+        color="Area Share %",
+        color_continuous_scale="viridis"
+    )
+    fig_bar.update_layout(height=400)
+    return fig_bar
 
-st.plotly_chart(fig_farm, use_container_width=True)
 
-# Area allocation bar chart
-st.subheader(f"📊 {t['area_comparison']}")
-fig_bar = px.bar(
-    rec_df, 
-    x="Crop", 
-    y="Area Share %",
-    title="Area Share Percentage by Crop",
-    color="Area Share %",
-    color_continuous_scale="viridis"
-)
-fig_bar.update_layout(height=400)
+with span("app.plot.area_bar"):
+    fig_bar = get_area_bar_figure(crop_shares)
 st.plotly_chart(fig_bar, use_container_width=True) 
 
 with st.expander("Why these recommendations? (scoring breakdown)"):
@@ -715,29 +906,88 @@ if data.get("market") is not None:
         suggested = alt_pool.head(len(oversupplied))[["crop", "group", "base_score", "demand_index", "supply_index", "balance"]]
         st.dataframe(suggested.reset_index(drop=True), use_container_width=True)
 
+# Multi-season rotation across the region's seasons
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_rotations(base_path, region, years, top_k, soil_override_items, extra_rain_mm):
+    data = get_data(base_path)
+    return plan_rotations(
+        region,
+        data["crops"],
+        data["soil"],
+        data["climate"],
+        data["regions"],
+        data.get("market"),
+        years=years,
+        top_k=top_k,
+        soil_override=dict(soil_override_items) if soil_override_items else None,
+        extra_rain_mm=extra_rain_mm,
+        features=data["features"],
+        catalog=data["catalog"],
+    )
+
+
+st.subheader("🔄 Multi-season Rotation Plan")
+rotation_years = st.selectbox("Planning horizon (years)", options=[1, 2, 3], index=0)
+with span("app.rotation"):
+    rotations = get_rotations(
+        base_path,
+        region,
+        rotation_years,
+        5,
+        tuple(sorted(soil_override.items())) if soil_override else None,
+        extra_rain_mm,
+    )
+if rotations:
+    rotation_rows = []
+    for rank, rotation in enumerate(rotations, start=1):
+        row = {"Rank": rank}
+        for i, (season_name, crop_name) in enumerate(zip(rotation.seasons, rotation.crops)):
+            row[f"{i // len(set(rotation.seasons)) + 1}. {season_name}"] = crop_name
+        row["Score"] = round(rotation.score, 3)
+        row["Revenue (₹/ha)"] = round(rotation.expected_revenue_per_ha, 0)
+        rotation_rows.append(row)
+    st.dataframe(pd.DataFrame(rotation_rows), use_container_width=True, hide_index=True)
+    st.caption("Rotations favour legumes before cereals and avoid repeating a crop group in consecutive seasons.")
+
 # Disease warnings for recommended crops
 st.subheader(t["disease_warnings"])
-soil_row = (data["soil"].loc[data["soil"]["region"] == region].iloc[0]).copy()
-if use_override:
-    soil_row["ph"] = ph
-    soil_row["drainage"] = drainage
-    soil_row["organic_matter_pct"] = organic_matter
-climate_row = (data["climate"].loc[(data["climate"]["region"] == region) & (data["climate"]["season"] == season)].iloc[0]).copy()
-climate_row["forecast_rain_mm"] = float(climate_row["forecast_rain_mm"]) + float(extra_rain_mm)
-
-warn_rows = []
-for r in recs:
-    warns = disease_warnings_for_crop(
-        crop=r.crop,
-        region=region,
-        season=season,
-        soil_row=soil_row,
-        climate_row=climate_row,
-        irrigation=irrigation,
-        user_flags={"saved_seed": saved_seed, "flood_prone": flood_prone},
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_disease_warnings(base_path, crop_names, region, season, soil_override_items, extra_rain_mm,
+                         irrigation, saved_seed, flood_prone, climate_override_items=None):
+    data = get_data(base_path)
+    # one patched vector carries both the soil and the climate fields
+    site = as_dict(data["features"].vector(region, season, dict(soil_override_items or ()), extra_rain_mm,
+                                           dict(climate_override_items or ())))
+
+    warn_rows = []
+    for crop_name in crop_names:
+        warns = disease_warnings_for_crop(
+            crop=crop_name,
+            region=region,
+            season=season,
+            soil_row=site,
+            climate_row=site,
+            irrigation=irrigation,
+            user_flags={"saved_seed": saved_seed, "flood_prone": flood_prone},
+        )
+        for w in warns:
+            warn_rows.append({"Crop": crop_name, "Disease": w["disease"], "Risk": w["risk"], "Prevention": w["prevention"]})
+    return warn_rows
+
+
+with span("app.disease_warnings"):
+    warn_rows = get_disease_warnings(
+        base_path,
+        tuple(r.crop for r in recs),
+        region,
+        season,
+        tuple(sorted(soil_override.items())) if soil_override else None,
+        extra_rain_mm,
+        irrigation,
+        saved_seed,
+        flood_prone,
+        tuple(sorted(climate_override.items())) if climate_override else None,
     )
-    for w in warns:
-        warn_rows.append({"Crop": r.crop, "Disease": w["disease"], "Risk": w["risk"], "Prevention": w["prevention"]})
 
 if warn_rows:
     warn_df = pd.DataFrame(warn_rows)
@@ -935,3 +1185,15 @@ with st.expander(t["data_sources"], expanded=False):
     st.info("📝 **Note:** This is a hackathon MVP with sample data. For production use, integrate with real-time APIs from these government sources.")
 
 
+# Timing breakdown for this rerun and optional metrics export
+if tracer.is_active():
+    tracer.record("app.rerun", time.perf_counter() - rerun_started)
+    export_path = os.environ.get("CROP_TRACE_EXPORT")
+    if export_path:
+        tracer.export(export_path)
+    if show_timings:
+        with st.sidebar.expander("⏱️ Timing breakdown (this rerun)", expanded=True):
+            run_df = pd.DataFrame(tracer.current_run(), columns=["Stage", "Seconds"])
+            run_df = run_df.groupby("Stage", sort=False).agg(Calls=("Seconds", "size"), Total_ms=("Seconds", "sum"))
+            run_df["Total_ms"] = (run_df["Total_ms"] * 1000).round(2)
+            st.dataframe(run_df.sort_values("Total_ms", ascending=False), use_container_width=True)
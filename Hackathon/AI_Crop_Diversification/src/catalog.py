@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from features import DRAINAGE_LEVELS
+
+
+# weight of market_score in base_score: the most a market change can move one crop's score
+MARKET_WEIGHT = 0.15
+
+# drainage_fit by (crop preference, site drainage); the last row is any other preference
+_OTHER_PREF = len(DRAINAGE_LEVELS)
+DRAINAGE_FIT = np.array([
+    #  poor  moderate  well     <- site
+    [1.0, 0.6, 0.4],  # poor
+    [0.6, 1.0, 0.7],  # moderate
+    [0.4, 0.7, 1.0],  # well
+    [0.4, 0.4, 0.4],  # unknown preference
+])
+
+
+def _scale_01(value: np.ndarray, min_v, max_v) -> np.ndarray:
+    """(value - min) / (max - min) clipped to 0..1; 0 wherever the range is empty."""
+    span = np.asarray(max_v - min_v, dtype=float)
+    scaled = np.divide(value - min_v, span, out=np.zeros(np.broadcast(value, span).shape), where=span != 0)
+    return np.clip(scaled, 0.0, 1.0)
+
+
+def _pressure(demand: np.ndarray, supply: np.ndarray) -> np.ndarray:
+    """Market pressure in 0..1 from demand/supply indices; 0.5 when they balance."""
+    ratio = demand / np.maximum(supply, 1e-6)
+    return 1.0 / (1.0 + np.exp(-(ratio - 1.0) * 2.0))
+
+
+def _range_fit(value: float, low: np.ndarray, high: np.ndarray, margin: float) -> np.ndarray:
+    """1 at the centre of [low, high], falling to 0 at the edges; ramps up over `margin` below it."""
+    half = (high - low) / 2.0
+    inside = 1.0 - np.abs(value - (low + high) / 2.0) / np.where(half == 0, 1.0, half)
+    fit = np.where(half == 0, 0.0, inside)
+    fit = np.where(value < low, np.clip((value - (low - margin)) / margin, 0.0, 1.0), fit)
+    return np.where(value > high, 0.0, fit)
+
+
+class CropCatalog:
+    """Column arrays and integer encodings of a crops table, built once at load time.
+
+    `crop`, `group` and `drainage_pref` become category codes, numeric columns contiguous
+    float arrays, and the market table a per-region demand/supply pressure per crop code,
+    so scoring tens of thousands of varieties is a handful of array expressions.
+    """
+
+    def __init__(self, crops_df: pd.DataFrame, market_df: Optional[pd.DataFrame] = None):
+        self.crops = crops_df
+        self.market = market_df
+        crop = pd.Categorical(crops_df["crop"])
+        group = pd.Categorical(crops_df["group"])
+        self.crop_codes = crop.codes
+        self.crop_names = crop.categories
+        self.group_codes = group.codes
+        self.group_names = group.categories
+        pref = pd.Categorical(crops_df["drainage_pref"], categories=DRAINAGE_LEVELS).codes
+        self.drainage_pref = np.where(pref < 0, _OTHER_PREF, pref).astype(np.int8)
+
+        def column(name: str) -> np.ndarray:
+            return crops_df[name].to_numpy(dtype=np.float64)
+
+        self.ph_min, self.ph_max = column("ideal_ph_min"), column("ideal_ph_max")
+        self.water_need = column("water_need_mm")
+        self.heat_min, self.heat_max = column("heat_tolerance_c_min"), column("heat_tolerance_c_max")
+        self.price = column("price_per_ton")
+        self.base_yield = column("base_yield_t_ha")
+        self.price_min = float(self.price.min()) if len(self) else 0.0
+        self.price_max = float(self.price.max()) if len(self) else 0.0
+
+        # market pressure per crop code; crops without a market row keep 1.0
+        self.pressure_by_region: Dict[str, np.ndarray] = {}
+        # raw indices per crop code (NaN without a market row), for supply adjustments
+        self.demand_by_region: Dict[str, np.ndarray] = {}
+        self.supply_by_region: Dict[str, np.ndarray] = {}
+        if market_df is not None:
+            rows = market_df.drop_duplicates(["region", "crop"])  # first row wins, as .head(1) did
+            codes = self.crop_names.get_indexer(rows["crop"])
+            demand = rows["demand_index"].to_numpy(dtype=float)
+            supply = rows["supply_index"].to_numpy(dtype=float)
+            pressure = _pressure(demand, supply)
+            for region in rows["region"].unique():
+                mask = (rows["region"].to_numpy() == region) & (codes >= 0)
+                by_code = np.ones(len(self.crop_names))
+                by_code[codes[mask]] = pressure[mask]
+                self.pressure_by_region[region] = by_code
+                for target, values in ((self.demand_by_region, demand), (self.supply_by_region, supply)):
+                    target[region] = np.full(len(self.crop_names), np.nan)
+                    target[region][codes[mask]] = values[mask]
+
+    def __len__(self) -> int:
+        return len(self.crop_codes)
+
+    def matches(self, crops_df: pd.DataFrame, market_df: Optional[pd.DataFrame]) -> bool:
+        return self.crops is crops_df and self.market is market_df
+
+    def pressure(self, region: str, supply_factor: Optional[Mapping[str, float]] = None) -> np.ndarray:
+        """Market pressure per crop; `supply_factor` scales the supply index of the named crops."""
+        by_code = self.pressure_by_region.get(region)
+        if by_code is None:
+            return np.ones(len(self))
+        if supply_factor:
+            codes = self.crop_names.get_indexer(list(supply_factor))
+            known = (codes >= 0) & ~np.isnan(self.supply_by_region[region][np.maximum(codes, 0)])
+            codes = codes[known]
+            factors = np.fromiter(supply_factor.values(), dtype=float, count=len(supply_factor))[known]
+            by_code = by_code.copy()
+            by_code[codes] = _pressure(self.demand_by_region[region][codes],
+                                       self.supply_by_region[region][codes] * factors)
+        return by_code[self.crop_codes]
+
+    def score(self, region: str, ph: float, drainage: int, forecast_temp: float, forecast_rain: float,
+              market_index: float, supply_factor: Optional[Mapping[str, float]] = None) -> Dict[str, np.ndarray]:
+        """Component and base scores for every crop (same formulas as the per-row versions)."""
+        scores = {
+            "soil_ph_score": _range_fit(ph, self.ph_min, self.ph_max, 1.5),
+            "drainage_score": DRAINAGE_FIT[self.drainage_pref, drainage],
+        }
+        ratio = forecast_rain / np.maximum(self.water_need, 1.0)
+        scores["water_score"] = np.where(ratio >= 1, _scale_01(np.minimum(ratio, 1.5), 1.0, 1.5),
+                                         _scale_01(ratio, 0.4, 1.0))
+        scores["temp_score"] = _range_fit(forecast_temp, self.heat_min, self.heat_max, 10.0)
+        scores["market_score"] = (_scale_01(self.price * market_index, self.price_min, self.price_max)
+                                  * self.pressure(region, supply_factor))
+        scores["base_score"] = (
+            0.25 * scores["soil_ph_score"]
+            + 0.20 * scores["drainage_score"]
+            + 0.20 * scores["water_score"]
+            + 0.20 * scores["temp_score"]
+            + MARKET_WEIGHT * scores["market_score"]
+        )
+        return scores
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first (ties by position), without a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
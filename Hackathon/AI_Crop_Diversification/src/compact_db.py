@@ -0,0 +1,22 @@
+"""One-off compaction of duplicate farmer sessions and crop selections.
+
+Usage: python src/compact_db.py [--db farmer_data.db] [--vacuum]
+"""
+import argparse
+
+from database import FarmerDatabase
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove duplicate farmers/crop_selections rows")
+    parser.add_argument("--db", default="farmer_data.db", help="Path to the SQLite database")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards to reclaim space")
+    args = parser.parse_args()
+
+    db = FarmerDatabase(args.db)
+    removed = db.compact_duplicates(vacuum=args.vacuum)
+    print(f"Removed {removed['farmers']} duplicate farmers and {removed['crop_selections']} duplicate crop selections")
+
+
+if __name__ == "__main__":
+    main()
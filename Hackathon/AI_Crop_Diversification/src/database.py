@@ -1,28 +1,158 @@
 import sqlite3
 import json
 import datetime
-from typing import Dict, List, Optional, Any
+import hashlib
+import itertools
+from typing import Dict, Iterable, List, Mapping, Optional, Any, Sequence, Tuple
 import pandas as pd
 
+from payloads import LazyPayload, decode_payload, encode_payload, payload_meta
+from market_stats import EWMA_SPANS, LONG_SPAN, STATS_COLUMNS, MarketStats
+from price_cache import PriceCache, to_day, utc_today
+
+# Farmer columns that make up a farmer's identity for session upserts and compaction
+FARMER_FIELDS = ('name', 'region', 'district', 'farm_area', 'plot_length', 'plot_width',
+                 'soil_texture', 'soil_moisture', 'soil_compaction')
+SELECTION_FIELDS = ('crop_name', 'area_percentage', 'expected_yield', 'expected_revenue',
+                    'growth_duration', 'season')
+# stored columns: region/district/crop names live in dimension tables, rows hold their integer ids
+FARMER_COLUMNS = ('name', 'district_id') + FARMER_FIELDS[3:]
+SELECTION_COLUMNS = ('crop_id',) + SELECTION_FIELDS[1:]
+# rows returned by get_farmer_data keep the column order of the original name-based tables
+FARMER_ROW = ('id',) + FARMER_FIELDS + ('created_at', 'updated_at', 'session_key', 'selection_hash')
+SELECTION_ROW = ('id', 'farmer_id') + SELECTION_FIELDS + ('selected_at',)
+# tables that stored names before the dimension tables existed, migrated on first open
+NORMALIZED_TABLES = ('farmers', 'crop_selections', 'market_prices', 'market_stats',
+                     'market_prices_daily', 'market_prices_weekly')
+# a farmer's contribution to district_crop_summary, added with sign 1 and removed with sign -1
+SUMMARY_DELTA = '''
+    INSERT INTO district_crop_summary (district_id, season, crop_id, farmers, planned_area_ha, expected_revenue)
+    SELECT f.district_id, COALESCE(s.season, ''), s.crop_id, ? * COUNT(DISTINCT s.farmer_id),
+           ? * TOTAL(f.farm_area * s.area_percentage / 100.0),
+           ? * TOTAL(f.farm_area * s.area_percentage / 100.0 * s.expected_revenue)
+    FROM crop_selections s JOIN farmers f ON f.id = s.farmer_id
+    WHERE {where} AND f.district_id IS NOT NULL AND s.crop_id IS NOT NULL
+    GROUP BY f.district_id, COALESCE(s.season, ''), s.crop_id
+    ON CONFLICT (district_id, season, crop_id) DO UPDATE SET
+        farmers = farmers + excluded.farmers,
+        planned_area_ha = planned_area_ha + excluded.planned_area_ha,
+        expected_revenue = expected_revenue + excluded.expected_revenue
+'''
+# the same contribution to the per-(region, crop) planted area read by supply.SupplyEstimator
+REGION_AREA_DELTA = '''
+    INSERT INTO region_crop_area (region_id, crop_id, planted_area_ha)
+    SELECT d.region_id, s.crop_id, ? * TOTAL(f.farm_area * s.area_percentage / 100.0)
+    FROM crop_selections s JOIN farmers f ON f.id = s.farmer_id JOIN districts d ON d.id = f.district_id
+    WHERE {where} AND s.crop_id IS NOT NULL
+    GROUP BY d.region_id, s.crop_id
+    ON CONFLICT (region_id, crop_id) DO UPDATE SET
+        planted_area_ha = planted_area_ha + excluded.planted_area_ha
+'''
+# one farmer's summary keys; after a removal only these rows can have emptied
+SUMMARY_KEYS = '''
+    SELECT DISTINCT f.district_id, COALESCE(s.season, ''), s.crop_id, d.region_id
+    FROM crop_selections s JOIN farmers f ON f.id = s.farmer_id JOIN districts d ON d.id = f.district_id
+    WHERE s.farmer_id = ? AND s.crop_id IS NOT NULL
+'''
+# read-side views that resolve the ids back to names
+NAMED_VIEWS = {
+    'farmers_named': '''
+        SELECT f.id, f.name, r.name AS region, d.name AS district, f.farm_area, f.plot_length, f.plot_width,
+               f.soil_texture, f.soil_moisture, f.soil_compaction, f.created_at, f.updated_at,
+               f.session_key, f.selection_hash, f.district_id, d.region_id
+        FROM farmers f
+        JOIN districts d ON d.id = f.district_id
+        JOIN regions r ON r.id = d.region_id
+    ''',
+    'crop_selections_named': '''
+        SELECT s.id, s.farmer_id, c.name AS crop_name, s.area_percentage, s.expected_yield, s.expected_revenue,
+               s.growth_duration, s.season, s.selected_at, s.crop_id
+        FROM crop_selections s
+        JOIN crops c ON c.id = s.crop_id
+    ''',
+    'market_prices_named': '''
+        SELECT m.id, r.name AS region, d.name AS district, c.name AS crop_name, m.price_per_ton, m.price_date,
+               m.source, m.created_at, m.district_id, d.region_id, m.crop_id
+        FROM market_prices m
+        JOIN districts d ON d.id = m.district_id
+        JOIN regions r ON r.id = d.region_id
+        JOIN crops c ON c.id = m.crop_id
+    ''',
+}
+# payload column -> JSON projection column queried through generated columns
+PAYLOAD_COLUMNS = {'farming_plans': ('plan_data', 'plan_meta'), 'farm_layouts': ('layout_data', 'layout_meta')}
+# inputs a recommendation run was computed for (see reuse.py)
+RUN_PROFILE_FIELDS = ('region', 'season', 'drainage', 'max_crops', 'ph', 'organic_matter_pct',
+                      'forecast_temp_c', 'forecast_rain_mm', 'irrigation_mm', 'farm_area')
+
+
+def selection_hash(selections: List[Dict[str, Any]]) -> str:
+    """Order-independent content hash of a crop selection set"""
+    canonical = sorted(
+        json.dumps([round(v, 6) if isinstance(v, float) else v for v in (s.get(f) for f in SELECTION_FIELDS)],
+                   default=str)
+        for s in selections
+    )
+    return hashlib.sha256('\n'.join(canonical).encode('utf-8')).hexdigest()
+
 class FarmerDatabase:
     """Database class for storing farmer data and market tracking information"""
     
-    def __init__(self, db_path: str = "farmer_data.db"):
+    def __init__(self, db_path: str = "farmer_data.db", price_cache_days: Optional[int] = 365):
         self.db_path = db_path
+        # (dimension table, region id, name) -> id; ids never change once assigned
+        self._dimension_ids: Dict[tuple, int] = {}
+        # district summary query results, valid while the summary generation is unchanged
+        self._summary_cache: Dict[tuple, tuple] = {}
         self.init_database()
+        # hot market queries are served from memory; None disables the cache
+        self.price_cache: Optional[PriceCache] = None
+        # (district_id, crop_id) -> statistics, kept current by add_market_price
+        self.market_stats: Optional[Dict[tuple, MarketStats]] = None
+        if price_cache_days:
+            self.price_cache = PriceCache(loaded_since=utc_today() - price_cache_days)
+            self.load_price_cache()
+            self.load_market_stats()
     
     def init_database(self):
         """Initialize the database with required tables"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        # only takes effect on a new database; retention converts older ones
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # readers (analytics snapshots included) never block the app's writes; persists in the file
+        cursor.execute('PRAGMA journal_mode = WAL')
+        legacy = self._set_aside_legacy_tables(cursor)
         
-        # Create farmers table
+        # Dimension tables: every region, district and crop name is stored once
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS regions (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS districts (
+                id INTEGER PRIMARY KEY,
+                region_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                UNIQUE (region_id, name),
+                FOREIGN KEY (region_id) REFERENCES regions (id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS crops (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        
+        # Create farmers table (the district implies the region)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS farmers (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
-                region TEXT NOT NULL,
-                district TEXT NOT NULL,
+                district_id INTEGER NOT NULL,
                 farm_area REAL NOT NULL,
                 plot_length REAL NOT NULL,
                 plot_width REAL NOT NULL,
@@ -30,7 +160,8 @@ class FarmerDatabase:
                 soil_moisture TEXT,
                 soil_compaction TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (district_id) REFERENCES districts (id)
             )
         ''')
         
@@ -39,14 +170,15 @@ class FarmerDatabase:
             CREATE TABLE IF NOT EXISTS crop_selections (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 farmer_id INTEGER,
-                crop_name TEXT NOT NULL,
+                crop_id INTEGER NOT NULL,
                 area_percentage REAL NOT NULL,
                 expected_yield REAL,
                 expected_revenue REAL,
                 growth_duration INTEGER,
                 season TEXT,
                 selected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (farmer_id) REFERENCES farmers (id)
+                FOREIGN KEY (farmer_id) REFERENCES farmers (id),
+                FOREIGN KEY (crop_id) REFERENCES crops (id)
             )
         ''')
         
@@ -54,13 +186,14 @@ class FarmerDatabase:
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS market_prices (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                region TEXT NOT NULL,
-                district TEXT NOT NULL,
-                crop_name TEXT NOT NULL,
+                district_id INTEGER NOT NULL,
+                crop_id INTEGER NOT NULL,
                 price_per_ton REAL NOT NULL,
                 price_date DATE NOT NULL,
                 source TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (district_id) REFERENCES districts (id),
+                FOREIGN KEY (crop_id) REFERENCES crops (id)
             )
         ''')
         
@@ -91,29 +224,319 @@ class FarmerDatabase:
             )
         ''')
         
+        # Session identity for idempotent upserts (added after the initial schema)
+        self._ensure_column(cursor, 'farmers', 'session_key', 'TEXT')
+        self._ensure_column(cursor, 'farmers', 'selection_hash', 'TEXT')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_farmers_session_key
+            ON farmers (session_key) WHERE session_key IS NOT NULL
+        ''')
+        # covers the per-farmer summary delta without touching the table rows
+        cursor.execute('DROP INDEX IF EXISTS idx_crop_selections_farmer')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_crop_selections_summary
+            ON crop_selections (farmer_id, crop_id, season, area_percentage, expected_revenue)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_crop_selections_crop ON crop_selections (crop_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_farmers_district ON farmers (district_id)')
+        
+        # Plan/layout payloads: small JSON projections with indexed JSON1 generated columns
+        for table, (payload, meta) in PAYLOAD_COLUMNS.items():
+            self._ensure_column(cursor, table, meta, 'TEXT')
+            self._ensure_column(cursor, table, 'primary_crop',
+                                f"TEXT GENERATED ALWAYS AS (json_extract({meta}, '$.primary_crop')) VIRTUAL")
+            self._ensure_column(cursor, table, 'primary_share',
+                                f"REAL GENERATED ALWAYS AS (json_extract({meta}, '$.primary_share')) VIRTUAL")
+            self._ensure_column(cursor, table, 'crop_count',
+                                f"INTEGER GENERATED ALWAYS AS (json_extract({meta}, '$.crop_count')) VIRTUAL")
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_primary_crop ON {table} (primary_crop, primary_share)')
+            self._migrate_payloads(cursor, table, payload, meta)
+        # Series lookups use the key prefix; bulk imports dedup on the whole key
+        cursor.execute('DROP INDEX IF EXISTS idx_market_prices_series')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_market_prices_key
+            ON market_prices (district_id, crop_id, price_date, source)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_market_prices_crop ON market_prices (crop_id, price_date)')
+        
+        # Online per-series price statistics, one row per (district, crop)
+        ewma_columns = ''.join(f'ewma_{span} REAL, ' for span in EWMA_SPANS)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS market_stats (
+                district_id INTEGER NOT NULL,
+                crop_id INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                last_price REAL,
+                last_day INTEGER,
+                {ewma_columns}
+                ret_mean REAL,
+                ret_var REAL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (district_id, crop_id)
+            ) WITHOUT ROWID
+        ''')
+        # Downsampled history written by retention.py once raw quotes age out
+        for table, period in (('market_prices_daily', 'price_date'), ('market_prices_weekly', 'week_start')):
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    district_id INTEGER NOT NULL,
+                    crop_id INTEGER NOT NULL,
+                    {period} DATE NOT NULL,
+                    quotes INTEGER NOT NULL,
+                    price_sum REAL NOT NULL,
+                    price_min REAL NOT NULL,
+                    price_max REAL NOT NULL,
+                    PRIMARY KEY (district_id, crop_id, {period})
+                ) WITHOUT ROWID
+            ''')
+        
+        # Computed recommendations, reused for farmers with near-identical profiles
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS recommendation_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                region TEXT NOT NULL,
+                season TEXT NOT NULL,
+                drainage TEXT NOT NULL,
+                max_crops INTEGER NOT NULL,
+                ph REAL NOT NULL,
+                organic_matter_pct REAL NOT NULL,
+                forecast_temp_c REAL NOT NULL,
+                forecast_rain_mm REAL NOT NULL,
+                irrigation_mm REAL NOT NULL DEFAULT 0,
+                farm_area REAL,
+                data_version TEXT NOT NULL,
+                recommendations TEXT, -- JSON data
+                farmer_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (farmer_id) REFERENCES farmers (id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_recommendation_runs_version
+            ON recommendation_runs (data_version, created_at)
+        ''')
+        # supply.SupplyEstimator factors the run was scored with, as JSON [[crop, factor], ...]
+        self._ensure_column(cursor, 'recommendation_runs', 'supply_factors', 'TEXT')
+        # Market inputs each run depends on: a change to one of these keys makes the run stale
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS run_dependencies (
+                region_id INTEGER NOT NULL,
+                crop_id INTEGER NOT NULL,
+                season TEXT NOT NULL,
+                run_id INTEGER NOT NULL,
+                PRIMARY KEY (region_id, crop_id, season, run_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_run_dependencies_run ON run_dependencies (run_id)')
+        
+        cursor.execute('''
+            SELECT COUNT(*) FROM sqlite_master WHERE name IN ('district_crop_summary', 'region_crop_area')
+        ''')
+        summary_missing = cursor.fetchone()[0] < 2
+        # Planned area and revenue per (district, season, crop), kept current on every selection write
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS district_crop_summary (
+                district_id INTEGER NOT NULL,
+                season TEXT NOT NULL, -- '' when not recorded
+                crop_id INTEGER NOT NULL,
+                farmers INTEGER NOT NULL,
+                planned_area_ha REAL NOT NULL,
+                expected_revenue REAL NOT NULL,
+                PRIMARY KEY (district_id, season, crop_id)
+            ) WITHOUT ROWID
+        ''')
+        # Planned area per (region, crop) over all seasons, the supply feedback counters
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS region_crop_area (
+                region_id INTEGER NOT NULL,
+                crop_id INTEGER NOT NULL,
+                planted_area_ha REAL NOT NULL,
+                PRIMARY KEY (region_id, crop_id)
+            ) WITHOUT ROWID
+        ''')
+        # bumped with every summary change; cached summary reads are keyed on it
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS summary_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL
+            )
+        ''')
+        
+        for table in legacy:
+            self._migrate_legacy_table(cursor, table)
+        cursor.execute('INSERT OR IGNORE INTO summary_generation VALUES (1, 0)')
+        if summary_missing:
+            # databases created before the summary tables existed: backfill once
+            self._rebuild_district_summary(cursor)
+        for view, select in NAMED_VIEWS.items():
+            cursor.execute(f'CREATE VIEW IF NOT EXISTS {view} AS {select}')
+        
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM market_stats)')
+        if not cursor.fetchone()[0]:
+            # databases created before market_stats existed: backfill once from history
+            self._rebuild_market_stats(cursor)
+        
         conn.commit()
         conn.close()
     
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, declaration: str):
+        """Add a column to an existing table if it is missing"""
+        cursor.execute(f'PRAGMA table_xinfo({table})')  # xinfo also lists generated columns
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    
+    @staticmethod
+    def _set_aside_legacy_tables(cursor) -> List[str]:
+        """Rename tables that still store region/district/crop names so the normalized ones can be created"""
+        legacy = []
+        for table in NORMALIZED_TABLES:
+            cursor.execute(f'PRAGMA table_info({table})')
+            if not {'region', 'crop_name'} & {row[1] for row in cursor.fetchall()}:
+                continue
+            for view in NAMED_VIEWS:
+                cursor.execute(f'DROP VIEW IF EXISTS {view}')
+            indexes = cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+            ).fetchall()
+            for (index,) in indexes:
+                cursor.execute(f'DROP INDEX {index}')
+            # keep other tables' foreign keys pointing at the name, not at the renamed table
+            cursor.execute('PRAGMA legacy_alter_table = ON')
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+            cursor.execute('PRAGMA legacy_alter_table = OFF')
+            legacy.append(table)
+        return legacy
+    
+    @staticmethod
+    def _intern_names(cursor, source: str):
+        """Add the region/district/crop names found in `source` to the dimension tables, in SQL"""
+        cursor.execute(f'PRAGMA table_info({source})')
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'region' in columns:
+            cursor.execute(f'INSERT OR IGNORE INTO regions (name) SELECT DISTINCT region FROM {source}')
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO districts (region_id, name)
+                SELECT DISTINCT r.id, s.district FROM {source} s JOIN regions r ON r.name = s.region
+            ''')
+        if 'crop_name' in columns:
+            cursor.execute(f'INSERT OR IGNORE INTO crops (name) SELECT DISTINCT crop_name FROM {source}')
+    
+    def _migrate_legacy_table(self, cursor, table: str):
+        """Copy a set-aside name-based table into its normalized replacement (ids preserved) and drop it"""
+        source = f'{table}_legacy'
+        self._intern_names(cursor, source)
+        cursor.execute(f'PRAGMA table_info({source})')
+        old_columns = {row[1] for row in cursor.fetchall()}
+        cursor.execute(f'PRAGMA table_info({table})')
+        columns, values = [], []
+        for column in (row[1] for row in cursor.fetchall()):
+            if column in ('district_id', 'crop_id') or column in old_columns:
+                columns.append(column)
+                values.append({'district_id': 'd.id', 'crop_id': 'c.id'}.get(column, f's.{column}'))
+        joins = ''
+        if 'district_id' in columns:
+            joins += ' JOIN regions r ON r.name = s.region JOIN districts d ON d.region_id = r.id AND d.name = s.district'
+        if 'crop_id' in columns:
+            joins += ' JOIN crops c ON c.name = s.crop_name'
+        cursor.execute(f'INSERT INTO {table} ({", ".join(columns)}) SELECT {", ".join(values)} FROM {source} s{joins}')
+        cursor.execute(f'DROP TABLE {source}')
+    
+    def _dimension_id(self, table: str, name: Optional[str], region_id: Optional[int] = None,
+                      create: bool = True) -> Optional[int]:
+        """Id of a name in a dimension table, interned on first use; None if unknown and not created"""
+        key = (table, region_id, name)
+        dim_id = self._dimension_ids.get(key)
+        if dim_id is not None or name is None:
+            return dim_id
+        scope, params = ('region_id = ? AND name = ?', (region_id, name)) if table == 'districts' else ('name = ?', (name,))
+        # own short transaction, so an id is only cached once it is committed
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            if create:
+                columns = 'region_id, name' if table == 'districts' else 'name'
+                conn.execute(f'INSERT OR IGNORE INTO {table} ({columns}) VALUES ({", ".join("?" * len(params))})', params)
+            row = conn.execute(f'SELECT id FROM {table} WHERE {scope}', params).fetchone()
+        conn.close()
+        if row is not None:
+            self._dimension_ids[key] = dim_id = row[0]
+        return dim_id
+    
+    def _region_id(self, region: Optional[str], create: bool = True) -> Optional[int]:
+        return self._dimension_id('regions', region, create=create)
+    
+    def _district_id(self, region: Optional[str], district: Optional[str], create: bool = True) -> Optional[int]:
+        region_id = self._region_id(region, create)
+        return None if region_id is None else self._dimension_id('districts', district, region_id, create)
+    
+    def _crop_id(self, crop_name: Optional[str], create: bool = True) -> Optional[int]:
+        return self._dimension_id('crops', crop_name, create=create)
+    
+    def _farmer_values(self, farmer_data: Dict[str, Any]) -> tuple:
+        """farmer_data as a FARMER_COLUMNS row"""
+        district_id = self._district_id(farmer_data.get('region'), farmer_data.get('district'))
+        return (farmer_data.get('name', 'Unknown'), district_id) + tuple(farmer_data.get(f) for f in FARMER_FIELDS[3:])
+    
+    @staticmethod
+    def _migrate_payloads(cursor, table: str, payload: str, meta: str):
+        """Re-encode rows written before payload compaction and fill in their projection"""
+        rows = cursor.execute(f'SELECT id, {payload} FROM {table} WHERE {meta} IS NULL').fetchall()
+        cursor.executemany(
+            f'UPDATE {table} SET {payload} = ?, {meta} = ? WHERE id = ?',
+            [(encode_payload(value), payload_meta(value) or '{}', row_id)
+             for row_id, value in ((row_id, decode_payload(raw)) for row_id, raw in rows)]
+        )
+    
+    @staticmethod
+    def _lazy_rows(cursor) -> List[Dict[str, Any]]:
+        """Fetch rows as dicts with payload columns wrapped for decoding on first access"""
+        columns = [d[0] for d in cursor.description]
+        lazy = {payload for payload, _ in PAYLOAD_COLUMNS.values()}
+        return [
+            {c: LazyPayload(v) if c in lazy else v for c, v in zip(columns, row)}
+            for row in cursor.fetchall()
+        ]
+    
+    @staticmethod
+    def _decoded_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """_lazy_rows output with every payload decoded to plain JSON values"""
+        return [{c: v.value if isinstance(v, LazyPayload) else v for c, v in row.items()} for row in rows]
+    
+    @staticmethod
+    def _summary_delta(cursor, farmer_id: int, sign: int):
+        """Add (sign=1) or remove (sign=-1) one farmer's selections in district_crop_summary"""
+        cursor.execute(SUMMARY_DELTA.format(where='s.farmer_id = ?'), (sign, sign, sign, farmer_id))
+        cursor.execute(REGION_AREA_DELTA.format(where='s.farmer_id = ?'), (sign, farmer_id))
+        if sign < 0:
+            # drop the rows just emptied, probing each of the farmer's keys by primary key
+            keys = cursor.execute(SUMMARY_KEYS, (farmer_id,)).fetchall()
+            cursor.executemany('''
+                DELETE FROM district_crop_summary
+                WHERE district_id = ? AND season = ? AND crop_id = ? AND farmers <= 0
+            ''', [key[:3] for key in keys])
+            # only rounding error is left once every selection of a crop is gone
+            cursor.executemany('DELETE FROM region_crop_area WHERE region_id = ? AND crop_id = ? AND planted_area_ha < 1e-9',
+                               {(key[3], key[2]) for key in keys})
+        cursor.execute('UPDATE summary_generation SET generation = generation + 1')
+    
+    @staticmethod
+    def _rebuild_district_summary(cursor):
+        cursor.execute('DELETE FROM district_crop_summary')
+        cursor.execute('DELETE FROM region_crop_area')
+        cursor.execute(SUMMARY_DELTA.format(where='1'), (1, 1, 1))
+        cursor.execute(REGION_AREA_DELTA.format(where='1'), (1,))
+        cursor.execute('UPDATE summary_generation SET generation = generation + 1')
+    
     def add_farmer(self, farmer_data: Dict[str, Any]) -> int:
         """Add a new farmer to the database"""
+        values = self._farmer_values(farmer_data)
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO farmers (name, region, district, farm_area, plot_length, plot_width, 
-                               soil_texture, soil_moisture, soil_compaction)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            farmer_data.get('name', 'Unknown'),
-            farmer_data.get('region'),
-            farmer_data.get('district'),
-            farmer_data.get('farm_area'),
-            farmer_data.get('plot_length'),
-            farmer_data.get('plot_width'),
-            farmer_data.get('soil_texture'),
-            farmer_data.get('soil_moisture'),
-            farmer_data.get('soil_compaction')
-        ))
+        cursor.execute(f'''
+            INSERT INTO farmers ({", ".join(FARMER_COLUMNS)})
+            VALUES ({", ".join("?" * len(FARMER_COLUMNS))})
+        ''', values)
         
         farmer_id = cursor.lastrowid
         conn.commit()
@@ -122,61 +545,379 @@ class FarmerDatabase:
     
     def add_crop_selection(self, farmer_id: int, crop_data: Dict[str, Any]):
         """Add crop selection for a farmer"""
+        crop_id = self._crop_id(crop_data.get('crop_name'))
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        self._summary_delta(cursor, farmer_id, -1)
         cursor.execute('''
-            INSERT INTO crop_selections (farmer_id, crop_name, area_percentage, expected_yield, 
+            INSERT INTO crop_selections (farmer_id, crop_id, area_percentage, expected_yield, 
                                        expected_revenue, growth_duration, season)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', (
             farmer_id,
-            crop_data.get('crop_name'),
+            crop_id,
             crop_data.get('area_percentage'),
             crop_data.get('expected_yield'),
             crop_data.get('expected_revenue'),
             crop_data.get('growth_duration'),
             crop_data.get('season')
         ))
+        self._summary_delta(cursor, farmer_id, 1)
         
         conn.commit()
         conn.close()
     
+    def upsert_farmer_session(self, session_key: str, farmer_data: Dict[str, Any]) -> int:
+        """Return the farmer id for a session, inserting or updating only when the data changed"""
+        values = tuple(farmer_data.get(f, 'Unknown' if f == 'name' else None) for f in FARMER_FIELDS)
+        stored = self._farmer_values(farmer_data)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'SELECT id, {", ".join(FARMER_FIELDS)} FROM farmers_named WHERE session_key = ?', (session_key,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(f'''
+                INSERT INTO farmers ({", ".join(FARMER_COLUMNS)}, session_key)
+                VALUES ({", ".join("?" * len(FARMER_COLUMNS))}, ?)
+            ''', stored + (session_key,))
+            farmer_id = cursor.lastrowid
+            conn.commit()
+        else:
+            farmer_id = row[0]
+            if tuple(row[1:]) != values:
+                # district and farm area feed the summary
+                self._summary_delta(cursor, farmer_id, -1)
+                cursor.execute(f'''
+                    UPDATE farmers SET {", ".join(f"{f} = ?" for f in FARMER_COLUMNS)},
+                                       updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', stored + (farmer_id,))
+                self._summary_delta(cursor, farmer_id, 1)
+                conn.commit()
+        
+        conn.close()
+        return farmer_id
+    
+    def save_crop_selections(self, farmer_id: int, selections: List[Dict[str, Any]]) -> bool:
+        """Replace a farmer's crop selections unless the set is unchanged; returns True if anything was written"""
+        content_hash = selection_hash(selections)
+        rows = [(farmer_id, self._crop_id(s.get('crop_name'))) + tuple(s.get(f) for f in SELECTION_FIELDS[1:])
+                for s in selections]
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT selection_hash FROM farmers WHERE id = ?', (farmer_id,))
+        row = cursor.fetchone()
+        if row is not None and row[0] == content_hash:
+            conn.close()
+            return False
+        
+        with conn:
+            self._summary_delta(cursor, farmer_id, -1)
+            cursor.execute('DELETE FROM crop_selections WHERE farmer_id = ?', (farmer_id,))
+            cursor.executemany(f'''
+                INSERT INTO crop_selections (farmer_id, {", ".join(SELECTION_COLUMNS)})
+                VALUES (?, {", ".join("?" * len(SELECTION_COLUMNS))})
+            ''', rows)
+            self._summary_delta(cursor, farmer_id, 1)
+            cursor.execute('UPDATE farmers SET selection_hash = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                           (content_hash, farmer_id))
+        conn.close()
+        return True
+    
+    def compact_duplicates(self, vacuum: bool = False) -> Dict[str, int]:
+        """Remove duplicate farmer rows (same farmer fields and same selection set) and duplicate selections.
+        
+        The oldest farmer row of each duplicate group is kept and plans/layouts of removed rows are
+        moved to it. Rows that carry a session key are never removed. Returns rows removed per table.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # exact duplicate selections within one farmer
+        cursor.execute(f'''
+            DELETE FROM crop_selections WHERE id NOT IN (
+                SELECT MIN(id) FROM crop_selections
+                GROUP BY farmer_id, {", ".join(SELECTION_COLUMNS)}
+            )
+        ''')
+        selections_removed = cursor.rowcount
+        
+        # farmers whose fields and selection set match an older row
+        selections: Dict[int, List[Dict[str, Any]]] = {}
+        for row in cursor.execute(f'SELECT farmer_id, {", ".join(SELECTION_FIELDS)} FROM crop_selections_named'):
+            selections.setdefault(row[0], []).append(dict(zip(SELECTION_FIELDS, row[1:])))
+        
+        survivors: Dict[Any, int] = {}
+        remap: List[tuple] = []
+        for row in cursor.execute(f'SELECT id, session_key, {", ".join(FARMER_FIELDS)} FROM farmers_named ORDER BY id').fetchall():
+            farmer_id, session_key = row[0], row[1]
+            signature = (row[2:], selection_hash(selections.get(farmer_id, [])))
+            keep_id = survivors.setdefault(signature, farmer_id)
+            if keep_id != farmer_id and session_key is None:
+                remap.append((keep_id, farmer_id))
+        
+        with conn:
+            for table in ('farming_plans', 'farm_layouts'):
+                cursor.executemany(f'UPDATE {table} SET farmer_id = ? WHERE farmer_id = ?', remap)
+            cursor.executemany('DELETE FROM crop_selections WHERE farmer_id = ?', [(old,) for _, old in remap])
+            selections_removed += sum(len(selections.get(old, [])) for _, old in remap)
+            cursor.executemany('DELETE FROM farmers WHERE id = ?', [(old,) for _, old in remap])
+            self._rebuild_district_summary(cursor)
+        
+        if vacuum:
+            conn.execute('VACUUM')
+        conn.close()
+        return {'farmers': len(remap), 'crop_selections': selections_removed}
+    
     def add_market_price(self, region: str, district: str, crop_name: str, 
-                        price_per_ton: float, source: str = "Manual Entry"):
-        """Add market price data"""
+                        price_per_ton: float, source: str = "Manual Entry",
+                        price_date: Optional[datetime.date] = None):
+        """Add market price data (dated today unless price_date is given)"""
+        key = (self._district_id(region, district), self._crop_id(crop_name))
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        price_date = price_date or datetime.date.today()
+        cursor.execute('''
+            INSERT INTO market_prices (district_id, crop_id, price_per_ton, price_date, source)
+            VALUES (?, ?, ?, ?, ?)
+        ''', key + (price_per_ton, price_date, source))
+        
+        stats = self._update_market_stats(cursor, key, price_per_ton, price_date)
+        
+        conn.commit()
+        conn.close()
+        # write-through: the caches only see rows SQLite has committed
+        if self.price_cache is not None:
+            self.price_cache.add(region, district, crop_name, price_per_ton, price_date, source)
+        if self.market_stats is not None:
+            self.market_stats[key] = stats
+    
+    def bulk_add_market_prices(self, rows) -> Tuple[int, Dict[tuple, int]]:
+        """Insert many (region, district, crop_name, price_per_ton, price_date, source) rows in one transaction.
+        
+        Rows whose (region, district, crop_name, price_date, source) already exists, in the table
+        or earlier in the batch, are skipped. Returns the number of rows inserted and, per
+        (district_id, crop_id) series that gained rows, the id of its first new row. Market
+        statistics and the price cache are not touched; pass the series to
+        update_market_stats once after a bulk load.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM market_prices').fetchone()[0]
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS price_staging (
+                region TEXT, district TEXT, crop_name TEXT,
+                price_per_ton REAL, price_date DATE, source TEXT
+            )
+        ''')
+        cursor.execute('DELETE FROM price_staging')
+        cursor.executemany('INSERT INTO price_staging VALUES (?, ?, ?, ?, ?, ?)', rows)
+        # names are resolved once per distinct series, not per row
+        self._intern_names(cursor, 'price_staging')
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staging_keys (
+                region TEXT, district TEXT, crop_name TEXT, district_id INTEGER, crop_id INTEGER,
+                PRIMARY KEY (region, district, crop_name)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('DELETE FROM staging_keys')
+        cursor.execute('''
+            INSERT INTO staging_keys
+            SELECT k.region, k.district, k.crop_name, d.id, c.id
+            FROM (SELECT DISTINCT region, district, crop_name FROM price_staging) k
+            JOIN regions r ON r.name = k.region
+            JOIN districts d ON d.region_id = r.id AND d.name = k.district
+            JOIN crops c ON c.name = k.crop_name
+        ''')
+        # the staging table is unindexed; the dedup probe uses idx_market_prices_key
         cursor.execute('''
-            INSERT INTO market_prices (region, district, crop_name, price_per_ton, price_date, source)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (region, district, crop_name, price_per_ton, datetime.date.today(), source))
+            INSERT INTO market_prices (district_id, crop_id, price_per_ton, price_date, source)
+            SELECT k.district_id, k.crop_id, s.price_per_ton, s.price_date, s.source
+            FROM price_staging s
+            JOIN staging_keys k ON k.region = s.region AND k.district = s.district AND k.crop_name = s.crop_name
+            WHERE s.rowid IN (
+                SELECT MIN(rowid) FROM price_staging
+                GROUP BY region, district, crop_name, price_date, source
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM market_prices m
+                WHERE m.district_id = k.district_id AND m.crop_id = k.crop_id
+                  AND m.price_date = s.price_date AND m.source IS s.source
+            )
+            ORDER BY s.price_date
+        ''')
+        inserted = cursor.rowcount
+        # ids only grow (AUTOINCREMENT), so the new rows are a rowid range
+        touched = {(district_id, crop_id): first_id for district_id, crop_id, first_id in cursor.execute('''
+            SELECT district_id, crop_id, MIN(id) FROM market_prices WHERE id > ? GROUP BY district_id, crop_id
+        ''', (last_id,))}
+        cursor.execute('DELETE FROM price_staging')
+        cursor.execute('DELETE FROM staging_keys')
+        conn.commit()
+        conn.close()
+        return inserted, touched
+    
+    @staticmethod
+    def _save_market_stats(cursor, key, stats: MarketStats):
+        columns = ', '.join(STATS_COLUMNS)
+        placeholders = ', '.join('?' * (2 + len(STATS_COLUMNS)))
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO market_stats (district_id, crop_id, {columns})
+            VALUES ({placeholders})
+        ''', tuple(key) + stats.to_row())
+    
+    @staticmethod
+    def _load_market_stats(cursor, key) -> Optional[MarketStats]:
+        cursor.execute(f'''
+            SELECT {', '.join(STATS_COLUMNS)} FROM market_stats
+            WHERE district_id = ? AND crop_id = ?
+        ''', tuple(key))
+        row = cursor.fetchone()
+        return MarketStats.from_row(row) if row else None
+    
+    def _update_market_stats(self, cursor, key: tuple, price_per_ton: float, price_date) -> MarketStats:
+        """Fold one new quote into the (district_id, crop_id) series statistics (O(1), inside the caller's transaction)"""
+        stats = self._load_market_stats(cursor, key) or MarketStats()
+        stats.update(price_per_ton, price_date)
+        self._save_market_stats(cursor, key, stats)
+        return stats
+    
+    def _rebuild_market_stats(self, cursor) -> int:
+        cursor.execute('DELETE FROM market_stats')
+        series: Dict[tuple, MarketStats] = {}
+        rows = cursor.connection.execute('''
+            SELECT district_id, crop_id, price_per_ton, price_date
+            FROM market_prices ORDER BY price_date, id
+        ''')
+        for district_id, crop_id, price, price_date in rows:
+            series.setdefault((district_id, crop_id), MarketStats()).update(price, price_date)
+        for key, stats in series.items():
+            self._save_market_stats(cursor, key, stats)
+        return len(series)
+    
+    def update_market_stats(self, first_ids: Mapping[tuple, int]) -> Dict[str, int]:
+        """Fold rows added by bulk_add_market_prices into market_stats.
         
+        `first_ids` maps (district_id, crop_id) to the id of the series' first new row. A series
+        whose new quotes are all dated on or after its last stored quote is updated from the
+        new rows alone; a back-filled series is replayed from its full history. Returns the
+        number of series of each kind.
+        """
+        counts = {'folded': 0, 'replayed': 0}
+        if not first_ids:
+            return counts
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        updated: Dict[tuple, MarketStats] = {}
+        # unary + keeps the planner on the rowid range of the new rows instead of a full index scan
+        new_rows = conn.execute('''
+            SELECT district_id, crop_id, id, price_per_ton, price_date FROM market_prices
+            WHERE id >= ? ORDER BY +district_id, +crop_id, price_date, id
+        ''', (min(first_ids.values()),))
+        for key, rows in itertools.groupby(new_rows, key=lambda row: row[:2]):
+            if key not in first_ids:
+                continue
+            rows = [row for row in rows if row[2] >= first_ids[key]]
+            stats = self._load_market_stats(cursor, key)
+            if stats is None or stats.last_day is None or to_day(rows[0][4]) >= stats.last_day:
+                # the new quotes all sort after the stored ones, as they would in a replay
+                stats = stats or MarketStats()
+                for _, _, _, price, price_date in rows:
+                    stats.update(price, price_date)
+                counts['folded'] += 1
+            else:
+                stats = MarketStats()
+                for price, price_date in conn.execute('''
+                    SELECT price_per_ton, price_date FROM market_prices INDEXED BY idx_market_prices_key
+                    WHERE district_id = ? AND crop_id = ? ORDER BY price_date, id
+                ''', key):
+                    stats.update(price, price_date)
+                counts['replayed'] += 1
+            updated[key] = stats
+        for key, stats in updated.items():
+            self._save_market_stats(cursor, key, stats)
+        conn.commit()
+        conn.close()
+        if self.market_stats is not None:
+            self.market_stats.update(updated)
+        return counts
+    
+    def rebuild_market_stats(self) -> int:
+        """Recompute market_stats from the full price history (e.g. after back-filling old quotes)"""
+        conn = sqlite3.connect(self.db_path)
+        n = self._rebuild_market_stats(conn.cursor())
         conn.commit()
         conn.close()
+        if self.market_stats is not None:
+            self.load_market_stats()
+        return n
+    
+    def load_market_stats(self):
+        """(Re)populate the in-memory market statistics from market_stats"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(f'SELECT district_id, crop_id, {", ".join(STATS_COLUMNS)} FROM market_stats').fetchall()
+        conn.close()
+        self.market_stats = {tuple(row[:2]): MarketStats.from_row(row[2:]) for row in rows}
+    
+    def get_market_stats(self, region: str, district: str, crop_name: str) -> Optional[MarketStats]:
+        """Online statistics for one price series, or None if it has no quotes"""
+        key = (self._district_id(region, district, create=False), self._crop_id(crop_name, create=False))
+        if None in key:
+            return None
+        if self.market_stats is not None:
+            return self.market_stats.get(key)
+        conn = sqlite3.connect(self.db_path)
+        stats = self._load_market_stats(conn.cursor(), key)
+        conn.close()
+        return stats
+    
+    def load_price_cache(self):
+        """(Re)populate the in-memory price cache from market_prices"""
+        cache = PriceCache(self.price_cache.capacity, self.price_cache.loaded_since)
+        conn = sqlite3.connect(self.db_path)
+        since = (datetime.date(1970, 1, 1) + datetime.timedelta(days=cache.loaded_since)).isoformat()
+        cursor = conn.execute('''
+            SELECT region, district, crop_name, price_per_ton, price_date, source
+            FROM market_prices_named WHERE price_date >= ? ORDER BY price_date, id
+        ''', (since,))
+        cache.load(cursor)
+        conn.close()
+        self.price_cache = cache
     
     def get_market_prices(self, region: str = None, district: str = None, 
                          crop_name: str = None, days: int = 30) -> pd.DataFrame:
         """Get market price data with filters"""
+        if self.price_cache is not None:
+            cached = self.price_cache.query(region, district, crop_name, days)
+            if cached is not None:
+                return cached
+        
         conn = sqlite3.connect(self.db_path)
         
         query = '''
             SELECT region, district, crop_name, price_per_ton, price_date, source
-            FROM market_prices
+            FROM market_prices_named
             WHERE price_date >= date('now', '-{} days')
         '''.format(days)
         
+        # filters compare integer ids; an unknown name matches nothing
         params = []
-        if region:
-            query += " AND region = ?"
-            params.append(region)
-        if district:
-            query += " AND district = ?"
+        if region and district:
+            query += " AND district_id = ?"
+            params.append(self._district_id(region, district, create=False))
+        elif region:
+            query += " AND region_id = ?"
+            params.append(self._region_id(region, create=False))
+        elif district:
+            query += " AND district_id IN (SELECT id FROM districts WHERE name = ?)"
             params.append(district)
         if crop_name:
-            query += " AND crop_name = ?"
-            params.append(crop_name)
+            query += " AND crop_id = ?"
+            params.append(self._crop_id(crop_name, create=False))
         
         query += " ORDER BY price_date DESC, crop_name"
         
@@ -193,7 +934,9 @@ class FarmerDatabase:
         cursor.execute('''
             INSERT INTO farming_plans (farmer_id, plan_name, duration_months, season, plan_data)
             VALUES (?, ?, ?, ?, ?)
-        ''', (farmer_id, plan_name, duration_months, season, json.dumps(plan_data)))
+        ''', (farmer_id, plan_name, duration_months, season, encode_payload(plan_data)))
+        cursor.execute('UPDATE farming_plans SET plan_meta = ? WHERE id = ?',
+                       (payload_meta(plan_data) or '{}', cursor.lastrowid))
         
         conn.commit()
         conn.close()
@@ -207,18 +950,152 @@ class FarmerDatabase:
         cursor.execute('''
             INSERT INTO farm_layouts (farmer_id, layout_name, plot_dimensions, layout_data)
             VALUES (?, ?, ?, ?)
-        ''', (farmer_id, layout_name, json.dumps(plot_dimensions), json.dumps(layout_data)))
+        ''', (farmer_id, layout_name, json.dumps(plot_dimensions), encode_payload(layout_data)))
+        cursor.execute('UPDATE farm_layouts SET layout_meta = ? WHERE id = ?',
+                       (payload_meta(layout_data) or '{}', cursor.lastrowid))
         
         conn.commit()
         conn.close()
     
+    def add_recommendation_run(self, profile: Dict[str, Any], recommendations: List[Dict[str, Any]],
+                               data_version: str, farmer_id: Optional[int] = None,
+                               dependencies: Sequence[str] = (),
+                               supply_items: Optional[Sequence[Tuple[str, float]]] = None) -> int:
+        """Record a computed recommendation with the profile it was computed for and the crops it depends on"""
+        dependency_rows = self._dependency_rows(profile, dependencies)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            INSERT INTO recommendation_runs ({", ".join(RUN_PROFILE_FIELDS)}, data_version, recommendations,
+                                             farmer_id, supply_factors)
+            VALUES ({", ".join("?" * len(RUN_PROFILE_FIELDS))}, ?, ?, ?, ?)
+        ''', tuple(profile.get(f) for f in RUN_PROFILE_FIELDS) + (
+            data_version, encode_payload(recommendations), farmer_id,
+            json.dumps([list(item) for item in supply_items]) if supply_items else None))
+        run_id = cursor.lastrowid
+        cursor.executemany('INSERT OR IGNORE INTO run_dependencies VALUES (?, ?, ?, ?)',
+                           [row + (run_id,) for row in dependency_rows])
+        
+        conn.commit()
+        conn.close()
+        return run_id
+    
+    def _dependency_rows(self, profile: Dict[str, Any], crops: Iterable[str]) -> List[tuple]:
+        region_id = self._region_id(profile.get('region'))
+        return [(region_id, self._crop_id(crop), profile.get('season')) for crop in crops]
+    
+    def update_recommendation_runs(self, updates: Sequence[Tuple[int, Dict[str, Any], List[Dict[str, Any]], Sequence[str], str]]):
+        """Write back recomputed runs in one transaction.
+        
+        Each update is (run_id, profile, recommendations, dependencies, data_version); the run's
+        dependencies are replaced and its created_at reset, as for a freshly computed run.
+        """
+        dependency_rows = [row + (run_id,) for run_id, profile, _, crops, _ in updates
+                           for row in self._dependency_rows(profile, crops)]
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.executemany('''
+                UPDATE recommendation_runs SET recommendations = ?, data_version = ?, created_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(encode_payload(recs), version, run_id) for run_id, _, recs, _, version in updates])
+            conn.executemany('DELETE FROM run_dependencies WHERE run_id = ?', [(u[0],) for u in updates])
+            conn.executemany('INSERT OR IGNORE INTO run_dependencies VALUES (?, ?, ?, ?)', dependency_rows)
+        conn.close()
+    
+    def retag_recommendation_runs(self, old_version: str, new_version: str, exclude: Iterable[int] = ()) -> int:
+        """Move runs that a data change did not affect to the new data version; returns the number moved"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS retag_exclude (id INTEGER PRIMARY KEY)')
+            conn.execute('DELETE FROM retag_exclude')
+            conn.executemany('INSERT OR IGNORE INTO retag_exclude VALUES (?)', [(i,) for i in exclude])
+            moved = conn.execute('''
+                UPDATE recommendation_runs SET data_version = ?
+                WHERE data_version = ? AND id NOT IN (SELECT id FROM retag_exclude)
+            ''', (new_version, old_version)).rowcount
+        conn.close()
+        return moved
+    
+    def get_run_supply_states(self) -> List[Optional[Tuple[Tuple[str, float], ...]]]:
+        """Distinct supply adjustments stored runs were scored with (None for unadjusted runs)"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('SELECT DISTINCT supply_factors FROM recommendation_runs').fetchall()
+        conn.close()
+        return [tuple(tuple(item) for item in json.loads(row[0])) if row[0] else None for row in rows]
+    
+    def get_dependent_runs(self, data_version: str, keys: Optional[Iterable[Tuple[Optional[str], str]]] = None
+                           ) -> List[Dict[str, Any]]:
+        """Runs of a data version that depend on any (region, crop) key; a None region matches every region.
+        
+        keys=None returns every run of the version.
+        """
+        conn = sqlite3.connect(self.db_path)
+        query = f'''
+            SELECT id, {", ".join(RUN_PROFILE_FIELDS)}, farmer_id, supply_factors
+            FROM recommendation_runs WHERE data_version = ?
+        '''
+        if keys is not None:
+            changed = set()
+            for region, crop in keys:
+                # names that were never interned cannot appear in any dependency
+                region_id = None if region is None else self._region_id(region, create=False)
+                crop_id = self._crop_id(crop, create=False)
+                if crop_id is not None and (region is None or region_id is not None):
+                    changed.add((region_id, crop_id))
+            conn.execute('CREATE TEMP TABLE changed_keys (region_id INTEGER, crop_id INTEGER NOT NULL)')
+            conn.executemany('INSERT INTO changed_keys VALUES (?, ?)', changed)
+            query += '''
+                AND id IN (
+                    SELECT d.run_id FROM changed_keys k JOIN run_dependencies d
+                    ON d.crop_id = k.crop_id AND (k.region_id IS NULL OR d.region_id = k.region_id)
+                )
+            '''
+        cursor = conn.execute(query + ' ORDER BY id', (data_version,))
+        columns = [d[0] for d in cursor.description]
+        runs = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        conn.close()
+        return runs
+    
+    def link_recommendation_run(self, run_id: int, farmer_id: int):
+        """Attribute a run to the farmer who saved its recommendation"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute('UPDATE recommendation_runs SET farmer_id = ? WHERE id = ? AND farmer_id IS NULL',
+                         (farmer_id, run_id))
+        conn.close()
+    
+    def get_recommendation_runs(self, data_version: str, since_days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Runs computed against the given data version, oldest first"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        query = f'''
+            SELECT id, {", ".join(RUN_PROFILE_FIELDS)}, recommendations, farmer_id, created_at
+            FROM recommendation_runs WHERE data_version = ?
+        '''
+        params: List[Any] = [data_version]
+        if since_days is not None:
+            query += " AND created_at >= datetime('now', ?)"
+            params.append(f'-{int(since_days)} days')
+        cursor.execute(query + ' ORDER BY id', params)
+        columns = [d[0] for d in cursor.description]
+        runs = []
+        for row in cursor.fetchall():
+            run = dict(zip(columns, row))
+            run['recommendations'] = decode_payload(run['recommendations']) or []
+            runs.append(run)
+        
+        conn.close()
+        return runs
+    
     def get_farmer_data(self, farmer_id: int) -> Dict[str, Any]:
         """Get complete farmer data including all related information"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         # Get farmer basic info
-        cursor.execute('SELECT * FROM farmers WHERE id = ?', (farmer_id,))
+        cursor.execute(f'SELECT {", ".join(FARMER_ROW)} FROM farmers_named WHERE id = ?', (farmer_id,))
         farmer = cursor.fetchone()
         
         if not farmer:
@@ -226,16 +1103,16 @@ class FarmerDatabase:
             return None
         
         # Get crop selections
-        cursor.execute('SELECT * FROM crop_selections WHERE farmer_id = ?', (farmer_id,))
+        cursor.execute(f'SELECT {", ".join(SELECTION_ROW)} FROM crop_selections_named WHERE farmer_id = ?', (farmer_id,))
         crops = cursor.fetchall()
         
-        # Get farming plans
+        # Get farming plans (payloads are decoded lazily)
         cursor.execute('SELECT * FROM farming_plans WHERE farmer_id = ?', (farmer_id,))
-        plans = cursor.fetchall()
+        plans = self._lazy_rows(cursor)
         
         # Get farm layouts
         cursor.execute('SELECT * FROM farm_layouts WHERE farmer_id = ?', (farmer_id,))
-        layouts = cursor.fetchall()
+        layouts = self._lazy_rows(cursor)
         
         conn.close()
         
@@ -246,28 +1123,145 @@ class FarmerDatabase:
             'layouts': layouts
         }
     
-    def get_market_trends(self, region: str, district: str, crop_name: str) -> Dict[str, Any]:
-        """Get market trends for a specific crop in a region/district"""
-        df = self.get_market_prices(region, district, crop_name, days=90)
+    def find_farming_plans(self, crop_name: Optional[str] = None, min_share: float = 0.0,
+                           season: Optional[str] = None, region: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Plans whose crop_name share is at least min_share percent, filtered in SQL without decoding payloads"""
+        query = '''
+            SELECT p.id, p.farmer_id, p.plan_name, p.duration_months, p.season, p.plan_data,
+                   p.primary_crop, p.primary_share, p.created_at
+            FROM farming_plans p
+        '''
+        conditions, params = [], []
+        if region:
+            query += ' JOIN farmers f ON f.id = p.farmer_id JOIN districts d ON d.id = f.district_id'
+            conditions.append('d.region_id = ?')
+            params.append(self._region_id(region, create=False))
+        if crop_name and min_share > 50:
+            # only the largest crop can hold a majority, so the primary_crop index answers it
+            conditions.append('p.primary_crop = ? AND p.primary_share >= ?')
+            params.extend([crop_name, min_share])
+        elif crop_name:
+            conditions.append("EXISTS (SELECT 1 FROM json_each(p.plan_meta, '$.crop_shares') WHERE key = ? AND value >= ?)")
+            params.extend([crop_name, min_share])
+        if season:
+            conditions.append('p.season = ?')
+            params.append(season)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY p.id'
         
-        if df.empty:
-            return {'trend': 'no_data', 'average_price': 0, 'price_change': 0}
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        plans = self._lazy_rows(cursor)
+        conn.close()
+        return plans
+    
+    def get_summary_generation(self) -> int:
+        """Counter bumped by every write to the selection summaries"""
+        conn = sqlite3.connect(self.db_path)
+        generation = conn.execute('SELECT generation FROM summary_generation').fetchone()[0]
+        conn.close()
+        return generation
+    
+    def get_planted_area(self, region: str) -> Dict[str, float]:
+        """Planned hectares per crop in a region, from the maintained region_crop_area counters"""
+        region_id = self._region_id(region, create=False)
+        if region_id is None:
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('''
+            SELECT c.name, a.planted_area_ha FROM region_crop_area a JOIN crops c ON c.id = a.crop_id
+            WHERE a.region_id = ?
+        ''', (region_id,)).fetchall()
+        conn.close()
+        return dict(rows)
+    
+    def get_district_summary(self, region: Optional[str] = None, district: Optional[str] = None,
+                             season: Optional[str] = None) -> pd.DataFrame:
+        """Planned area (ha), expected revenue and farmer count per district, season and crop.
         
-        # Calculate trends
-        latest_price = df.iloc[0]['price_per_ton']
-        oldest_price = df.iloc[-1]['price_per_ton']
-        average_price = df['price_per_ton'].mean()
+        Reads the maintained summary table, so the cost depends on districts x crops, not on
+        the number of farmers. Results are cached until the next selection write (by any
+        process); the returned frame is shared between callers and must not be modified.
+        """
+        key = (region, district, season)
+        generation = self.get_summary_generation()
+        cached = self._summary_cache.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
         
-        price_change = ((latest_price - oldest_price) / oldest_price) * 100 if oldest_price > 0 else 0
+        query = '''
+            SELECT r.name AS region, d.name AS district, s.season, c.name AS crop_name,
+                   s.farmers, s.planned_area_ha, s.expected_revenue
+            FROM district_crop_summary s
+            JOIN districts d ON d.id = s.district_id
+            JOIN regions r ON r.id = d.region_id
+            JOIN crops c ON c.id = s.crop_id
+        '''
+        conditions, params = [], []
+        if region and district:
+            conditions.append('s.district_id = ?')
+            params.append(self._district_id(region, district, create=False))
+        elif region:
+            conditions.append('d.region_id = ?')
+            params.append(self._region_id(region, create=False))
+        elif district:
+            conditions.append('d.name = ?')
+            params.append(district)
+        if season is not None:
+            conditions.append('s.season = ?')
+            params.append(season)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        conn = sqlite3.connect(self.db_path)
+        df = pd.read_sql_query(query + ' ORDER BY r.name, d.name, s.season, s.planned_area_ha DESC', conn, params=params)
+        conn.close()
         
-        trend = 'up' if price_change > 5 else 'down' if price_change < -5 else 'stable'
+        if len(self._summary_cache) >= 256 or any(g != generation for g, _ in self._summary_cache.values()):
+            self._summary_cache.clear()
+        self._summary_cache[key] = (generation, df)
+        return df
+    
+    def get_market_trends(self, region: str, district: str, crop_name: str) -> Dict[str, Any]:
+        """Get market trends for a specific crop in a region/district"""
+        # read from the incrementally maintained statistics, constant time regardless of history
+        return self._trend_summary(self.get_market_stats(region, district, crop_name))
+    
+    def get_market_trends_many(self, keys) -> Dict[tuple, Dict[str, Any]]:
+        """get_market_trends for many (region, district, crop_name) keys with one query per few hundred keys"""
+        keys = list(dict.fromkeys(tuple(k) for k in keys))
+        ids = {key: (self._district_id(key[0], key[1], create=False), self._crop_id(key[2], create=False))
+               for key in keys}
+        if self.market_stats is not None:
+            return {key: self._trend_summary(self.market_stats.get(ids[key])) for key in keys}
+        wanted = list(dict.fromkeys(i for i in ids.values() if None not in i))
+        found: Dict[tuple, MarketStats] = {}
+        conn = sqlite3.connect(self.db_path)
+        for start in range(0, len(wanted), 400):
+            batch = wanted[start:start + 400]
+            rows = conn.execute(f'''
+                SELECT district_id, crop_id, {', '.join(STATS_COLUMNS)} FROM market_stats
+                WHERE (district_id, crop_id) IN (VALUES {', '.join(['(?, ?)'] * len(batch))})
+            ''', [v for key in batch for v in key])
+            for row in rows:
+                found[tuple(row[:2])] = MarketStats.from_row(row[2:])
+        conn.close()
+        return {key: self._trend_summary(found.get(ids[key])) for key in keys}
+    
+    @staticmethod
+    def _trend_summary(stats: Optional[MarketStats]) -> Dict[str, Any]:
+        if stats is None or not stats.ewma:
+            return {'trend': 'no_data', 'average_price': 0, 'price_change': 0}
         
         return {
-            'trend': trend,
-            'average_price': round(average_price, 2),
-            'price_change': round(price_change, 2),
-            'latest_price': latest_price,
-            'data_points': len(df)
+            'trend': stats.trend(),
+            'average_price': round(stats.ewma[LONG_SPAN], 2),
+            'price_change': round(stats.momentum_pct, 2),
+            'latest_price': stats.last_price,
+            'data_points': stats.count,
+            'volatility': round(stats.volatility_pct, 2),
+            'ewma': {span: round(value, 2) for span, value in stats.ewma.items()}
         }
     
     def generate_farmer_report(self, farmer_id: int) -> Dict[str, Any]:
@@ -278,7 +1272,7 @@ class FarmerDatabase:
             return None
         
         # Calculate total expected revenue
-        total_revenue = sum(crop[4] for crop in farmer_data['crops'])  # expected_revenue column
+        total_revenue = sum(crop[5] or 0 for crop in farmer_data['crops'])  # expected_revenue column
         
         # Get market trends for selected crops
         market_trends = {}
@@ -294,13 +1288,95 @@ class FarmerDatabase:
         return {
             'farmer_info': farmer_data['farmer'],
             'crop_selections': farmer_data['crops'],
-            'farming_plans': farmer_data['plans'],
-            'farm_layouts': farmer_data['layouts'],
+            # a report is serialised whole, so its payloads are decoded up front
+            'farming_plans': self._decoded_rows(farmer_data['plans']),
+            'farm_layouts': self._decoded_rows(farmer_data['layouts']),
             'total_expected_revenue': total_revenue,
             'market_trends': market_trends,
             'report_generated': datetime.datetime.now().isoformat()
         }
 
+    def _farmer_filter(self, region: Optional[str] = None, district: Optional[str] = None,
+                       since: Optional[str] = None, until: Optional[str] = None):
+        conditions, params = [], []
+        if region and district:
+            conditions.append('district_id = ?')
+            params.append(self._district_id(region, district, create=False))
+        elif region:
+            conditions.append('district_id IN (SELECT id FROM districts WHERE region_id = ?)')
+            params.append(self._region_id(region, create=False))
+        elif district:
+            conditions.append('district_id IN (SELECT id FROM districts WHERE name = ?)')
+            params.append(district)
+        for clause, value in (('created_at >= ?', since), ('created_at < ?', until)):
+            if value:
+                conditions.append(clause)
+                params.append(str(value))
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+    
+    def count_farmers(self, region: Optional[str] = None, district: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None) -> int:
+        """Number of farmers matching the report filters"""
+        where, params = self._farmer_filter(region, district, since, until)
+        conn = sqlite3.connect(self.db_path)
+        count = conn.execute(f'SELECT COUNT(*) FROM farmers{where}', params).fetchone()[0]
+        conn.close()
+        return count
+    
+    def iter_farmer_reports(self, region: Optional[str] = None, district: Optional[str] = None,
+                            since: Optional[str] = None, until: Optional[str] = None,
+                            batch_size: int = 2000):
+        """Stream farmer reports in id order, a batch of farmers at a time.
+        
+        Each batch costs a handful of queries (selections, plan/layout counts, trends)
+        instead of several per farmer; memory stays bounded by batch_size.
+        """
+        where, params = self._farmer_filter(region, district, since, until)
+        farmer_columns = ('id', 'created_at') + FARMER_FIELDS
+        conn = sqlite3.connect(self.db_path)
+        farmers = conn.execute(f'SELECT {", ".join(farmer_columns)} FROM farmers_named{where} ORDER BY id', params)
+        trends: Dict[tuple, Dict[str, Any]] = {}
+        try:
+            while True:
+                batch = [dict(zip(farmer_columns, row)) for row in farmers.fetchmany(batch_size)]
+                if not batch:
+                    break
+                ids = [f['id'] for f in batch]
+                id_list = ', '.join('?' * len(ids))
+                
+                crops: Dict[int, List[Dict[str, Any]]] = {}
+                for row in conn.execute(f'''
+                    SELECT farmer_id, {", ".join(SELECTION_FIELDS)} FROM crop_selections_named
+                    WHERE farmer_id IN ({id_list}) ORDER BY farmer_id, id
+                ''', ids):
+                    crops.setdefault(row[0], []).append(dict(zip(SELECTION_FIELDS, row[1:])))
+                counts: Dict[str, Dict[int, int]] = {}
+                for table in ('farming_plans', 'farm_layouts'):
+                    counts[table] = dict(conn.execute(
+                        f'SELECT farmer_id, COUNT(*) FROM {table} WHERE farmer_id IN ({id_list}) GROUP BY farmer_id', ids))
+                
+                # trends are per series, shared by many farmers: fetch only keys not seen yet
+                missing = {(f['region'], f['district'], c['crop_name'])
+                           for f in batch for c in crops.get(f['id'], [])} - trends.keys()
+                if missing:
+                    trends.update(self.get_market_trends_many(missing))
+                
+                for farmer in batch:
+                    selections = crops.get(farmer['id'], [])
+                    yield {
+                        'farmer': farmer,
+                        'crop_selections': selections,
+                        'farming_plans': counts['farming_plans'].get(farmer['id'], 0),
+                        'farm_layouts': counts['farm_layouts'].get(farmer['id'], 0),
+                        'total_expected_revenue': sum(c['expected_revenue'] or 0 for c in selections),
+                        'market_trends': {
+                            c['crop_name']: trends[(farmer['region'], farmer['district'], c['crop_name'])]
+                            for c in selections
+                        },
+                    }
+        finally:
+            conn.close()
+
 # Sample data population functions
 def populate_sample_market_data(db: FarmerDatabase):
     """Populate database with sample market data"""
@@ -320,12 +1396,12 @@ def populate_sample_market_data(db: FarmerDatabase):
             for crop in crops:
                 # Generate random price data for the last 30 days
                 base_price = random.randint(20000, 60000)
-                for days_ago in range(30):
+                for days_ago in range(29, -1, -1):
                     price_date = datetime.date.today() - datetime.timedelta(days=days_ago)
                     price_variation = random.uniform(0.8, 1.2)
                     price = base_price * price_variation
                     
-                    db.add_market_price(region, district, crop, price, "Sample Data")
+                    db.add_market_price(region, district, crop, price, "Sample Data", price_date)
 
 if __name__ == "__main__":
     # Initialize database and populate with sample data
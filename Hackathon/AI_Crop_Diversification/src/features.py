@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+DRAINAGE_LEVELS: Tuple[str, ...] = ("poor", "moderate", "well")
+DRAINAGE_CODES: Dict[str, int] = {level: code for code, level in enumerate(DRAINAGE_LEVELS)}
+
+# one record per (region, season): soil, seasonal forecast and market context
+FEATURE_DTYPE = np.dtype([
+    ("ph", np.float64),
+    ("drainage", np.int8),  # index into DRAINAGE_LEVELS
+    ("organic_matter_pct", np.float64),
+    ("forecast_temp_c", np.float64),
+    ("forecast_rain_mm", np.float64),
+    ("market_index", np.float64),
+])
+
+
+def drainage_code(level: str) -> int:
+    return DRAINAGE_CODES.get(str(level).strip().lower(), DRAINAGE_CODES["moderate"])
+
+
+class FeatureStore:
+    """Region × season feature vectors built once from the soil, climate and regions tables.
+
+    Lookups are a dict probe plus a row of a structured array. Overrides never touch the
+    stored rows: `vector` returns a patched copy.
+    """
+
+    def __init__(self, soil_df: pd.DataFrame, climate_df: pd.DataFrame, regions_df: pd.DataFrame):
+        # first row per region wins, as the old .iloc[0] lookups did
+        soil = soil_df.drop_duplicates("region").set_index("region")
+        regions = regions_df.drop_duplicates("region").set_index("region")
+        climate = climate_df.drop_duplicates(["region", "season"])
+        climate = climate[climate["region"].isin(soil.index) & climate["region"].isin(regions.index)]
+
+        table = np.zeros(len(climate), dtype=FEATURE_DTYPE)
+        table["ph"] = soil.loc[climate["region"], "ph"].to_numpy()
+        table["drainage"] = [drainage_code(d) for d in soil.loc[climate["region"], "drainage"]]
+        table["organic_matter_pct"] = soil.loc[climate["region"], "organic_matter_pct"].to_numpy()
+        table["forecast_temp_c"] = climate["forecast_temp_c"].to_numpy()
+        table["forecast_rain_mm"] = climate["forecast_rain_mm"].to_numpy()
+        table["market_index"] = regions.loc[climate["region"], "market_index"].to_numpy()
+        table.flags.writeable = False
+
+        self.table = table
+        self.index: Dict[Tuple[str, str], int] = {
+            (region, season): i for i, (region, season) in enumerate(zip(climate["region"], climate["season"]))
+        }
+        self.region_index: Dict[str, int] = {}
+        for (region, _), i in self.index.items():
+            self.region_index.setdefault(region, i)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self.index
+
+    def lookup(self, region: str, season: str) -> np.void:
+        """Stored (read-only) vector for a region and season; KeyError if unknown."""
+        return self.table[self.index[(region, season)]]
+
+    def vector(self, region: str, season: str, soil_override: Optional[Mapping[str, Any]] = None,
+               extra_rain_mm: float = 0.0, climate_override: Optional[Mapping[str, Any]] = None) -> np.void:
+        """Copy of the stored vector with user overrides patched in."""
+        vec = self.lookup(region, season).copy()
+        if soil_override:
+            if soil_override.get("ph") is not None:
+                vec["ph"] = float(soil_override["ph"])
+            if soil_override.get("drainage"):
+                vec["drainage"] = drainage_code(soil_override["drainage"])
+            if soil_override.get("organic_matter_pct") is not None:
+                vec["organic_matter_pct"] = float(soil_override["organic_matter_pct"])
+        if climate_override:
+            for name in ("forecast_temp_c", "forecast_rain_mm"):
+                if climate_override.get(name) is not None:
+                    vec[name] = float(climate_override[name])
+        if extra_rain_mm:
+            vec["forecast_rain_mm"] = float(vec["forecast_rain_mm"]) + float(extra_rain_mm)
+        return vec
+
+    def soil_defaults(self, region: str) -> Optional[Dict[str, Any]]:
+        """Soil values for pre-filling widgets, or None for an unknown region."""
+        i = self.region_index.get(region)
+        return None if i is None else {k: v for k, v in as_dict(self.table[i]).items()
+                                       if k in ("ph", "drainage", "organic_matter_pct")}
+
+
+def as_dict(vec: np.void) -> Dict[str, Any]:
+    """Plain-Python view of a feature vector (drainage decoded to its level name)."""
+    out = {name: float(vec[name]) for name in FEATURE_DTYPE.names if name != "drainage"}
+    out["drainage"] = DRAINAGE_LEVELS[int(vec["drainage"])]
+    return out
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from features import DRAINAGE_LEVELS, drainage_code
+from tracing import traced
+
+
+EARTH_RADIUS_KM = 6371.0088
+# below this many (query, point) pairs a plain scan beats the grid's fixed numpy overhead
+SCAN_PAIRS = 50_000
+_DRAINAGE_NAMES = np.asarray(DRAINAGE_LEVELS, dtype=object)
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _to_xyz(lat, lon) -> np.ndarray:
+    # points on the earth's surface in km; chord length is monotone in great-circle distance
+    lat_r = np.radians(np.asarray(lat, dtype=float))
+    lon_r = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat_r)
+    return EARTH_RADIUS_KM * np.stack([cos_lat * np.cos(lon_r), cos_lat * np.sin(lon_r), np.sin(lat_r)], axis=-1)
+
+
+def _chord_to_km(chord: np.ndarray) -> np.ndarray:
+    km = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / (2 * EARTH_RADIUS_KM), 0.0, 1.0))
+    return np.where(np.isfinite(chord), km, np.inf)
+
+
+class GeoIndex:
+    """Grid-hash index over georeferenced points for k-nearest-neighbour lookups.
+
+    Points are bucketed into cubic cells (`cell_km`) of their 3-D surface coordinates and
+    stored CSR-style: one sort at build time, then a query gathers the points of the cells
+    around it. Batch queries are fully vectorised; the search block only grows for queries
+    whose k-th neighbour could lie outside it, and the few still open after `max_radius`
+    rings (sparse areas, points far off the grid) are answered by a chunked exact scan.
+    """
+
+    def __init__(self, lat, lon, cell_km: float = 25.0, max_radius: int = 2):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.xyz = _to_xyz(self.lat, self.lon).reshape(-1, 3)
+        self.cell_km = float(cell_km)
+        self.max_radius = max_radius
+        self.origin = self.xyz.min(axis=0) if len(self) else np.zeros(3)
+        coords = self._cell_coords(self.xyz)
+        self.shape = coords.max(axis=0) + 1 if len(self) else np.ones(3, dtype=np.int64)
+        ids = self._cell_ids(coords)
+        self.order = np.argsort(ids, kind="stable")
+        # only occupied cells are stored: sorted ids plus their start offsets into `order`
+        self.cells, first = np.unique(ids[self.order], return_index=True)
+        self.starts = np.append(first, len(self))
+
+    def __len__(self) -> int:
+        return self.lat.size
+
+    def _cell_coords(self, xyz: np.ndarray) -> np.ndarray:
+        return np.floor((xyz - self.origin) / self.cell_km).astype(np.int64)
+
+    def _cell_ids(self, coords: np.ndarray) -> np.ndarray:
+        return (coords[..., 0] * self.shape[1] + coords[..., 1]) * self.shape[2] + coords[..., 2]
+
+    def query(self, lat, lon, k: int = 1, max_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest points for each coordinate. Returns (distance_km, index), both (m, k).
+
+        Missing neighbours (fewer than k points in total, or none within `max_km`) have
+        distance inf and index -1. A bound no larger than `cell_km` needs a single pass.
+        """
+        qxyz = _to_xyz(np.atleast_1d(lat), np.atleast_1d(lon)).reshape(-1, 3)
+        m = len(qxyz)
+        k_eff = min(k, len(self))
+        out_c = np.full((m, k), np.inf)
+        out_i = np.full((m, k), -1, dtype=np.int64)
+        if m == 0 or k_eff == 0:
+            return out_c, out_i
+
+        max_chord = np.inf if max_km is None else 2 * EARTH_RADIUS_KM * np.sin(min(max_km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+        if m * len(self) <= SCAN_PAIRS:
+            self._scan(qxyz, np.arange(m), k_eff, out_c, out_i)
+            return self._bounded(out_c, out_i, max_chord)
+
+        qcell = self._cell_coords(qxyz)
+        pending = np.arange(m)
+        radius = 1
+        while pending.size and radius <= self.max_radius:
+            covered = self._covered_km(qxyz[pending], qcell[pending], radius)
+            q_of, pts = self._gather(qcell[pending], radius)
+            chord = np.linalg.norm(self.xyz[pts] - qxyz[pending][q_of], axis=1)
+            order = np.lexsort((chord, q_of))
+            q_sorted, p_sorted, c_sorted = q_of[order], pts[order], chord[order]
+            first = np.searchsorted(q_sorted, np.arange(pending.size))
+            counts = np.bincount(q_sorted, minlength=pending.size)
+            rank = np.arange(q_sorted.size) - first[q_sorted]
+
+            kth = np.full(pending.size, np.inf)
+            has_k = counts >= k_eff
+            kth[has_k] = c_sorted[first[has_k] + k_eff - 1]
+            done = np.isinf(covered) | (has_k & (kth <= covered)) | (covered >= max_chord)
+
+            sel = (rank < k_eff) & done[q_sorted]
+            rows = pending[q_sorted[sel]]
+            out_i[rows, rank[sel]] = p_sorted[sel]
+            out_c[rows, rank[sel]] = c_sorted[sel]
+            pending = pending[~done]
+            radius *= 2
+
+        if pending.size:
+            self._scan(qxyz, pending, k_eff, out_c, out_i)
+        return self._bounded(out_c, out_i, max_chord)
+
+    @staticmethod
+    def _bounded(out_c: np.ndarray, out_i: np.ndarray, max_chord: float) -> Tuple[np.ndarray, np.ndarray]:
+        far = out_c > max_chord
+        out_c[far] = np.inf
+        out_i[far] = -1
+        return _chord_to_km(out_c), out_i
+
+    def _covered_km(self, qxyz, qcell, radius) -> np.ndarray:
+        """Distance each query's search block is guaranteed to cover (inf once it spans the grid)."""
+        lo = qcell - radius
+        hi = qcell + radius + 1
+        # faces at or beyond the grid edge have no points behind them
+        lo_gap = np.where(lo <= 0, np.inf, qxyz - (self.origin + lo * self.cell_km))
+        hi_gap = np.where(hi >= self.shape, np.inf, self.origin + hi * self.cell_km - qxyz)
+        return np.minimum(lo_gap, hi_gap).min(axis=1)
+
+    def _gather(self, qcell, radius) -> Tuple[np.ndarray, np.ndarray]:
+        """(query position, point index) pairs for every point in each query's search block."""
+        span = np.arange(-radius, radius + 1)
+        offsets = np.stack(np.meshgrid(span, span, span, indexing="ij"), axis=-1).reshape(-1, 3)
+        coords = qcell[:, None, :] + offsets[None, :, :]
+        inside = ((coords >= 0) & (coords < self.shape)).all(axis=2)
+        q = np.broadcast_to(np.arange(len(qcell))[:, None], inside.shape)[inside]
+        ids = self._cell_ids(coords[inside])
+        slot = np.minimum(np.searchsorted(self.cells, ids), len(self.cells) - 1)
+        hit = self.cells[slot] == ids
+        q, slot = q[hit], slot[hit]
+        start = self.starts[slot]
+        count = self.starts[slot + 1] - start
+        seg_start = np.cumsum(count) - count
+        within = np.arange(int(count.sum())) - np.repeat(seg_start, count)
+        return np.repeat(q, count), self.order[np.repeat(start, count) + within]
+
+    def _scan(self, qxyz, rows, k, out_c, out_i, chunk_cells: int = 4_000_000) -> None:
+        """Exact k-NN against every point for the queries the grid search left open."""
+        step = max(1, chunk_cells // max(len(self), 1))
+        for lo in range(0, rows.size, step):
+            part = rows[lo:lo + step]
+            diff = qxyz[part][:, None, :] - self.xyz[None, :, :]
+            chord = np.sqrt(np.einsum("qpc,qpc->qp", diff, diff))
+            nearest = np.argpartition(chord, k - 1, axis=1)[:, :k] if k < len(self) else \
+                np.broadcast_to(np.arange(len(self)), (part.size, len(self)))
+            row = np.arange(part.size)[:, None]
+            picked = chord[row, nearest]
+            rerank = np.argsort(picked, axis=1, kind="stable")
+            out_i[part, :k] = nearest[row, rerank]
+            out_c[part, :k] = picked[row, rerank]
+
+
+def idw_weights(distance_km: np.ndarray, index: np.ndarray, power: float = 2.0) -> np.ndarray:
+    """Normalised inverse-distance weights for (m, k) neighbour results (NaN rows when nothing was found)."""
+    found = index >= 0
+    weights = np.zeros(distance_km.shape)
+    np.power(distance_km, -power, out=weights, where=found & (distance_km > 1e-6))
+    exact = found & (distance_km <= 1e-6)
+    # a query sitting on a sample point takes that point's value
+    on_point = exact.any(axis=1)
+    weights[on_point] = exact[on_point]
+    total = weights.sum(axis=1, keepdims=True)
+    return np.divide(weights, total, out=np.full(weights.shape, np.nan), where=total > 0)
+
+
+def idw(values: np.ndarray, distance_km: np.ndarray, index: np.ndarray, power: float = 2.0) -> np.ndarray:
+    """Inverse-distance-weighted blend of point values for (m, k) neighbour results."""
+    return _blend(values, idw_weights(distance_km, index, power), index)
+
+
+def _blend(values: np.ndarray, weights: np.ndarray, index: np.ndarray) -> np.ndarray:
+    return (weights * values[np.maximum(index, 0)]).sum(axis=1)
+
+
+@dataclass
+class Site:
+    lat: float
+    lon: float
+    region: str
+    district: str
+    distance_km: float
+    soil: Dict[str, object]  # soil_override for compute_scores
+    climate: Dict[str, float]  # climate_override for compute_scores
+
+
+class SiteLocator:
+    """Soil and per-season climate at arbitrary coordinates from georeferenced sample points."""
+
+    def __init__(self, soil_points: pd.DataFrame, climate_points: Optional[pd.DataFrame] = None,
+                 cell_km: float = 25.0):
+        self.soil_points = soil_points.reset_index(drop=True)
+        self.soil_index = GeoIndex(self.soil_points["lat"], self.soil_points["lon"], cell_km)
+        self._region = self.soil_points["region"].to_numpy(dtype=object)
+        self._district = self.soil_points["district"].to_numpy(dtype=object)
+        self._ph = self.soil_points["ph"].to_numpy(dtype=float)
+        self._om = self.soil_points["organic_matter_pct"].to_numpy(dtype=float)
+        self._drainage = np.array([drainage_code(d) for d in self.soil_points["drainage"]], dtype=np.int8)
+        self.climate: Dict[str, Tuple[GeoIndex, np.ndarray, np.ndarray]] = {}
+        if climate_points is not None:
+            for season, pts in climate_points.groupby("season"):
+                self.climate[season] = (
+                    GeoIndex(pts["lat"], pts["lon"], cell_km),
+                    pts["forecast_temp_c"].to_numpy(dtype=float),
+                    pts["forecast_rain_mm"].to_numpy(dtype=float),
+                )
+
+    def _soil_columns(self, lat, lon, k: int) -> Dict[str, np.ndarray]:
+        dist, idx = self.soil_index.query(lat, lon, k)
+        weights = idw_weights(dist, idx)
+        nearest = idx[:, 0]
+        return {
+            "region": self._region[nearest],
+            "district": self._district[nearest],
+            "distance_km": dist[:, 0],
+            "ph": _blend(self._ph, weights, idx),
+            "organic_matter_pct": _blend(self._om, weights, idx),
+            "drainage": _DRAINAGE_NAMES[self._drainage[nearest]],
+        }
+
+    def _climate_columns(self, lat, lon, season: str, k: int) -> Optional[Dict[str, np.ndarray]]:
+        if season not in self.climate:
+            return None
+        index, temp, rain = self.climate[season]
+        dist, idx = index.query(lat, lon, k)
+        weights = idw_weights(dist, idx)
+        return {"forecast_temp_c": _blend(temp, weights, idx), "forecast_rain_mm": _blend(rain, weights, idx)}
+
+    @traced("geo.soil_at")
+    def soil_at(self, lat, lon, k: int = 4) -> pd.DataFrame:
+        """Batch soil estimate: IDW pH and organic matter, nearest point's drainage, region and district."""
+        return pd.DataFrame(self._soil_columns(lat, lon, k))
+
+    @traced("geo.climate_at")
+    def climate_at(self, lat, lon, season: str, k: int = 4) -> Optional[pd.DataFrame]:
+        """Batch IDW seasonal forecast, or None when there are no points for the season."""
+        columns = self._climate_columns(lat, lon, season, k)
+        return None if columns is None else pd.DataFrame(columns)
+
+    @traced("geo.locate")
+    def locate(self, lat: float, lon: float, season: str, k: int = 4) -> Site:
+        """Single-site lookup, shaped for compute_scores' soil_override and climate_override."""
+        soil = self._soil_columns(lat, lon, k)
+        climate = self._climate_columns(lat, lon, season, k) or {}
+        return Site(
+            lat=float(lat),
+            lon=float(lon),
+            region=str(soil["region"][0]),
+            district=str(soil["district"][0]),
+            distance_km=float(soil["distance_km"][0]),
+            soil={
+                "ph": round(float(soil["ph"][0]), 2),
+                "drainage": str(soil["drainage"][0]),
+                "organic_matter_pct": round(float(soil["organic_matter_pct"][0]), 2),
+            },
+            climate={name: round(float(values[0]), 1) for name, values in climate.items()},
+        )
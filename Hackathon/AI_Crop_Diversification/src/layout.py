@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import math
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+CROP_COLORS = {
+    'Wheat': '#DAA520',
+    'Rice': '#228B22',
+    'Maize': '#FFD700',
+    'Chickpea': '#8B4513',
+    'Soybean': '#32CD32',
+    'Groundnut': '#D2691E',
+    'Mustard': '#FFD700',
+    'Cotton': '#F5F5DC',
+    'Sorghum': '#8B4513',
+    'Millet': '#DAA520',
+    'Vegetables': '#32CD32',
+    'Fruits': '#FF6347'
+}
+DEFAULT_COLOR = '#CCCCCC'
+
+
+def grid_shape(plot_length: float, plot_width: float, max_cells: int = 200) -> Tuple[int, int, float]:
+    """Rows (along length) and columns (along width) for a grid whose longer side has `max_cells` cells.
+
+    Returns (rows, cols, cell_size_m).
+    """
+    cell_size = max(plot_length, plot_width) / float(max_cells)
+    rows = max(1, int(math.ceil(plot_length / cell_size - 1e-9)))
+    cols = max(1, int(math.ceil(plot_width / cell_size - 1e-9)))
+    return rows, cols, cell_size
+
+
+def farm_grid_labels(area_shares_pct: Sequence[float], rows: int, cols: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Fill a rows×cols grid row by row with crop indices in proportion to their area shares.
+
+    Cells left over after rounding are -1. Returns (labels, cells_per_crop).
+    """
+    total = rows * cols
+    shares = np.asarray(area_shares_pct, dtype=float) / 100.0
+    counts = np.floor(shares * total).astype(np.int64)
+    # guard against shares summing slightly above 100%
+    counts = np.minimum(counts, np.maximum(total - np.concatenate(([0], np.cumsum(counts)[:-1])), 0))
+    labels = np.full(total, -1, dtype=np.int16)
+    filled = np.repeat(np.arange(len(counts), dtype=np.int16), counts)
+    labels[: filled.size] = filled
+    return labels.reshape(rows, cols), counts
+
+
+def discrete_colorscale(colors: List[str]) -> List[Tuple[float, str]]:
+    """Plotly colorscale mapping integer labels 0..n-1 (zmin=-0.5, zmax=n-0.5) to flat color bands."""
+    n = max(len(colors), 1)
+    scale: List[Tuple[float, str]] = []
+    for i, color in enumerate(colors):
+        scale.append((i / n, color))
+        scale.append(((i + 1) / n, color))
+    return scale or [(0.0, DEFAULT_COLOR), (1.0, DEFAULT_COLOR)]
+
+
+def squarify(areas: Sequence[float], x: float, y: float, width: float, height: float) -> np.ndarray:
+    """Squarified treemap: partition the rectangle (x, y, width, height) into one rectangle per area.
+
+    Areas are rescaled to fill the rectangle exactly. Rows are grown greedily along the
+    shorter side while the worst aspect ratio improves, keeping running sum/min/max so
+    the whole layout is O(n log n) (dominated by the sort). Returns an (n, 4) array of
+    [x0, y0, x1, y1] in the input order; non-positive areas get zero-size rectangles.
+    """
+    values = np.asarray(areas, dtype=float)
+    n = values.size
+    rects = np.zeros((n, 4), dtype=float)
+    total = values[values > 0].sum()
+    if n == 0 or total <= 0 or width <= 0 or height <= 0:
+        rects[:] = (x, y, x, y)
+        return rects
+
+    order = np.argsort(-values, kind="stable")
+    scaled = values[order] * (width * height / total)
+    positive = int(np.count_nonzero(scaled > 0))
+
+    i = 0
+    while i < positive:
+        short = min(width, height)
+        start = i
+        row_sum, row_min, row_max, worst = 0.0, math.inf, 0.0, math.inf
+        while i < positive:
+            a = scaled[i]
+            s = row_sum + a
+            mn, mx = min(row_min, a), max(row_max, a)
+            ratio = max(short * short * mx / (s * s), s * s / (short * short * mn))
+            if i > start and ratio > worst:
+                break
+            row_sum, row_min, row_max, worst = s, mn, mx, ratio
+            i += 1
+
+        last_row = i >= positive
+        if width >= height:
+            # lay the row out as a column on the left edge
+            thick = width if last_row else row_sum / height
+            cursor = y
+            for k in range(start, i):
+                step = scaled[k] / thick
+                rects[order[k]] = (x, cursor, x + thick, cursor + step)
+                cursor += step
+            rects[order[i - 1], 3] = y + height
+            x += thick
+            width -= thick
+        else:
+            # lay the row out along the bottom edge
+            thick = height if last_row else row_sum / width
+            cursor = x
+            for k in range(start, i):
+                step = scaled[k] / thick
+                rects[order[k]] = (cursor, y, cursor + step, y + thick)
+                cursor += step
+            rects[order[i - 1], 2] = x + width
+            y += thick
+            height -= thick
+
+    for k in range(positive, n):
+        rects[order[k]] = (x, y, x, y)
+    return rects
+
+
+def partition_field(area_shares_pct: Sequence[float], plot_length: float, plot_width: float) -> np.ndarray:
+    """Contiguous crop plots covering the plot_width × plot_length field (meters), sized by area share.
+
+    Returns an (n, 4) array of [x0, y0, x1, y1] with x along the width and y along the length.
+    """
+    return squarify(area_shares_pct, 0.0, 0.0, float(plot_width), float(plot_length))
+
+
+def rect_polygons(rects: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Closed outlines for many rectangles as flat x/y arrays separated by NaN (one fill trace)."""
+    x0, y0, x1, y1 = rects.T
+    nan = np.full(len(rects), np.nan)
+    xs = np.column_stack([x0, x1, x1, x0, x0, nan]).ravel()
+    ys = np.column_stack([y0, y0, y1, y1, y0, nan]).ravel()
+    return xs, ys
@@ -1,28 +1,194 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import bisect
 import os
-from typing import List, Dict, Optional, Any
+from typing import Iterable, Iterator, List, Dict, Mapping, Optional, Any, Sequence, Union
 
 import numpy as np
 import pandas as pd
 
+from catalog import MARKET_WEIGHT, CropCatalog, top_k_indices
+from features import FeatureStore
+from geo import SiteLocator
+from soil_grid import HEADER_FILE, SoilGrid
+from tracing import traced
+from yield_model import YieldModel, formula_yield, load_yield_model, yield_features
 
-@dataclass
-class Recommendation:
-    crop: str
-    score: float
-    expected_yield_t_ha: float
-    expected_revenue_per_ha: float
-    area_share_pct: float
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow export is optional
+    pa = None
+
+
+RECOMMENDATION_FIELDS = ("crop", "score", "expected_yield_t_ha", "expected_revenue_per_ha", "area_share_pct")
+RECOMMENDATION_DTYPE = np.dtype([
+    ("farm_id", np.int64),
+    ("crop_code", np.int32),
+    ("score", np.float64),
+    ("expected_yield_t_ha", np.float64),
+    ("expected_revenue_per_ha", np.float64),
+    ("area_share_pct", np.float64),
+])
 
 
-def _scale_01(value: float, min_v: float, max_v: float) -> float:
-    if max_v == min_v:
-        return 0.0
-    return float(np.clip((value - min_v) / (max_v - min_v), 0.0, 1.0))
+def _row_field(name: str) -> property:
+    def get(self: "Recommendation") -> float:
+        return float(self._batch.rows[name][self._row])
 
+    def set(self: "Recommendation", value: float) -> None:
+        self._batch.rows[name][self._row] = value
 
+    return property(get, set)
+
+
+class Recommendation:
+    """One recommended crop: a view of one row of a RecommendationBatch.
+
+    Built from keyword fields, as the former dataclass was, it wraps a one-row batch.
+    """
+
+    __slots__ = ("_batch", "_row")
+
+    def __init__(self, crop: str, score: float, expected_yield_t_ha: float, expected_revenue_per_ha: float,
+                 area_share_pct: float):
+        self._batch = RecommendationBatch.from_columns([crop], [score], [expected_yield_t_ha],
+                                                       [expected_revenue_per_ha], [area_share_pct])
+        self._row = 0
+
+    @classmethod
+    def _view(cls, batch: "RecommendationBatch", row: int) -> "Recommendation":
+        rec = cls.__new__(cls)
+        rec._batch, rec._row = batch, row
+        return rec
+
+    @property
+    def crop(self) -> str:
+        return self._batch.crop_names[self._batch.rows["crop_code"][self._row]]
+
+    score = _row_field("score")
+    expected_yield_t_ha = _row_field("expected_yield_t_ha")
+    expected_revenue_per_ha = _row_field("expected_revenue_per_ha")
+    area_share_pct = _row_field("area_share_pct")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in RECOMMENDATION_FIELDS}
+
+    def __repr__(self) -> str:
+        return "Recommendation(" + ", ".join(f"{k}={v!r}" for k, v in self.to_dict().items()) + ")"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Recommendation):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+
+class RecommendationBatch:
+    """Recommendations for one or many farms, stored as a NumPy structured array (RECOMMENDATION_DTYPE).
+
+    Each row takes 44 bytes. Crop names are stored once in `crop_names` and rows refer to
+    them by crop_code. Rows are grouped by farm in ascending farm_id order, so farm() is a
+    binary search plus a slice. columns() and to_pandas() share memory with `rows`.
+    Iterating or indexing yields Recommendation views, so code written for the former
+    list of dataclasses keeps working.
+    """
+
+    __slots__ = ("rows", "crop_names")
+
+    def __init__(self, rows: np.ndarray, crop_names: Sequence[str]):
+        self.rows = rows
+        self.crop_names = np.asarray(crop_names, dtype=object)
+
+    @classmethod
+    def from_columns(cls, crops: Sequence[str], score, expected_yield_t_ha, expected_revenue_per_ha,
+                     area_share_pct, farm_id: int = 0) -> "RecommendationBatch":
+        """One farm's recommendations, in the given (ranked) order."""
+        crop = pd.Categorical(crops)
+        rows = np.empty(len(crop), dtype=RECOMMENDATION_DTYPE)
+        rows["farm_id"] = farm_id
+        rows["crop_code"] = crop.codes
+        rows["score"] = score
+        rows["expected_yield_t_ha"] = expected_yield_t_ha
+        rows["expected_revenue_per_ha"] = expected_revenue_per_ha
+        rows["area_share_pct"] = area_share_pct
+        return cls(rows, crop.categories.to_numpy(dtype=object))
+
+    @classmethod
+    def from_records(cls, records: Sequence[Mapping[str, Any]], farm_id: int = 0) -> "RecommendationBatch":
+        """From to_records()/to_dict() output, e.g. recommendations stored as JSON."""
+        return cls.from_columns(*([r[name] for r in records] for name in RECOMMENDATION_FIELDS), farm_id=farm_id)
+
+    @classmethod
+    def concat(cls, batches: Sequence["RecommendationBatch"],
+               farm_ids: Optional[Sequence[int]] = None) -> "RecommendationBatch":
+        """One batch from several; with `farm_ids` (ascending), batch i becomes farm farm_ids[i]."""
+        if not batches:
+            return cls(np.zeros(0, dtype=RECOMMENDATION_DTYPE), [])
+        rows = np.concatenate([b.rows for b in batches])
+        lengths = [len(b) for b in batches]
+        # every batch's names stacked, then one lookup from stacked position to merged code
+        stacked = np.concatenate([b.crop_names for b in batches])
+        names = pd.Index(stacked).unique()
+        first_name = np.cumsum([0] + [len(b.crop_names) for b in batches[:-1]])
+        rows["crop_code"] = names.get_indexer(stacked)[np.repeat(first_name, lengths) + rows["crop_code"]]
+        if farm_ids is not None:
+            rows["farm_id"] = np.repeat(farm_ids, lengths)
+        return cls(rows, names.to_numpy(dtype=object))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[Recommendation]:
+        return (Recommendation._view(self, i) for i in range(len(self.rows)))
+
+    def __getitem__(self, key: Union[int, slice, np.ndarray]) -> Union[Recommendation, "RecommendationBatch"]:
+        if isinstance(key, (int, np.integer)):
+            return Recommendation._view(self, range(len(self.rows))[key])
+        return RecommendationBatch(self.rows[key], self.crop_names)
+
+    def __repr__(self) -> str:
+        return f"RecommendationBatch({len(self)} rows, {len(self.farm_ids)} farms)"
+
+    @property
+    def farm_ids(self) -> np.ndarray:
+        return np.unique(self.rows["farm_id"])
+
+    @property
+    def crops(self) -> np.ndarray:
+        return self.crop_names[self.rows["crop_code"]]
+
+    def farm(self, farm_id: int) -> "RecommendationBatch":
+        """Rows of one farm, as a view."""
+        # bisect reads the strided field in place; np.searchsorted would first copy it
+        ids = self.rows["farm_id"]
+        return self[bisect.bisect_left(ids, farm_id):bisect.bisect_right(ids, farm_id)]
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Field name -> 1-D view of that field (strided into the structured array, no copy)."""
+        return {name: self.rows[name] for name in RECOMMENDATION_DTYPE.names}
+
+    def to_pandas(self) -> pd.DataFrame:
+        """DataFrame whose numeric columns are views of `rows`; crop is a categorical on crop_names."""
+        columns = self.columns()
+        codes = columns.pop("crop_code")
+        crop = pd.Categorical.from_codes(codes, categories=pd.Index(self.crop_names, dtype=object))
+        return pd.DataFrame({"farm_id": columns.pop("farm_id"), "crop": crop, **columns}, copy=False)
+
+    def to_arrow(self):
+        """pyarrow Table; crop becomes a dictionary column. Arrow columns are contiguous, so each field is copied once."""
+        if pa is None:
+            raise RuntimeError("Arrow export needs pyarrow (pip install pyarrow)")
+        columns = self.columns()
+        crop = pa.DictionaryArray.from_arrays(pa.array(columns.pop("crop_code")), pa.array(self.crop_names, pa.string()))
+        return pa.table({"farm_id": columns.pop("farm_id"), "crop": crop, **columns})
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Plain dicts in RECOMMENDATION_FIELDS order, as stored in recommendation_runs."""
+        return [rec.to_dict() for rec in self]
+
+
+@traced("logic.compute_scores")
 def compute_scores(
     region: str,
     season: str,
@@ -34,112 +200,60 @@ def compute_scores(
     diversity_weight: float = 0.15,
     soil_override: Optional[Dict[str, Any]] = None,
     extra_rain_mm: float = 0.0,
+    features: Optional[FeatureStore] = None,
+    climate_override: Optional[Dict[str, float]] = None,
+    catalog: Optional[CropCatalog] = None,
+    supply_factor: Optional[Mapping[str, float]] = None,
 ) -> pd.DataFrame:
-    soil = soil_df.loc[soil_df["region"] == region].iloc[0].copy()
-    climate = climate_df.loc[(climate_df["region"] == region) & (climate_df["season"] == season)].iloc[0].copy()
-    region_row = regions_df.loc[regions_df["region"] == region].iloc[0]
-
-    # apply optional user overrides
-    if soil_override is not None:
-        if "ph" in soil_override and soil_override["ph"] is not None:
-            soil["ph"] = float(soil_override["ph"])
-        if "drainage" in soil_override and soil_override["drainage"]:
-            soil["drainage"] = str(soil_override["drainage"])  # expected values: poor/moderate/well
-        if "organic_matter_pct" in soil_override and soil_override["organic_matter_pct"] is not None:
-            soil["organic_matter_pct"] = float(soil_override["organic_matter_pct"])
-    if extra_rain_mm:
-        climate["forecast_rain_mm"] = float(climate["forecast_rain_mm"]) + float(extra_rain_mm)
-
-    def ph_fit(row: pd.Series) -> float:
-        ideal_min, ideal_max = row["ideal_ph_min"], row["ideal_ph_max"]
-        if soil["ph"] < ideal_min:
-            return _scale_01(soil["ph"], ideal_min - 1.5, ideal_min)
-        if soil["ph"] > ideal_max:
-            return _scale_01(ideal_max, ideal_max, soil["ph"] + 1.5)
-        # inside range → closer to center is better
-        center = (ideal_min + ideal_max) / 2.0
-        half = (ideal_max - ideal_min) / 2.0
-        if half == 0:
-            return 0.0
-        return 1.0 - abs(soil["ph"] - center) / half
-
-    def drainage_fit(row: pd.Series) -> float:
-        pref = row["drainage_pref"]
-        actual = soil["drainage"]
-        if pref == actual:
-            return 1.0
-        if {pref, actual} == {"moderate", "well"}:
-            return 0.7
-        if {pref, actual} == {"moderate", "poor"}:
-            return 0.6
-        return 0.4
-
-    def water_fit(row: pd.Series) -> float:
-        need = float(row["water_need_mm"])
-        have = float(climate["forecast_rain_mm"])
-        # linear penalty for mismatch
-        ratio = have / max(need, 1.0)
-        if ratio >= 1:
-            return _scale_01(min(ratio, 1.5), 1.0, 1.5)
-        return _scale_01(ratio, 0.4, 1.0)
-
-    def temp_fit(row: pd.Series) -> float:
-        t = float(climate["forecast_temp_c"])
-        tmin, tmax = float(row["heat_tolerance_c_min"]), float(row["heat_tolerance_c_max"])
-        if t < tmin:
-            return _scale_01(t, tmin - 10, tmin)
-        if t > tmax:
-            return _scale_01(tmax, tmax, t + 10)
-        center = (tmin + tmax) / 2.0
-        half = (tmax - tmin) / 2.0
-        if half == 0:
-            return 0.0
-        return 1.0 - abs(t - center) / half
-
-    def market_fit(row: pd.Series) -> float:
-        price = float(row["price_per_ton"]) * float(region_row["market_index"])
-        # demand-supply adjustment (if provided)
-        pressure = 1.0
-        if market_df is not None:
-            mrow = market_df.loc[(market_df["region"] == region) & (market_df["crop"] == row["crop"])].head(1)
-            if not mrow.empty:
-                demand = float(mrow.iloc[0]["demand_index"])  # higher is better
-                supply = float(mrow.iloc[0]["supply_index"])  # higher reduces margin
-                # price pressure factor: sigmoid of demand/supply ratio
-                ratio = demand / max(supply, 1e-6)
-                pressure = 1.0 / (1.0 + np.exp(-(ratio - 1.0) * 2.0))  # 0..1
-        # scale price among available crops, then modulate by pressure
-        pmin, pmax = crops_df["price_per_ton"].min(), crops_df["price_per_ton"].max()
-        return _scale_01(price, pmin, pmax) * pressure
-
-    df = crops_df.copy()
-    df["soil_ph_score"] = df.apply(ph_fit, axis=1)
-    df["drainage_score"] = df.apply(drainage_fit, axis=1)
-    df["water_score"] = df.apply(water_fit, axis=1)
-    df["temp_score"] = df.apply(temp_fit, axis=1)
-    df["market_score"] = df.apply(market_fit, axis=1)
-
-    # base suitability: emphasize agronomy, then market
-    df["base_score"] = (
-        0.25 * df["soil_ph_score"]
-        + 0.20 * df["drainage_score"]
-        + 0.20 * df["water_score"]
-        + 0.20 * df["temp_score"]
-        + 0.15 * df["market_score"]
+    if features is None:
+        # ad-hoc frames: build a throwaway store (load_data provides a shared one)
+        features = FeatureStore(soil_df, climate_df, regions_df)
+
+    if catalog is None or not catalog.matches(crops_df, market_df):
+        catalog = CropCatalog(crops_df, market_df)
+
+    # user/GPS overrides (drainage expected as poor/moderate/well) are patched into a copy
+    vec = features.vector(region, season, soil_override, extra_rain_mm, climate_override)
+    scores = catalog.score(
+        region,
+        ph=float(vec["ph"]),
+        drainage=int(vec["drainage"]),
+        forecast_temp=float(vec["forecast_temp_c"]),
+        forecast_rain=float(vec["forecast_rain_mm"]),
+        market_index=float(vec["market_index"]),
+        # planting-intention feedback (supply.SupplyEstimator): crop -> supply index multiplier
+        supply_factor=supply_factor,
     )
 
     # diversity encouragement: reduce score if many in same group later
     # We will compute area shares after ranking and then apply a group penalty
-    return df
+    # (score columns are attached without copying crops_df: copy before mutating crop columns)
+    return pd.concat([crops_df, pd.DataFrame(scores, index=crops_df.index)], axis=1, copy=False)
 
 
+def expected_economics(scored_df: pd.DataFrame, yield_model: Optional[YieldModel] = None,
+                       site: Optional[Mapping[str, Any]] = None) -> tuple[np.ndarray, np.ndarray]:
+    """Expected yield (t/ha) and revenue per ha for scored crops (learned yields when a model and site are given)."""
+    if yield_model is not None and site is not None:
+        expected_yield = yield_model.predict(yield_features(scored_df, site))
+    else:
+        expected_yield = formula_yield(scored_df)
+    region_price = scored_df["price_per_ton"].to_numpy()
+    return expected_yield, expected_yield * region_price
+
+
+@traced("logic.diversify_portfolio")
 def diversify_portfolio(
     scored_df: pd.DataFrame,
     max_crops: int = 5,
     group_min_spread: float = 0.15,
     diversity_weight: float = 0.15,
-) -> List[Recommendation]:
-    df = scored_df.sort_values("base_score", ascending=False).head(max_crops).reset_index(drop=True)
+    yield_model: Optional[YieldModel] = None,
+    site: Optional[Mapping[str, Any]] = None,
+) -> RecommendationBatch:
+    # only the top rows are ordered, large catalogs are never fully sorted
+    top = top_k_indices(scored_df["base_score"].to_numpy(), max_crops)
+    df = scored_df.iloc[top].reset_index(drop=True)
 
     # initial area shares proportional to score
     weights = df["base_score"].to_numpy()
@@ -165,26 +279,32 @@ def diversify_portfolio(
         shares = shares / shares.sum()
 
     # compute economics
-    expected_yield = df["base_yield_t_ha"].to_numpy() * (0.7 + 0.6 * df["temp_score"].to_numpy()) * (
-        0.7 + 0.6 * df["water_score"].to_numpy()
+    expected_yield, expected_revenue = expected_economics(df, yield_model, site)
+
+    return RecommendationBatch.from_columns(
+        df["crop"].astype(str).to_numpy(),
+        df["base_score"].to_numpy(dtype=float),
+        expected_yield,
+        expected_revenue,
+        shares * 100.0,
     )
-    region_price = df["price_per_ton"].to_numpy()
-    expected_revenue = expected_yield * region_price
-
-    results: List[Recommendation] = []
-    for i, row in df.iterrows():
-        results.append(
-            Recommendation(
-                crop=str(row["crop"]),
-                score=float(row["base_score"]),
-                expected_yield_t_ha=float(expected_yield[i]),
-                expected_revenue_per_ha=float(expected_revenue[i]),
-                area_share_pct=float(shares[i] * 100.0),
-            )
-        )
-    return results
 
 
+def market_dependencies(scored_df: pd.DataFrame, recs: Iterable[Recommendation]) -> List[str]:
+    """Crops whose market data can change this recommendation.
+    
+    The recommended crops (their scores set the area shares) plus every crop close enough
+    to the last recommended score that a market change could lift it into the top picks.
+    """
+    recs = list(recs)
+    if not recs:
+        return []
+    cutoff = min(r.score for r in recs) - MARKET_WEIGHT
+    near = scored_df.loc[scored_df["base_score"].to_numpy() >= cutoff, "crop"]
+    return sorted(set(near) | {r.crop for r in recs})
+
+
+@traced("logic.load_data")
 def load_data(base_path: str) -> Dict[str, pd.DataFrame]:
     crops = pd.read_csv(f"{base_path}/data/crops.csv")
     regions = pd.read_csv(f"{base_path}/data/regions.csv")
@@ -192,16 +312,33 @@ def load_data(base_path: str) -> Dict[str, pd.DataFrame]:
     climate = pd.read_csv(f"{base_path}/data/climate.csv")
     market_path = f"{base_path}/data/market.csv"
     market = pd.read_csv(market_path) if os.path.exists(market_path) else None
-    return {"crops": crops, "regions": regions, "soil": soil, "climate": climate, "market": market}
+    features = FeatureStore(soil, climate, regions)
+    catalog = CropCatalog(crops, market)
+    # None unless a trained artifact exists (see yield_model.py)
+    yield_model = load_yield_model(os.path.abspath(f"{base_path}/models"))
+    # georeferenced sample points are optional; without them GPS lookup is unavailable
+    soil_points_path = f"{base_path}/data/soil_points.csv"
+    climate_points_path = f"{base_path}/data/climate_points.csv"
+    geo = None
+    if os.path.exists(soil_points_path):
+        climate_points = pd.read_csv(climate_points_path) if os.path.exists(climate_points_path) else None
+        geo = SiteLocator(pd.read_csv(soil_points_path), climate_points)
+    # rasters are memory-mapped, so opening one costs nothing until it is queried
+    soil_grid_path = f"{base_path}/data/soil_grid"
+    soil_grid = SoilGrid.open(soil_grid_path) if os.path.exists(f"{soil_grid_path}/{HEADER_FILE}") else None
+    return {"crops": crops, "regions": regions, "soil": soil, "climate": climate, "market": market,
+            "features": features, "catalog": catalog, "geo": geo, "soil_grid": soil_grid,
+            "yield_model": yield_model}
 
 
 # Simple, rule-based disease risk assessment per crop using climate/soil
+@traced("logic.disease_warnings_for_crop")
 def disease_warnings_for_crop(
     crop: str,
     region: str,
     season: str,
-    soil_row: pd.Series,
-    climate_row: pd.Series,
+    soil_row: Mapping[str, Any],
+    climate_row: Mapping[str, Any],
     irrigation: str = "rainfed",
     user_flags: Optional[Dict[str, bool]] = None,
 ) -> List[Dict[str, str]]:
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from price_cache import to_day
+
+
+# EWMA horizons, in observations (alpha = 2 / (span + 1), as pandas' ewm(span=...))
+EWMA_SPANS: Tuple[int, ...] = (7, 30, 90)
+SHORT_SPAN, LONG_SPAN = EWMA_SPANS[0], EWMA_SPANS[-1]
+# horizon of the exponentially weighted return variance
+VOLATILITY_SPAN = 30
+# |momentum| above this (percent) is reported as an up/down trend
+TREND_THRESHOLD_PCT = 5.0
+
+STATS_COLUMNS = (
+    ["count", "last_price", "last_day"]
+    + [f"ewma_{span}" for span in EWMA_SPANS]
+    + ["ret_mean", "ret_var"]
+)
+
+
+def _alpha(span: int) -> float:
+    return 2.0 / (span + 1.0)
+
+
+@dataclass
+class MarketStats:
+    """Online price statistics for one (region, district, crop), updated in O(1) per quote.
+
+    Keeps EWMAs over several horizons and an exponentially weighted mean/variance of
+    log returns (the weighted form of Welford's update). Quotes dated before the newest
+    one seen only bump `count`; rebuild from history after back-filling old prices.
+    """
+
+    count: int = 0
+    last_price: float = 0.0
+    last_day: Optional[int] = None
+    ewma: Dict[int, float] = field(default_factory=dict)
+    ret_mean: float = 0.0
+    ret_var: float = 0.0
+
+    def update(self, price: float, price_date) -> None:
+        day = to_day(price_date)
+        price = float(price)
+        self.count += 1
+        if self.last_day is not None and day < self.last_day:
+            return
+        if self.last_day is None or not self.ewma:
+            self.ewma = {span: price for span in EWMA_SPANS}
+        else:
+            for span in EWMA_SPANS:
+                self.ewma[span] += _alpha(span) * (price - self.ewma[span])
+            if self.last_price > 0 and price > 0:
+                r = math.log(price / self.last_price)
+                a = _alpha(VOLATILITY_SPAN)
+                diff = r - self.ret_mean
+                incr = a * diff
+                self.ret_mean += incr
+                self.ret_var = (1.0 - a) * (self.ret_var + diff * incr)
+        self.last_price = price
+        self.last_day = day
+
+    @property
+    def momentum_pct(self) -> float:
+        """Short EWMA relative to long EWMA, in percent."""
+        long = self.ewma.get(LONG_SPAN, 0.0)
+        return (self.ewma[SHORT_SPAN] / long - 1.0) * 100 if long > 0 else 0.0
+
+    @property
+    def volatility_pct(self) -> float:
+        """Standard deviation of per-quote log returns, in percent."""
+        return math.sqrt(max(self.ret_var, 0.0)) * 100
+
+    def trend(self) -> str:
+        momentum = self.momentum_pct
+        return 'up' if momentum > TREND_THRESHOLD_PCT else 'down' if momentum < -TREND_THRESHOLD_PCT else 'stable'
+
+    def to_row(self) -> Tuple[Any, ...]:
+        return (
+            (self.count, self.last_price, self.last_day)
+            + tuple(self.ewma.get(span) for span in EWMA_SPANS)
+            + (self.ret_mean, self.ret_var)
+        )
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "MarketStats":
+        values = dict(zip(STATS_COLUMNS, row))
+        ewma = {span: values[f"ewma_{span}"] for span in EWMA_SPANS if values[f"ewma_{span}"] is not None}
+        return cls(
+            count=values["count"],
+            last_price=values["last_price"],
+            last_day=values["last_day"],
+            ewma=ewma,
+            ret_mean=values["ret_mean"],
+            ret_var=values["ret_var"],
+        )
@@ -0,0 +1,101 @@
+"""District dashboard: planned crop area and expected revenue per district and season.
+
+Figures come from the district_crop_summary table, which FarmerDatabase keeps current as
+farmers save their selections, so the page does not scan crop_selections on rerun.
+"""
+import os
+import time
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from database import FarmerDatabase
+from tracing import span
+
+
+st.set_page_config(page_title="District Dashboard", layout="wide")
+
+
+@st.cache_resource(show_spinner=False)
+def get_database():
+    return FarmerDatabase()
+
+
+@st.cache_data(show_spinner=False)
+def crop_groups(base_path):
+    crops = pd.read_csv(os.path.join(base_path, "data", "crops.csv"))
+    return dict(zip(crops["crop"], crops["group"]))
+
+
+db = get_database()
+groups = crop_groups(os.getcwd())
+
+st.title("📊 District Dashboard")
+st.caption("Planned area and expected revenue from the crop selections farmers have saved")
+
+started = time.perf_counter()
+with span("dashboard.query"):
+    everything = db.get_district_summary()
+
+if everything.empty:
+    st.info("No crop selections have been saved yet.")
+    st.stop()
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    region = st.selectbox("Region", ["All"] + sorted(everything["region"].unique()))
+with col2:
+    districts = everything if region == "All" else everything[everything["region"] == region]
+    district = st.selectbox("District", ["All"] + sorted(districts["district"].unique()))
+with col3:
+    seasons = sorted(s for s in everything["season"].unique() if s)
+    season = st.selectbox("Season", ["All"] + seasons)
+
+with span("dashboard.query"):
+    summary = db.get_district_summary(
+        None if region == "All" else region,
+        None if district == "All" else district,
+        None if season == "All" else season,
+    )
+query_ms = (time.perf_counter() - started) * 1e3
+summary = summary.assign(group=summary["crop_name"].map(groups).fillna("other"))
+
+m1, m2, m3 = st.columns(3)
+m1.metric("Planned area", f"{summary['planned_area_ha'].sum():,.1f} ha")
+m2.metric("Expected revenue", f"₹{summary['expected_revenue'].sum():,.0f}")
+m3.metric("Crops planned", summary["crop_name"].nunique())
+
+by_crop = (summary.groupby(["crop_name", "group"], as_index=False)[["farmers", "planned_area_ha", "expected_revenue"]]
+           .sum().sort_values("planned_area_ha", ascending=False))
+by_group = (summary.groupby("group", as_index=False)[["planned_area_ha", "expected_revenue"]]
+            .sum().sort_values("planned_area_ha", ascending=False))
+
+left, right = st.columns([3, 2])
+with left:
+    st.subheader("Planned area by crop")
+    fig = px.bar(by_crop, x="crop_name", y="planned_area_ha", color="group",
+                 labels={"crop_name": "Crop", "planned_area_ha": "Area (ha)", "group": "Group"})
+    st.plotly_chart(fig, use_container_width=True)
+    # farmers counts a farmer once per crop, so it is not summed across crops
+    st.dataframe(by_crop.rename(columns={
+        "crop_name": "Crop", "group": "Group", "farmers": "Farmers",
+        "planned_area_ha": "Area (ha)", "expected_revenue": "Expected revenue (₹)",
+    }).round(1), use_container_width=True, hide_index=True)
+with right:
+    st.subheader("By crop group")
+    st.dataframe(by_group.rename(columns={
+        "group": "Group", "planned_area_ha": "Area (ha)", "expected_revenue": "Expected revenue (₹)",
+    }).round(1), use_container_width=True, hide_index=True)
+
+if district == "All":
+    st.subheader("By district and season")
+    by_district = (summary.groupby(["region", "district", "season"], as_index=False)
+                   [["planned_area_ha", "expected_revenue"]].sum())
+    by_district["season"] = by_district["season"].replace("", "—")
+    st.dataframe(by_district.rename(columns={
+        "region": "Region", "district": "District", "season": "Season",
+        "planned_area_ha": "Area (ha)", "expected_revenue": "Expected revenue (₹)",
+    }).round(1), use_container_width=True, hide_index=True)
+
+st.caption(f"Summary queries took {query_ms:.1f} ms")
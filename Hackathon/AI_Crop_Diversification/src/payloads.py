@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+import zlib
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Union
+
+
+# payloads whose compact JSON is at least this many bytes are stored zlib-compressed
+COMPRESS_THRESHOLD = 1024
+
+# keys recognised when projecting crop shares out of a plan/layout payload
+_CROP_LISTS = ("crops", "selected_crops", "plots")
+_CROP_NAME_KEYS = ("crop_name", "crop", "name")
+_CROP_SHARE_KEYS = ("area_percentage", "area_share_pct", "area_share", "share")
+
+StoredPayload = Union[str, bytes, None]
+
+
+def encode_payload(value: Any, threshold: int = COMPRESS_THRESHOLD) -> StoredPayload:
+    """Compact JSON text, or a zlib BLOB when that is large enough to be worth compressing."""
+    if value is None:
+        return None
+    text = json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+    raw = text.encode("utf-8")
+    if len(raw) >= threshold:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return packed
+    return text
+
+
+def decode_payload(stored: StoredPayload) -> Any:
+    if stored is None:
+        return None
+    if isinstance(stored, (bytes, memoryview)):
+        stored = zlib.decompress(stored).decode("utf-8")
+    return json.loads(stored)
+
+
+class LazyPayload(Mapping):
+    """Read-only mapping over a stored payload that is only decompressed/parsed on first access."""
+
+    __slots__ = ("raw", "_value")
+
+    def __init__(self, raw: StoredPayload):
+        self.raw = raw
+        self._value = None
+
+    @property
+    def value(self) -> Any:
+        if self._value is None and self.raw is not None:
+            self._value = decode_payload(self.raw)
+        return self._value
+
+    def __getitem__(self, key):
+        return (self.value or {})[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.value or {})
+
+    def __len__(self) -> int:
+        return len(self.value or {})
+
+    def __repr__(self) -> str:
+        state = "decoded" if self._value is not None else f"{len(self.raw or '')} bytes"
+        return f"LazyPayload({state})"
+
+
+def _crop_shares(payload: Any) -> Dict[str, float]:
+    shares: Dict[str, float] = {}
+    if not isinstance(payload, dict):
+        return shares
+    for list_key in _CROP_LISTS:
+        items = payload.get(list_key)
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            name = next((item[k] for k in _CROP_NAME_KEYS if k in item), None)
+            share = next((item[k] for k in _CROP_SHARE_KEYS if k in item), None)
+            if isinstance(name, str) and isinstance(share, (int, float)):
+                shares[name] = shares.get(name, 0.0) + float(share)
+        if shares:
+            break
+    return shares
+
+
+def payload_meta(payload: Any) -> Optional[str]:
+    """Small, always-uncompressed JSON projection of the fields queried in SQL.
+
+    {"crop_shares": {crop: pct}, "primary_crop", "primary_share", "crop_count"}; generated
+    columns and json_each() read this instead of the (possibly compressed) payload.
+    """
+    shares = _crop_shares(payload)
+    if not shares:
+        return None
+    primary = max(shares, key=shares.get)
+    return json.dumps({
+        "crop_shares": {k: round(v, 4) for k, v in shares.items()},
+        "primary_crop": primary,
+        "primary_share": round(shares[primary], 4),
+        "crop_count": len(shares),
+    }, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import datetime
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+SeriesKey = Tuple[str, str, str]  # (region, district, crop_name)
+
+PRICE_COLUMNS = ["region", "district", "crop_name", "price_per_ton", "price_date", "source"]
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day(value) -> int:
+    """Days since 1970-01-01 for a date, datetime or ISO string."""
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value[:10])
+    elif isinstance(value, datetime.datetime):
+        value = value.date()
+    return (value - _EPOCH).days
+
+
+def utc_today() -> int:
+    # SQLite's date('now') is UTC; the cache uses the same clock so windows match
+    return to_day(datetime.datetime.now(datetime.timezone.utc).date())
+
+
+class PriceSeries:
+    """Bounded, date-ordered price history for one (region, district, crop).
+
+    Values live in contiguous NumPy buffers of twice the capacity; appends write at the
+    end and, when the buffer is full, the newest `capacity` rows are shifted to the front
+    (amortised O(1)). Reads are therefore always slices (views), never copies.
+    """
+
+    __slots__ = ("capacity", "days", "prices", "sources", "start", "end", "evicted_through")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.days = np.empty(2 * capacity, dtype=np.int32)
+        self.prices = np.empty(2 * capacity, dtype=np.float64)
+        self.sources = np.empty(2 * capacity, dtype=np.int16)
+        self.start = 0
+        self.end = 0
+        # newest day that has been dropped from the buffer (-inf when nothing was dropped)
+        self.evicted_through = np.iinfo(np.int32).min
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def append(self, day: int, price: float, source: int) -> None:
+        if day <= self.evicted_through:
+            # older than what the buffer still holds; SQLite remains the source for that range
+            return
+        if self.end > self.start and day < self.days[self.end - 1]:
+            self._insert_sorted(day, price, source)
+            return
+        if self.end == len(self.days):
+            self._compact()
+        self.days[self.end] = day
+        self.prices[self.end] = price
+        self.sources[self.end] = source
+        self.end += 1
+        if self.end - self.start > self.capacity:
+            self.evicted_through = max(self.evicted_through, int(self.days[self.start]))
+            self.start += 1
+
+    def _compact(self) -> None:
+        n = self.end - self.start
+        for buf in (self.days, self.prices, self.sources):
+            buf[:n] = buf[self.start:self.end]
+        self.start, self.end = 0, n
+
+    def _insert_sorted(self, day: int, price: float, source: int) -> None:
+        # late-arriving quote: rare, so an O(capacity) insert is fine
+        days, prices, sources = self.view()
+        pos = int(np.searchsorted(days, day, side="right"))
+        merged = (
+            np.insert(days, pos, day),
+            np.insert(prices, pos, price),
+            np.insert(sources, pos, source),
+        )
+        self.start, self.end = 0, 0
+        for d, p, s in zip(*merged):
+            self.append(int(d), float(p), int(s))
+
+    def view(self, since_day: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lo = self.start
+        if since_day is not None:
+            lo += int(np.searchsorted(self.days[self.start:self.end], since_day, side="left"))
+        return self.days[lo:self.end], self.prices[lo:self.end], self.sources[lo:self.end]
+
+    def covers(self, since_day: int) -> bool:
+        return since_day > self.evicted_through
+
+
+class PriceCache:
+    """In-process time-series cache over market_prices, one PriceSeries per (region, district, crop).
+
+    Only quotes dated on or after `loaded_since` are held; a query reaching further back,
+    or into a range a series has evicted, reports a miss so the caller can go to SQLite.
+    """
+
+    def __init__(self, capacity: int = 1024, loaded_since: int = 0):
+        self.capacity = capacity
+        self.loaded_since = loaded_since
+        self.series: Dict[SeriesKey, PriceSeries] = {}
+        self._source_codes: Dict[str, int] = {}
+        self._source_names: List[Optional[str]] = []
+        self._lock = threading.Lock()
+
+    def _source_code(self, source: Optional[str]) -> int:
+        code = self._source_codes.get(source)
+        if code is None:
+            code = self._source_codes[source] = len(self._source_names)
+            self._source_names.append(source)
+        return code
+
+    def add(self, region: str, district: str, crop_name: str, price: float, price_date, source: Optional[str]) -> None:
+        day = to_day(price_date)
+        if day < self.loaded_since:
+            return
+        with self._lock:
+            key = (region, district, crop_name)
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = PriceSeries(self.capacity)
+            series.append(day, float(price), self._source_code(source))
+
+    def load(self, rows: Iterable[Tuple[str, str, str, float, str, Optional[str]]]) -> int:
+        """Bulk-populate from (region, district, crop_name, price, price_date, source) rows in date order."""
+        n = 0
+        for region, district, crop_name, price, price_date, source in rows:
+            self.add(region, district, crop_name, price, price_date, source)
+            n += 1
+        return n
+
+    def query(self, region: Optional[str] = None, district: Optional[str] = None,
+              crop_name: Optional[str] = None, days: int = 30) -> Optional[pd.DataFrame]:
+        """Same rows and order as the market_prices SQL query, or None on a cache miss."""
+        since = utc_today() - days
+        if since < self.loaded_since:
+            return None
+        parts = []
+        with self._lock:
+            if region and district and crop_name:
+                key = (region, district, crop_name)
+                keys = [key] if key in self.series else []
+            else:
+                keys = [
+                    k for k in self.series
+                    if (not region or k[0] == region) and (not district or k[1] == district)
+                    and (not crop_name or k[2] == crop_name)
+                ]
+            for key in keys:
+                series = self.series[key]
+                if not series.covers(since):
+                    return None
+                d, p, s = series.view(since)
+                if len(d):
+                    parts.append((key, d.copy(), p.copy(), s.copy()))
+        if not parts:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+
+        day_arr = np.concatenate([d for _, d, _, _ in parts])
+        # newest first, then crop name (matches ORDER BY price_date DESC, crop_name)
+        crop_rank = {c: i for i, c in enumerate(sorted({k[2] for k, _, _, _ in parts}))}
+        ranks = np.concatenate([np.full(len(d), crop_rank[k[2]]) for k, d, _, _ in parts])
+        order = np.lexsort((ranks, -day_arr.astype(np.int64)))
+
+        source_names = np.array(self._source_names, dtype=object)
+        df = pd.DataFrame({
+            "region": np.concatenate([np.full(len(d), k[0], dtype=object) for k, d, _, _ in parts])[order],
+            "district": np.concatenate([np.full(len(d), k[1], dtype=object) for k, d, _, _ in parts])[order],
+            "crop_name": np.concatenate([np.full(len(d), k[2], dtype=object) for k, d, _, _ in parts])[order],
+            "price_per_ton": np.concatenate([p for _, _, p, _ in parts])[order],
+            "price_date": day_arr[order].astype("datetime64[D]").astype(str).astype(object),
+            "source": source_names[np.concatenate([s for _, _, _, s in parts])[order]],
+        })
+        return df
@@ -0,0 +1,145 @@
+"""Bulk import of mandi price dumps (Agmarknet-style CSV) into market_prices.
+
+Usage: python src/price_import.py dump.csv [more.csv ...] [--db farmer_data.db] [--chunksize 50000]
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+from database import FarmerDatabase
+
+
+# target field -> accepted (normalised) header names, first match wins
+AGMARKNET_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "region": ("region", "state", "state_name"),
+    "district": ("district", "district_name"),
+    "crop_name": ("crop_name", "commodity", "commodity_name"),
+    "price_date": ("price_date", "arrival_date", "reported_date"),
+    "market": ("market", "market_name"),
+    "source": ("source",),
+}
+# price header -> factor converting it to price per ton (Agmarknet quotes are per quintal)
+PRICE_COLUMNS: Tuple[Tuple[str, float], ...] = (
+    ("price_per_ton", 1.0),
+    ("modal_price", 10.0),
+    ("modal_price_rs_quintal", 10.0),
+)
+REQUIRED_FIELDS = ("region", "district", "crop_name", "price_date")
+
+
+@dataclass
+class ImportReport:
+    rows_read: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_read / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.rows_read} rows read, {self.inserted} inserted, {self.duplicates} duplicates, "
+                f"{self.rejected} rejected in {self.seconds:.1f}s ({self.rows_per_sec:,.0f} rows/s)")
+
+
+def _normalise(header: str) -> str:
+    header = header.replace("_x0020_", "_").strip().lower()
+    return re.sub(r"[^a-z0-9]+", "_", header).strip("_")
+
+
+def resolve_columns(headers: Iterable[str]) -> Tuple[Dict[str, str], str, float]:
+    """Map the dump's headers onto market_prices fields. Returns (field -> header, price header, unit factor)."""
+    by_name = {_normalise(h): h for h in headers}
+    mapping = {}
+    for target, candidates in AGMARKNET_COLUMNS.items():
+        for candidate in candidates:
+            if candidate in by_name:
+                mapping[target] = by_name[candidate]
+                break
+    missing = [f for f in REQUIRED_FIELDS if f not in mapping]
+    price = next(((by_name[c], factor) for c, factor in PRICE_COLUMNS if c in by_name), None)
+    if missing or price is None:
+        raise ValueError(f"Unrecognised price dump columns; missing {missing + ([] if price else ['price'])}")
+    return mapping, price[0], price[1]
+
+
+def map_chunk(chunk: pd.DataFrame, mapping: Dict[str, str], price_column: str, factor: float,
+              default_source: str) -> Tuple[pd.DataFrame, int]:
+    """Vectorised conversion of one raw chunk to market_prices rows. Returns (valid rows, rejected count)."""
+    out = pd.DataFrame({
+        field: chunk[mapping[field]].astype("string").str.strip() for field in ("region", "district", "crop_name")
+    })
+    prices = pd.to_numeric(chunk[price_column].astype("string").str.replace(",", "", regex=False), errors="coerce")
+    out["price_per_ton"] = prices * factor
+    # a dump holds few distinct dates: parse each once and broadcast back
+    codes, uniques = pd.factorize(chunk[mapping["price_date"]])
+    parsed = pd.to_datetime(pd.Series(uniques), format="mixed", dayfirst=True, errors="coerce").dt.strftime("%Y-%m-%d")
+    out["price_date"] = pd.Series(parsed.to_numpy(dtype=object), dtype=object).reindex(codes).to_numpy()
+    if "source" in mapping:
+        out["source"] = chunk[mapping["source"]].astype("string").fillna(default_source)
+    elif "market" in mapping:
+        # one quote per market and day; the market keeps same-day quotes in a district distinct
+        out["source"] = default_source + "/" + chunk[mapping["market"]].astype("string").str.strip().fillna("")
+    else:
+        out["source"] = default_source
+
+    valid = (
+        out[["region", "district", "crop_name", "price_date"]].notna().all(axis=1)
+        & (out[["region", "district", "crop_name"]] != "").all(axis=1)
+        & (out["price_per_ton"] > 0)
+    ).fillna(False).astype(bool)
+    return out[valid], int((~valid).sum())
+
+
+def import_price_dump(db: FarmerDatabase, path: str, chunksize: int = 50_000,
+                      default_source: str = "Agmarknet", report: Optional[ImportReport] = None) -> ImportReport:
+    """Stream a CSV dump into market_prices in batched, deduplicated transactions.
+
+    Statistics are updated once at the end, from the imported rows of the series they
+    touched rather than the whole table, and the price cache is reloaded.
+    """
+    report = report or ImportReport()
+    started = time.perf_counter()
+    mapping = price_column = factor = None
+    first_ids: Dict[tuple, int] = {}
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False, na_values=[""]):
+        if mapping is None:
+            mapping, price_column, factor = resolve_columns(chunk.columns)
+        rows, rejected = map_chunk(chunk, mapping, price_column, factor, default_source)
+        inserted, touched = db.bulk_add_market_prices(rows.itertuples(index=False, name=None))
+        for key, first_id in touched.items():
+            first_ids.setdefault(key, first_id)
+        report.rows_read += len(chunk)
+        report.rejected += rejected
+        report.inserted += inserted
+        report.duplicates += len(rows) - inserted
+    db.update_market_stats(first_ids)
+    if db.price_cache is not None:
+        db.load_price_cache()
+    report.seconds += time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import mandi price CSV dumps into market_prices")
+    parser.add_argument("paths", nargs="+", help="CSV dump(s) to import")
+    parser.add_argument("--db", default="farmer_data.db", help="Path to the SQLite database")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="Rows per batch/transaction")
+    parser.add_argument("--source", default="Agmarknet", help="Source label when the dump has no source column")
+    args = parser.parse_args()
+
+    db = FarmerDatabase(args.db, price_cache_days=None)
+    for path in args.paths:
+        print(f"{path}: {import_price_dump(db, path, args.chunksize, args.source)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Recompute only the stored recommendations that a market update makes stale.
+
+Usage: python src/propagation.py market_update.csv [--db farmer_data.db] [--workers 4] [--batch-size 50]
+
+Every stored run (recommendation_runs) lists the (region, season, crop) market inputs it
+depends on in run_dependencies: its recommended crops, and any crop that scores close
+enough to move into the top picks after a market change. A market update is compared
+with the current data. Runs that depend on a changed key are recomputed on a worker pool
+and written back in batches. Every other run of the old data version is moved to the
+new version unchanged.
+
+The update CSV has region, crop, demand_index and supply_index columns. Its rows replace
+or extend data/market.csv, which is rewritten after the stored runs are updated.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+import pandas as pd
+
+from catalog import CropCatalog
+from database import FarmerDatabase
+from logic import load_data, market_dependencies
+from reuse import FarmProfile, data_fingerprint, rescore
+from tracing import span, tracer
+
+
+MARKET_KEY = ["region", "crop"]
+MARKET_VALUES = ["demand_index", "supply_index"]
+ChangedKey = Tuple[Optional[str], str]  # (region, crop); region None means every region
+
+
+def market_changes(old: Mapping[str, Any], new: Mapping[str, Any]) -> Tuple[Set[ChangedKey], bool]:
+    """(changed (region, crop) keys, whether every run is affected) between two loaded datasets.
+
+    Demand/supply rows change one (region, crop). A crop price changes that crop in every
+    region, unless it moves the catalogue's price range: market scores are scaled by that
+    range, so every run is then affected, as it is for any non-market data change.
+    """
+    for name in ("regions", "soil", "climate"):
+        if not old[name].equals(new[name]):
+            return set(), True
+    if old.get("yield_model") is not new.get("yield_model"):
+        return set(), True
+    old_crops, new_crops = old["crops"], new["crops"]
+    if not old_crops.drop(columns="price_per_ton").equals(new_crops.drop(columns="price_per_ton")):
+        return set(), True
+
+    keys: Set[ChangedKey] = set()
+    old_price, new_price = old_crops["price_per_ton"], new_crops["price_per_ton"]
+    if old_price.min() != new_price.min() or old_price.max() != new_price.max():
+        return set(), True
+    keys.update((None, crop) for crop in new_crops.loc[old_price != new_price, "crop"])
+
+    def rows(data: Mapping[str, Any]) -> pd.DataFrame:
+        market = data.get("market")
+        if market is None:
+            return pd.DataFrame(columns=MARKET_KEY + MARKET_VALUES).set_index(MARKET_KEY)
+        # first row wins, as in CropCatalog
+        return market.drop_duplicates(MARKET_KEY).set_index(MARKET_KEY)[MARKET_VALUES].astype(float)
+
+    before, after = rows(old), rows(new)
+    both = before.index.intersection(after.index)
+    differs = (before.loc[both] != after.loc[both]).any(axis=1)
+    keys.update(both[differs.to_numpy()])
+    keys.update(before.index.symmetric_difference(after.index))
+    return keys, False
+
+
+def merge_market_update(market: Optional[pd.DataFrame], update: pd.DataFrame) -> pd.DataFrame:
+    """market.csv with the update's rows replacing matching (region, crop) rows and new rows appended."""
+    update = update.drop_duplicates(MARKET_KEY, keep="last")[MARKET_KEY + MARKET_VALUES]
+    if market is None:
+        return update.reset_index(drop=True)
+    merged = market.merge(update, on=MARKET_KEY, how="left", suffixes=("", "_new"))
+    for column in MARKET_VALUES:
+        merged[column] = merged.pop(f"{column}_new").combine_first(merged[column])
+    known = pd.MultiIndex.from_frame(market[MARKET_KEY])
+    added = update[~pd.MultiIndex.from_frame(update[MARKET_KEY]).isin(known)]
+    return pd.concat([merged[market.columns], added], ignore_index=True)
+
+
+@dataclass
+class WaveStats:
+    wave: int
+    changed_keys: int = 0
+    full: bool = False
+    affected: int = 0
+    carried: int = 0
+    recomputed: int = 0
+    failed: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    recompute_seconds: float = 0.0
+
+    def __str__(self) -> str:
+        scope = "all inputs" if self.full else f"{self.changed_keys} changed keys"
+        mean_ms = self.recompute_seconds * 1e3 / self.recomputed if self.recomputed else 0.0
+        return (f"wave {self.wave} ({scope}): {self.affected} runs affected, {self.recomputed} recomputed "
+                f"({mean_ms:.1f} ms each) in {self.batches} batches, {self.failed} failed, "
+                f"{self.carried} carried over unchanged; {self.seconds:.2f}s")
+
+
+class ChangePropagator:
+    """Applies market updates to stored runs: affected runs are recomputed, the rest re-versioned."""
+
+    def __init__(self, db: FarmerDatabase, workers: int = 4, batch_size: int = 50):
+        self.db = db
+        self.workers = workers
+        self.batch_size = batch_size
+        self.waves: List[WaveStats] = []
+
+    def apply(self, old_data: Mapping[str, Any], new_data: Mapping[str, Any]) -> WaveStats:
+        """Bring the runs stored for `old_data` up to date with `new_data`; returns the wave's counts."""
+        started = time.perf_counter()
+        with span("propagation.wave"):
+            keys, full = market_changes(old_data, new_data)
+            stats = WaveStats(len(self.waves) + 1, len(keys), full)
+            jobs = []
+            # runs scored with supply adjustments carry them in their data version
+            for supply_items in self.db.get_run_supply_states():
+                old_version = data_fingerprint(old_data, supply_items)
+                new_version = data_fingerprint(new_data, supply_items)
+                if old_version == new_version:
+                    continue
+                runs = self.db.get_dependent_runs(old_version, None if full else keys)
+                stats.carried += self.db.retag_recommendation_runs(old_version, new_version, [r["id"] for r in runs])
+                jobs.extend((run, supply_items, new_version) for run in runs)
+            stats.affected = len(jobs)
+            self._recompute_all(new_data, jobs, stats)
+        stats.seconds = time.perf_counter() - started
+        self.waves.append(stats)
+        return stats
+
+    def _recompute_all(self, data: Mapping[str, Any], jobs: list, stats: WaveStats) -> None:
+        traced_run = tracer.is_active()
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._recompute, data, run, supply_items, version, traced_run)
+                       for run, supply_items, version in jobs]
+            for future in as_completed(futures):
+                try:
+                    update, seconds = future.result()
+                except Exception:
+                    # the run keeps its old data version, so it is never reused
+                    stats.failed += 1
+                    continue
+                stats.recompute_seconds += seconds
+                batch.append(update)
+                if len(batch) >= self.batch_size:
+                    self._write(batch, stats)
+                    batch = []
+        if batch:
+            self._write(batch, stats)
+
+    @staticmethod
+    def _recompute(data: Mapping[str, Any], run: Dict[str, Any], supply_items, version: str, traced_run: bool):
+        tracer.enable_for_run(traced_run)
+        started = time.perf_counter()
+        with span("propagation.recompute"):
+            profile = FarmProfile(**{k: run[k] for k in FarmProfile.__dataclass_fields__})
+            scored, recs = rescore(data, profile, dict(supply_items) if supply_items else None)
+            update = (run["id"], asdict(profile), recs.to_records(), market_dependencies(scored, recs), version)
+        return update, time.perf_counter() - started
+
+    def _write(self, batch: list, stats: WaveStats) -> None:
+        with span("propagation.write_batch"):
+            self.db.update_recommendation_runs(batch)
+        stats.recomputed += len(batch)
+        stats.batches += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a market update and recompute the stored recommendations it affects")
+    parser.add_argument("update", help="CSV with region, crop, demand_index, supply_index rows")
+    parser.add_argument("--db", default="farmer_data.db", help="Path to the SQLite database")
+    parser.add_argument("--workers", type=int, default=4, help="Recompute worker threads")
+    parser.add_argument("--batch-size", type=int, default=50, help="Recomputed runs written per transaction")
+    args = parser.parse_args()
+
+    base_path = os.getcwd()
+    old_data = load_data(base_path)
+    market = merge_market_update(old_data.get("market"), pd.read_csv(args.update))
+    new_data = dict(old_data, market=market, catalog=CropCatalog(old_data["crops"], market))
+
+    propagator = ChangePropagator(FarmerDatabase(args.db, price_cache_days=None), args.workers, args.batch_size)
+    print(propagator.apply(old_data, new_data))
+
+    market_path = os.path.join(base_path, "data", "market.csv")
+    newline = "\n"
+    if os.path.exists(market_path):
+        with open(market_path, "rb") as f:
+            newline = "\r\n" if b"\r\n" in f.readline() else "\n"  # keep the file's line endings
+    market.to_csv(f"{market_path}.tmp", index=False, lineterminator=newline)
+    os.replace(f"{market_path}.tmp", market_path)
+    export_path = os.environ.get("CROP_TRACE_EXPORT")
+    if export_path:
+        tracer.export(export_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Streaming export of farmer reports for all (or a filtered subset of) farmers.
+
+Usage: python src/report_export.py reports.jsonl [--db farmer_data.db] [--region R] [--district D] [--since 2024-01-01]
+
+The format follows the output extension: .jsonl (nested reports), .csv or .parquet
+(one flat row per farmer and selected crop; Parquet needs pyarrow).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from database import FARMER_FIELDS, SELECTION_FIELDS, FarmerDatabase
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = pq = None
+
+
+TREND_FIELDS = ('trend', 'average_price', 'price_change', 'volatility')
+FLAT_COLUMNS = (
+    ['farmer_id', 'created_at'] + list(FARMER_FIELDS) + list(SELECTION_FIELDS)
+    + list(TREND_FIELDS) + ['total_expected_revenue', 'farming_plans', 'farm_layouts']
+)
+
+ProgressCallback = Callable[[int, int, float], None]
+
+
+@dataclass
+class ExportResult:
+    farmers: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        rate = self.farmers / self.seconds if self.seconds > 0 else 0.0
+        return f"{self.farmers} farmers ({self.rows} rows) in {self.seconds:.1f}s ({rate:,.0f} farmers/s)"
+
+
+def flatten_report(report: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """One flat row per selected crop (a single row with empty crop fields when there are none)."""
+    farmer = report['farmer']
+    base = {'farmer_id': farmer['id'], 'created_at': farmer['created_at']}
+    base.update({f: farmer[f] for f in FARMER_FIELDS})
+    base.update(total_expected_revenue=report['total_expected_revenue'],
+                farming_plans=report['farming_plans'], farm_layouts=report['farm_layouts'])
+    selections = report['crop_selections'] or [{}]
+    for selection in selections:
+        trend = report['market_trends'].get(selection.get('crop_name'), {})
+        row = dict(base)
+        row.update({f: selection.get(f) for f in SELECTION_FIELDS})
+        row.update({f: trend.get(f) for f in TREND_FIELDS})
+        yield row
+
+
+class _JsonlWriter:
+    def __init__(self, path: str):
+        self.file = open(path, 'w', encoding='utf-8', newline='\n')
+
+    def write(self, reports: List[Dict[str, Any]]) -> int:
+        self.file.writelines(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in reports)
+        return len(reports)
+
+    def close(self):
+        self.file.close()
+
+
+class _CsvWriter:
+    def __init__(self, path: str):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=FLAT_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, reports: List[Dict[str, Any]]) -> int:
+        rows = [row for r in reports for row in flatten_report(r)]
+        self.writer.writerows(rows)
+        return len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    SCHEMA_TYPES = {
+        'farmer_id': 'int64', 'farm_area': 'float64', 'plot_length': 'float64', 'plot_width': 'float64',
+        'area_percentage': 'float64', 'expected_yield': 'float64', 'expected_revenue': 'float64',
+        'growth_duration': 'int64', 'average_price': 'float64', 'price_change': 'float64',
+        'volatility': 'float64', 'total_expected_revenue': 'float64',
+        'farming_plans': 'int64', 'farm_layouts': 'int64',
+    }
+
+    def __init__(self, path: str):
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.schema = pa.schema([(c, pa.type_for_alias(self.SCHEMA_TYPES.get(c, 'string'))) for c in FLAT_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, reports: List[Dict[str, Any]]) -> int:
+        rows = [row for r in reports for row in flatten_report(r)]
+        columns = {c: [row[c] for row in rows] for c in FLAT_COLUMNS}
+        # one row group per batch keeps memory flat
+        self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+        return len(rows)
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'.jsonl': _JsonlWriter, '.csv': _CsvWriter, '.parquet': _ParquetWriter}
+
+
+def _batched(items: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_reports(db: FarmerDatabase, path: str, region: Optional[str] = None, district: Optional[str] = None,
+                   since: Optional[str] = None, until: Optional[str] = None, batch_size: int = 2000,
+                   progress: Optional[ProgressCallback] = None) -> ExportResult:
+    """Write reports for the matching farmers to `path`, batch by batch, in constant memory."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported export format '{extension}'; use one of {', '.join(WRITERS)}")
+
+    total = db.count_farmers(region, district, since, until) if progress else 0
+    result = ExportResult()
+    started = time.perf_counter()
+    tmp_path = f"{path}.tmp"
+    writer = WRITERS[extension](tmp_path)
+    try:
+        reports = db.iter_farmer_reports(region, district, since, until, batch_size)
+        for batch in _batched(reports, batch_size):
+            result.rows += writer.write(batch)
+            result.farmers += len(batch)
+            if progress:
+                progress(result.farmers, total, time.perf_counter() - started)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _print_progress(done: int, total: int, elapsed: float) -> None:
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else 0.0
+    print(f"\r{done}/{total} farmers ({rate:,.0f}/s, ~{eta:.0f}s left)", end='', file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export farmer reports as JSONL, CSV or Parquet")
+    parser.add_argument("output", help="Output file (.jsonl, .csv or .parquet)")
+    parser.add_argument("--db", default="farmer_data.db", help="Path to the SQLite database")
+    parser.add_argument("--region", help="Only farmers in this region")
+    parser.add_argument("--district", help="Only farmers in this district")
+    parser.add_argument("--since", help="Only farmers created on/after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Only farmers created before this date (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Farmers per batch")
+    args = parser.parse_args()
+
+    db = FarmerDatabase(args.db, price_cache_days=None)
+    result = export_reports(db, args.output, args.region, args.district, args.since, args.until,
+                            args.batch_size, progress=_print_progress)
+    print(f"\nExported {result}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
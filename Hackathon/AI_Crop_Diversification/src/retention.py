@@ -0,0 +1,232 @@
+"""Retention for market_prices: archive cold raw quotes, downsample them, and reclaim space.
+
+Raw quotes older than `raw_days` are copied to gzip-compressed monthly SQLite files, rolled
+up into market_prices_daily and deleted. Daily rows older than `daily_days` are rolled up
+into market_prices_weekly. Freed pages are returned to the OS with incremental VACUUM.
+
+Usage: python src/retention.py [--db farmer_data.db] [--raw-days 180] [--daily-days 730] [--archive-dir market_archive]
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from database import FarmerDatabase
+
+
+ARCHIVE_PATTERN = "market_prices_{month}.sqlite.gz"
+# archives are self-contained: quotes are stored with their names, read through market_prices_named
+RAW_COLUMNS = "id, region, district, crop_name, price_per_ton, price_date, source, created_at"
+
+
+@dataclass
+class RetentionPolicy:
+    raw_days: int = 180
+    daily_days: int = 730
+    archive_dir: Optional[str] = "market_archive"  # None drops cold raw quotes after downsampling
+    vacuum_pages: int = 0  # pages to release per run; 0 releases every free page
+
+
+def _gunzip(src: str, dst: str) -> None:
+    with gzip.open(src, "rb") as fin, open(dst, "wb") as fout:
+        shutil.copyfileobj(fin, fout)
+
+
+def _gzip_replace(src: str, dst: str) -> None:
+    tmp = f"{dst}.tmp"
+    with open(src, "rb") as fin, gzip.open(tmp, "wb") as fout:
+        shutil.copyfileobj(fin, fout)
+    os.replace(tmp, dst)
+
+
+def archive_month(conn: sqlite3.Connection, archive_dir: str, month: str, before: str) -> int:
+    """Copy raw quotes of `month` (YYYY-MM) dated before `before` into that month's archive file.
+
+    Existing archives are extended; rows are keyed by their market_prices id, so re-running
+    after an interrupted retention pass does not duplicate them.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, ARCHIVE_PATTERN.format(month=month))
+    work = os.path.join(archive_dir, f".{month}.sqlite")
+    if os.path.exists(path):
+        _gunzip(path, work)
+    elif os.path.exists(work):
+        os.remove(work)
+
+    conn.execute("ATTACH DATABASE ? AS arc", (work,))
+    try:
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS arc.market_prices (
+                    id INTEGER PRIMARY KEY,
+                    region TEXT NOT NULL,
+                    district TEXT NOT NULL,
+                    crop_name TEXT NOT NULL,
+                    price_per_ton REAL NOT NULL,
+                    price_date DATE NOT NULL,
+                    source TEXT,
+                    created_at TIMESTAMP
+                )
+            ''')
+            copied = conn.execute(f'''
+                INSERT OR IGNORE INTO arc.market_prices ({RAW_COLUMNS})
+                SELECT {RAW_COLUMNS} FROM main.market_prices_named
+                WHERE price_date >= ? AND price_date < ? AND price_date < ?
+            ''', (f"{month}-01", _next_month(month), before)).rowcount
+    finally:
+        conn.execute("DETACH DATABASE arc")
+    _gzip_replace(work, path)
+    os.remove(work)
+    return copied
+
+
+def _next_month(month: str) -> str:
+    year, mon = (int(part) for part in month.split("-"))
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}-01"
+
+
+def _downsample(conn: sqlite3.Connection, raw_cutoff: str, daily_cutoff: str) -> Dict[str, int]:
+    with conn:
+        conn.execute('''
+            INSERT INTO market_prices_daily
+                (district_id, crop_id, price_date, quotes, price_sum, price_min, price_max)
+            SELECT district_id, crop_id, price_date,
+                   COUNT(*), SUM(price_per_ton), MIN(price_per_ton), MAX(price_per_ton)
+            FROM market_prices WHERE price_date < ?
+            GROUP BY district_id, crop_id, price_date
+            ON CONFLICT (district_id, crop_id, price_date) DO UPDATE SET
+                quotes = quotes + excluded.quotes,
+                price_sum = price_sum + excluded.price_sum,
+                price_min = MIN(price_min, excluded.price_min),
+                price_max = MAX(price_max, excluded.price_max)
+        ''', (raw_cutoff,))
+        raw = conn.execute('DELETE FROM market_prices WHERE price_date < ?', (raw_cutoff,)).rowcount
+
+        # weeks start on Monday: step forward to Sunday, then back six days
+        conn.execute('''
+            INSERT INTO market_prices_weekly
+                (district_id, crop_id, week_start, quotes, price_sum, price_min, price_max)
+            SELECT district_id, crop_id, date(price_date, 'weekday 0', '-6 days') AS week_start,
+                   SUM(quotes), SUM(price_sum), MIN(price_min), MAX(price_max)
+            FROM market_prices_daily WHERE price_date < ?
+            GROUP BY district_id, crop_id, week_start
+            ON CONFLICT (district_id, crop_id, week_start) DO UPDATE SET
+                quotes = quotes + excluded.quotes,
+                price_sum = price_sum + excluded.price_sum,
+                price_min = MIN(price_min, excluded.price_min),
+                price_max = MAX(price_max, excluded.price_max)
+        ''', (daily_cutoff,))
+        daily = conn.execute('DELETE FROM market_prices_daily WHERE price_date < ?', (daily_cutoff,)).rowcount
+    return {'raw_downsampled': raw, 'daily_downsampled': daily}
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = 0) -> int:
+    """Release free pages to the OS; returns the number of pages released.
+
+    Databases created before auto_vacuum was enabled are converted with one full VACUUM.
+    """
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    else:
+        # the pragma frees one page per step and execute() only takes the first step;
+        # executescript() commits pending work and steps it to completion
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});' if pages else 'PRAGMA incremental_vacuum;')
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def apply_retention(db: FarmerDatabase, policy: RetentionPolicy,
+                    today: Optional[datetime.date] = None) -> Dict[str, int]:
+    """Run one retention pass; returns counts of archived/downsampled rows and released pages."""
+    today = today or datetime.date.today()
+    raw_cutoff = (today - datetime.timedelta(days=policy.raw_days)).isoformat()
+    daily_cutoff = (today - datetime.timedelta(days=policy.daily_days)).isoformat()
+
+    conn = sqlite3.connect(db.db_path)
+    archived = 0
+    if policy.archive_dir:
+        months = [row[0] for row in conn.execute(
+            'SELECT DISTINCT substr(price_date, 1, 7) FROM market_prices WHERE price_date < ? ORDER BY 1',
+            (raw_cutoff,))]
+        for month in months:
+            archived += archive_month(conn, policy.archive_dir, month, raw_cutoff)
+    result = {'archived': archived, **_downsample(conn, raw_cutoff, daily_cutoff)}
+    result['pages_released'] = incremental_vacuum(conn, policy.vacuum_pages)
+    conn.close()
+
+    # the cache may still hold quotes that were just moved out of market_prices
+    if db.price_cache is not None and result['raw_downsampled']:
+        db.load_price_cache()
+    return result
+
+
+@contextlib.contextmanager
+def open_history(db_path: str, archive_dir: str, months: Optional[List[str]] = None) -> Iterator[sqlite3.Connection]:
+    """Connection with archived raw quotes re-attached for historical analysis.
+
+    The temp view `market_prices_all` unions live and archived quotes. Archives are
+    decompressed into one scratch database, removed again when the context exits.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="market_history_")
+    scratch = os.path.join(scratch_dir, "history.sqlite")
+    paths = sorted(glob.glob(os.path.join(archive_dir, ARCHIVE_PATTERN.format(month="*"))))
+    if months is not None:
+        wanted = {ARCHIVE_PATTERN.format(month=m) for m in months}
+        paths = [p for p in paths if os.path.basename(p) in wanted]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (scratch,))
+        conn.execute(f'''
+            CREATE TABLE archive.market_prices AS
+            SELECT {RAW_COLUMNS} FROM main.market_prices_named WHERE 0
+        ''')
+        for i, path in enumerate(paths):
+            part = os.path.join(scratch_dir, f"part{i}.sqlite")
+            _gunzip(path, part)
+            conn.execute("ATTACH DATABASE ? AS part", (part,))
+            with conn:
+                conn.execute(f'INSERT INTO archive.market_prices SELECT {RAW_COLUMNS} FROM part.market_prices')
+            conn.execute("DETACH DATABASE part")
+            os.remove(part)
+        conn.execute(f'''
+            CREATE TEMP VIEW market_prices_all AS
+            SELECT {RAW_COLUMNS} FROM main.market_prices_named
+            UNION ALL
+            SELECT {RAW_COLUMNS} FROM archive.market_prices
+        ''')
+        yield conn
+    finally:
+        conn.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive, downsample and vacuum old market prices")
+    parser.add_argument("--db", default="farmer_data.db", help="Path to the SQLite database")
+    parser.add_argument("--raw-days", type=int, default=180, help="Days of raw quotes to keep")
+    parser.add_argument("--daily-days", type=int, default=730, help="Days of daily aggregates to keep")
+    parser.add_argument("--archive-dir", default="market_archive", help="Where to write compressed monthly archives")
+    parser.add_argument("--no-archive", action="store_true", help="Drop cold raw quotes without archiving them")
+    parser.add_argument("--vacuum-pages", type=int, default=0, help="Pages to release (0 = all free pages)")
+    args = parser.parse_args()
+
+    policy = RetentionPolicy(args.raw_days, args.daily_days,
+                             None if args.no_archive else args.archive_dir, args.vacuum_pages)
+    result = apply_retention(FarmerDatabase(args.db, price_cache_days=None), policy)
+    print(f"Archived {result['archived']} quotes, downsampled {result['raw_downsampled']} raw and "
+          f"{result['daily_downsampled']} daily rows, released {result['pages_released']} pages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Reuse of prior recommendations for farmers with near-identical inputs.
+
+Usage: python src/reuse.py evaluate [--db farmer_data.db] [--tolerance 0.1]
+
+Every computed recommendation is stored in recommendation_runs with the profile it was
+computed for. A new request whose profile lies within `tolerance` of a stored one (same
+region, season, drainage class and crop count) is answered with that run, and the run id
+is returned with it. `evaluate` measures what that costs: for each stored run it takes the
+answer its nearest other run would have given and compares it with a full recompute.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from database import FarmerDatabase
+from features import DRAINAGE_LEVELS, FeatureStore
+from logic import Recommendation, RecommendationBatch, compute_scores, diversify_portfolio, load_data
+from tracing import traced
+
+
+# one normalised unit per field; the distance is Euclidean over these
+PROFILE_SCALES: Dict[str, float] = {
+    "ph": 0.5,
+    "organic_matter_pct": 1.0,
+    "forecast_temp_c": 2.0,
+    "forecast_rain_mm": 100.0,  # includes irrigation
+}
+DEFAULT_TOLERANCE = 0.1
+# every Nth reuse is also recomputed to keep the error estimate current
+AUDIT_EVERY = 20
+
+
+@dataclass(frozen=True)
+class FarmProfile:
+    region: str
+    season: str
+    drainage: str
+    max_crops: int
+    ph: float
+    organic_matter_pct: float
+    forecast_temp_c: float
+    forecast_rain_mm: float
+    irrigation_mm: float = 0.0
+    # area only scales totals, so it is recorded for tracing but never matched on
+    farm_area: Optional[float] = None
+
+    @classmethod
+    def from_site(cls, features: FeatureStore, region: str, season: str, max_crops: int,
+                  soil_override: Optional[Mapping[str, Any]] = None, extra_rain_mm: float = 0.0,
+                  climate_override: Optional[Mapping[str, Any]] = None,
+                  farm_area: Optional[float] = None) -> "FarmProfile":
+        """Profile of the effective inputs compute_scores will see."""
+        vec = features.vector(region, season, soil_override, extra_rain_mm, climate_override)
+        return cls(
+            region=region,
+            season=season,
+            drainage=DRAINAGE_LEVELS[int(vec["drainage"])],
+            max_crops=int(max_crops),
+            ph=float(vec["ph"]),
+            organic_matter_pct=float(vec["organic_matter_pct"]),
+            forecast_temp_c=float(vec["forecast_temp_c"]),
+            forecast_rain_mm=float(vec["forecast_rain_mm"]),
+            irrigation_mm=float(extra_rain_mm),
+            farm_area=farm_area,
+        )
+
+    @property
+    def key(self) -> Tuple[str, str, str, int]:
+        return self.region, self.season, self.drainage, self.max_crops
+
+    def vector(self) -> np.ndarray:
+        return np.array([getattr(self, name) / scale for name, scale in PROFILE_SCALES.items()])
+
+    def overrides(self) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """soil_override and climate_override that reproduce this profile in compute_scores."""
+        soil = {"ph": self.ph, "drainage": self.drainage, "organic_matter_pct": self.organic_matter_pct}
+        return soil, {"forecast_temp_c": self.forecast_temp_c, "forecast_rain_mm": self.forecast_rain_mm}
+
+
+@dataclass
+class ReuseHit:
+    run_id: int
+    distance: float
+    recommendations: Sequence[Recommendation]
+    farmer_id: Optional[int] = None
+
+
+def recommendation_error(approx: Sequence[Recommendation], exact: Sequence[Recommendation]) -> Dict[str, float]:
+    """How far a reused answer is from a fresh one.
+
+    share_error_pp: largest area-share difference for any crop (percentage points; a crop
+    missing on one side counts its full share). revenue_error_pct: relative error of the
+    share-weighted revenue per ha. crop_overlap: fraction of the fresh crops also reused.
+    """
+    a = {r.crop: r for r in approx}
+    e = {r.crop: r for r in exact}
+    crops = set(a) | set(e)
+    share_error = max((abs((a[c].area_share_pct if c in a else 0.0) - (e[c].area_share_pct if c in e else 0.0))
+                       for c in crops), default=0.0)
+    revenue_a = sum(r.expected_revenue_per_ha * r.area_share_pct / 100.0 for r in approx)
+    revenue_e = sum(r.expected_revenue_per_ha * r.area_share_pct / 100.0 for r in exact)
+    return {
+        "share_error_pp": float(share_error),
+        "revenue_error_pct": float(abs(revenue_a - revenue_e) / revenue_e * 100.0) if revenue_e else 0.0,
+        "crop_overlap": len(set(a) & set(e)) / len(e) if e else 1.0,
+    }
+
+
+@dataclass
+class ReuseStats:
+    lookups: int = 0
+    hits: int = 0
+    audits: int = 0
+    max_share_error_pp: float = 0.0
+    mean_share_error_pp: float = 0.0
+    mean_revenue_error_pct: float = 0.0
+    mean_crop_overlap: float = 1.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def add_audit(self, error: Dict[str, float]) -> None:
+        # running aggregates only: the index lives as long as the app process
+        self.audits += 1
+        self.max_share_error_pp = max(self.max_share_error_pp, error["share_error_pp"])
+        self.mean_share_error_pp += (error["share_error_pp"] - self.mean_share_error_pp) / self.audits
+        self.mean_revenue_error_pct += (error["revenue_error_pct"] - self.mean_revenue_error_pct) / self.audits
+        self.mean_crop_overlap += (error["crop_overlap"] - self.mean_crop_overlap) / self.audits
+
+
+def data_fingerprint(data: Mapping[str, Any], supply_items: Optional[Tuple[Tuple[str, float], ...]] = None) -> str:
+    """Version of the inputs recommendations depend on; runs from other versions are never reused.
+
+    `supply_items` are the (crop, factor) supply adjustments the run was scored with, if any.
+    """
+    digest = hashlib.sha1()
+    for name in ("crops", "regions", "soil", "climate", "market"):
+        frame = data.get(name)
+        if frame is not None:
+            digest.update(name.encode())
+            digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    model = data.get("yield_model")
+    digest.update(f"yield_model={model.version if model is not None else 'formula'}".encode())
+    if supply_items:
+        digest.update(repr(tuple(supply_items)).encode())
+    return digest.hexdigest()[:16]
+
+
+class _Partition:
+    """Runs sharing a profile key; vectors are kept as one array for a vectorised nearest search."""
+
+    def __init__(self):
+        self.run_ids: List[int] = []
+        self.profiles: List[FarmProfile] = []
+        self.farmer_ids: List[Optional[int]] = []
+        self.recommendations: List[Sequence[Recommendation]] = []
+        self._rows: List[np.ndarray] = []
+        self._vectors: Optional[np.ndarray] = None
+
+    def add(self, run_id: int, profile: FarmProfile, recs: Sequence[Recommendation], farmer_id: Optional[int]) -> None:
+        self.run_ids.append(run_id)
+        self.profiles.append(profile)
+        self.farmer_ids.append(farmer_id)
+        self.recommendations.append(recs)
+        self._rows.append(profile.vector())
+        self._vectors = None
+
+    def nearest(self, vector: np.ndarray, exclude: Optional[int] = None) -> Tuple[int, float]:
+        if self._vectors is None:
+            self._vectors = np.vstack(self._rows)
+        dist = np.sqrt(((self._vectors - vector) ** 2).sum(axis=1))
+        if exclude is not None:
+            dist[exclude] = np.inf
+        i = int(np.argmin(dist))
+        return i, float(dist[i])
+
+
+class RecommendationIndex:
+    """In-memory similarity index over recorded runs, persisted through recommendation_runs."""
+
+    def __init__(self, db: FarmerDatabase, data_version: str, tolerance: float = DEFAULT_TOLERANCE,
+                 since_days: Optional[int] = 30, audit_every: int = AUDIT_EVERY,
+                 supply_items: Optional[Tuple[Tuple[str, float], ...]] = None):
+        self.db = db
+        self.data_version = data_version
+        # stored with every run so the propagation layer can rescore it under the same supply state
+        self.supply_items = supply_items
+        self.tolerance = tolerance
+        self.audit_every = audit_every
+        self.stats = ReuseStats()
+        self._partitions: Dict[Tuple[str, str, str, int], _Partition] = {}
+        self._lock = threading.Lock()
+        for run in db.get_recommendation_runs(data_version, since_days):
+            profile = FarmProfile(**{k: run[k] for k in FarmProfile.__dataclass_fields__})
+            recs = RecommendationBatch.from_records(run["recommendations"])
+            self._add(run["id"], profile, recs, run["farmer_id"])
+
+    def __len__(self) -> int:
+        return sum(len(p.run_ids) for p in self._partitions.values())
+
+    def _add(self, run_id: int, profile: FarmProfile, recs: Sequence[Recommendation], farmer_id: Optional[int]) -> None:
+        self._partitions.setdefault(profile.key, _Partition()).add(run_id, profile, recs, farmer_id)
+
+    @traced("reuse.lookup")
+    def lookup(self, profile: FarmProfile) -> Optional[ReuseHit]:
+        """Nearest recorded run within tolerance, or None."""
+        with self._lock:
+            self.stats.lookups += 1
+            partition = self._partitions.get(profile.key)
+            if partition is None or self.tolerance <= 0:
+                return None
+            i, distance = partition.nearest(profile.vector())
+            if distance > self.tolerance:
+                return None
+            self.stats.hits += 1
+            return ReuseHit(partition.run_ids[i], distance, partition.recommendations[i], partition.farmer_ids[i])
+
+    def record(self, profile: FarmProfile, recs: Sequence[Recommendation], farmer_id: Optional[int] = None,
+               dependencies: Sequence[str] = ()) -> int:
+        """Store a freshly computed run, with the crops it depends on, and make it available to later lookups."""
+        run_id = self.db.add_recommendation_run(asdict(profile), [r.to_dict() for r in recs], self.data_version, farmer_id,
+                                                dependencies, self.supply_items)
+        with self._lock:
+            self._add(run_id, profile, recs, farmer_id)
+        return run_id
+
+    def recommend(self, profile: FarmProfile, compute: Callable[[], Sequence[Recommendation]],
+                  dependencies: Optional[Callable[[Sequence[Recommendation]], Sequence[str]]] = None
+                  ) -> Tuple[Sequence[Recommendation], int, Optional[ReuseHit]]:
+        """(recommendations, run id they come from, hit or None); `compute` runs only on a miss or an audit.
+
+        `dependencies` maps freshly computed recommendations to the crops they depend on.
+        """
+        hit = self.lookup(profile)
+        if hit is None:
+            recs = compute()
+            return recs, self.record(profile, recs, dependencies=dependencies(recs) if dependencies else ()), None
+        if self.audit_every and self.stats.hits % self.audit_every == 0:
+            error = recommendation_error(hit.recommendations, compute())
+            with self._lock:
+                self.stats.add_audit(error)
+        return hit.recommendations, hit.run_id, hit
+
+
+def rescore(data: Mapping[str, Any], profile: FarmProfile, supply_factor: Optional[Mapping[str, float]] = None
+            ) -> Tuple[pd.DataFrame, RecommendationBatch]:
+    """Full scoring and allocation for a stored profile: (scored crops, recommendations)."""
+    soil, climate = profile.overrides()
+    scored = compute_scores(profile.region, profile.season, data["crops"], data["soil"], data["climate"],
+                            data["regions"], data.get("market"), soil_override=soil, climate_override=climate,
+                            features=data["features"], catalog=data["catalog"], supply_factor=supply_factor)
+    site = {**soil, **climate}
+    return scored, diversify_portfolio(scored, max_crops=profile.max_crops, yield_model=data.get("yield_model"), site=site)
+
+
+def recompute(data: Mapping[str, Any], profile: FarmProfile) -> RecommendationBatch:
+    """Full scoring and allocation for a stored profile."""
+    return rescore(data, profile)[1]
+
+
+def evaluate(db: FarmerDatabase, data: Mapping[str, Any], tolerance: float = DEFAULT_TOLERANCE,
+             since_days: Optional[int] = None) -> Dict[str, float]:
+    """Hit rate and error of reuse over the stored runs, each against a full recompute."""
+    index = RecommendationIndex(db, data_fingerprint(data), tolerance, since_days, audit_every=0)
+    stats = ReuseStats()
+    for partition in index._partitions.values():
+        for i, profile in enumerate(partition.profiles):
+            stats.lookups += 1
+            if len(partition.profiles) < 2:
+                continue
+            j, distance = partition.nearest(profile.vector(), exclude=i)
+            if distance > tolerance:
+                continue
+            stats.hits += 1
+            stats.add_audit(recommendation_error(partition.recommendations[j], recompute(data, profile)))
+    return {
+        "runs": stats.lookups,
+        "reusable": stats.hits,
+        "hit_rate": stats.hit_rate,
+        "max_share_error_pp": stats.max_share_error_pp,
+        "mean_share_error_pp": stats.mean_share_error_pp,
+        "mean_revenue_error_pct": stats.mean_revenue_error_pct,
+        "mean_crop_overlap": stats.mean_crop_overlap,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the error of reusing recommendations across similar farms")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ev = sub.add_parser("evaluate", help="Compare nearest-run answers with full recomputes")
+    ev.add_argument("--db", default="farmer_data.db", help="Path to the SQLite database")
+    ev.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Profile distance allowed for reuse")
+    ev.add_argument("--since-days", type=int, help="Only runs from the last N days")
+    args = parser.parse_args()
+
+    data = load_data(os.getcwd())
+    report = evaluate(FarmerDatabase(args.db, price_cache_days=None), data, args.tolerance, args.since_days)
+    print(f"{report['reusable']}/{report['runs']} runs had a neighbour within {args.tolerance} "
+          f"({report['hit_rate']:.0%}); area share error max {report['max_share_error_pp']:.2f} pp, "
+          f"mean {report['mean_share_error_pp']:.2f} pp; revenue error mean {report['mean_revenue_error_pct']:.2f}%; "
+          f"crop overlap {report['mean_crop_overlap']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
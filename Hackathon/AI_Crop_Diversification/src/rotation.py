@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalog import CropCatalog
+from features import FeatureStore
+from logic import compute_scores, expected_economics
+from tracing import traced
+
+
+# agronomic season order within a year; seasons not listed follow in file order
+SEASON_ORDER = ("Kharif", "Rabi", "Zaid")
+
+# score bonus for growing `next` group right after `prev` group (base scores are 0..1)
+GROUP_TRANSITIONS: Dict[Tuple[str, str], float] = {
+    ("legume", "cereal"): 0.10,  # nitrogen carry-over
+    ("legume", "oilseed"): 0.06,
+    ("legume", "fiber"): 0.06,
+    ("legume", "horticulture"): 0.04,
+    ("cereal", "legume"): 0.05,
+    ("oilseed", "legume"): 0.04,
+    ("fiber", "legume"): 0.04,
+}
+SAME_GROUP_PENALTY = -0.10  # replaces any table entry when the group repeats
+SAME_CROP_PENALTY = -0.10  # on top of the group penalty
+
+
+@dataclass
+class Rotation:
+    seasons: List[str]
+    crops: List[str]
+    score: float
+    expected_revenue_per_ha: float
+
+
+def season_sequence(region: str, climate_df: pd.DataFrame, years: int = 1) -> List[str]:
+    seasons = list(dict.fromkeys(climate_df.loc[climate_df["region"] == region, "season"]))
+    rank = {s: i for i, s in enumerate(SEASON_ORDER)}
+    seasons.sort(key=lambda s: rank.get(s, len(rank)))
+    return seasons * years
+
+
+def group_bonus_matrix(groups: Sequence[str], transitions: Dict[Tuple[str, str], float] = GROUP_TRANSITIONS
+                       ) -> Tuple[np.ndarray, np.ndarray]:
+    """Integer group code per crop and the (groups, groups) bonus for following group g with group h."""
+    names, codes = np.unique(np.asarray(groups, dtype=object), return_inverse=True)
+    bonus = np.zeros((len(names), len(names)))
+    for (prev, nxt), value in transitions.items():
+        if prev in names and nxt in names:
+            bonus[np.searchsorted(names, prev), np.searchsorted(names, nxt)] = value
+    np.fill_diagonal(bonus, SAME_GROUP_PENALTY)
+    return codes, bonus
+
+
+def top_k_paths(stage_scores: np.ndarray, codes: np.ndarray, group_bonus: np.ndarray, k: int,
+                same_crop_penalty: float = SAME_CROP_PENALTY) -> List[Tuple[float, List[int]]]:
+    """k best crop sequences for (stages, n) stage scores under group transition bonuses.
+
+    Dynamic programming over (stage, crop) states where each state keeps its k best
+    partial paths. Because a transition only depends on the two groups (plus the
+    same-crop penalty), each stage first pools the 2k best partial paths of every
+    group; a crop then picks its k best predecessors from those pools and its own
+    paths, so a stage costs O(n · groups · k) rather than O(n² · k).
+    """
+    n_stages, n = stage_scores.shape
+    n_groups = group_bonus.shape[0]
+    members = [np.flatnonzero(codes == g) for g in range(n_groups)]
+    pool = 2 * k  # enough to still have k after dropping one crop's own k paths
+    ranks = np.arange(k)
+
+    best = np.full((n, k), -np.inf)
+    best[:, 0] = stage_scores[0]
+    back = np.zeros((n_stages, n, k), dtype=np.int64)  # flat index into the previous (n, k) table
+
+    for t in range(1, n_stages):
+        pool_vals = np.full((n_groups, pool), -np.inf)
+        pool_idx = np.zeros((n_groups, pool), dtype=np.int64)
+        for g, rows in enumerate(members):
+            vals = best[rows].ravel()
+            flat = (rows[:, None] * k + ranks).ravel()
+            take = min(pool, vals.size)
+            sel = np.argpartition(-vals, take - 1)[:take] if vals.size > take else np.arange(vals.size)
+            pool_vals[g, :take] = vals[sel]
+            pool_idx[g, :take] = flat[sel]
+        pool_crop = pool_idx.ravel() // k
+
+        new_best = np.empty_like(best)
+        for h, rows in enumerate(members):
+            if rows.size == 0:
+                continue
+            shifted = (pool_vals + group_bonus[:, h][:, None]).ravel()
+            # a crop's own paths come from the same-crop term, never from the pools
+            others = np.where(pool_crop[None, :] == rows[:, None], -np.inf, shifted[None, :])
+            own = best[rows] + group_bonus[h, h] + same_crop_penalty
+            cand = np.hstack([others, own])
+            cand_idx = np.hstack([np.broadcast_to(pool_idx.ravel(), others.shape), rows[:, None] * k + ranks])
+            top = np.argsort(-cand, axis=1, kind="stable")[:, :k]
+            new_best[rows] = np.take_along_axis(cand, top, axis=1) + stage_scores[t][rows][:, None]
+            back[t][rows] = np.take_along_axis(cand_idx, top, axis=1)
+        best = new_best
+
+    flat = best.ravel()
+    finals = np.argsort(-flat, kind="stable")[:k]
+    paths = []
+    for f in finals:
+        if not np.isfinite(flat[f]):
+            break
+        crop, rank = divmod(int(f), k)
+        path = [crop]
+        for t in range(n_stages - 1, 0, -1):
+            crop, rank = divmod(int(back[t, crop, rank]), k)
+            path.append(crop)
+        paths.append((float(flat[f]), path[::-1]))
+    return paths
+
+
+@traced("rotation.plan_rotations")
+def plan_rotations(
+    region: str,
+    crops_df: pd.DataFrame,
+    soil_df: pd.DataFrame,
+    climate_df: pd.DataFrame,
+    regions_df: pd.DataFrame,
+    market_df: Optional[pd.DataFrame] = None,
+    years: int = 1,
+    top_k: int = 5,
+    soil_override: Optional[Dict] = None,
+    extra_rain_mm: float = 0.0,
+    features: Optional[FeatureStore] = None,
+    catalog: Optional[CropCatalog] = None,
+    transitions: Dict[Tuple[str, str], float] = GROUP_TRANSITIONS,
+) -> List[Rotation]:
+    """Top-k crop sequences over the region's seasons for `years` years.
+
+    A sequence scores the sum of each season's compute_scores base score plus the
+    group transition bonus/penalty between consecutive crops.
+    """
+    seasons = season_sequence(region, climate_df, years)
+    if not seasons or crops_df.empty:
+        return []
+    features = features or FeatureStore(soil_df, climate_df, regions_df)
+
+    per_season: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    for season in dict.fromkeys(seasons):
+        scored = compute_scores(region, season, crops_df, soil_df, climate_df, regions_df, market_df,
+                                soil_override=soil_override, extra_rain_mm=extra_rain_mm, features=features,
+                                catalog=catalog)
+        _, revenue = expected_economics(scored)
+        per_season[season] = (scored["base_score"].to_numpy(dtype=float), revenue)
+
+    stage_scores = np.stack([per_season[s][0] for s in seasons])
+    stage_revenue = np.stack([per_season[s][1] for s in seasons])
+    codes, bonus = group_bonus_matrix(crops_df["group"].tolist(), transitions)
+    names = crops_df["crop"].astype(str).tolist()
+
+    rotations = []
+    for score, path in top_k_paths(stage_scores, codes, bonus, top_k):
+        rotations.append(Rotation(
+            seasons=list(seasons),
+            crops=[names[i] for i in path],
+            score=score,
+            expected_revenue_per_ha=float(stage_revenue[np.arange(len(path)), path].sum()),
+        ))
+    return rotations
@@ -0,0 +1,281 @@
+"""Point-in-time analytics snapshots of the serving database, exported incrementally as columnar files.
+
+Usage: python src/snapshot.py [--db farmer_data.db] [--out analytics] [--format parquet|npz] [--full]
+
+The live database is copied with SQLite's online backup API inside one read transaction.
+The serving database runs in WAL mode, so the app keeps writing while the copy is taken.
+Every later read (the table export below, or an analyst's own queries against
+analytics/farmer_data.snapshot.db) uses the copy.
+
+Each table is exported to analytics/tables/<table>/. A run writes part-<run>.<ext>
+with only the rows that are new or changed since the previous run, and deleted-<run>.<ext>
+with the keys of removed rows. read_table() replays the parts into the current table.
+Parquet needs pyarrow; npz (one NumPy array per column) works without it.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from payloads import decode_payload
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = pq = None
+
+
+SNAPSHOT_FILE = "farmer_data.snapshot.db"
+MANIFEST_FILE = "manifest.json"
+# rows of these tables are only ever inserted or deleted, so new rows are found by id alone
+APPEND_ONLY_TABLES = ('market_prices', 'regions', 'districts', 'crops')
+
+
+def snapshot_database(db_path: str, dest: str, pages: int = -1) -> float:
+    """Consistent copy of `db_path` at `dest`; returns seconds taken.
+
+    The source is opened read-only. With the default pages=-1 the whole file is copied in one
+    step, a single WAL read transaction that writers do not wait for. Copying in smaller
+    steps releases the source between steps, but a write from another connection then
+    restarts the backup, so under steady writes it may never finish. `dest` is replaced
+    atomically and left in rollback-journal mode, so it opens read-only without -wal/-shm files.
+    """
+    started = time.perf_counter()
+    tmp = f"{dest}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    src = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst, pages=pages)
+        dst.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp, dest)
+    return time.perf_counter() - started
+
+
+def _table_info(conn: sqlite3.Connection, table: str) -> List[tuple]:
+    """PRAGMA table_xinfo rows of the columns SELECT * returns, generated columns included"""
+    # hidden: 0 ordinary, 2/3 generated (virtual/stored); the others are left out of SELECT *
+    return [row[:6] for row in conn.execute(f'PRAGMA table_xinfo({table})') if row[6] not in (1, 4)]
+
+
+def _table_keys(conn: sqlite3.Connection, table: str) -> Tuple[List[str], List[str]]:
+    """(all columns, primary key columns) of a table"""
+    info = _table_info(conn, table)
+    columns = [row[1] for row in info]
+    keys = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+    return columns, keys or ['rowid']
+
+
+def _payload_text(value):
+    """Compressed payload BLOBs as their JSON text, so payload columns have one type"""
+    if isinstance(value, (bytes, memoryview)):
+        return json.dumps(decode_payload(value), separators=(",", ":"), ensure_ascii=False)
+    return value
+
+
+def _read(conn: sqlite3.Connection, table: str, query: str, params=()) -> pd.DataFrame:
+    """Rows with a stable column type per part: numeric columns stay numeric even when all NULL,
+    and nullable ones are always float, whether or not this read happens to include a NULL"""
+    df = pd.read_sql_query(query, conn, params=params)
+    info = _table_info(conn, table)
+    numeric = {row[1] for row in info if row[2].upper() in ('REAL', 'INTEGER')}
+    nullable = {row[1] for row in info if not row[3] and not row[5]}
+    for column in df.columns:
+        if column in numeric and (column in nullable or df[column].dtype == object):
+            df[column] = pd.to_numeric(df[column]).astype(float)
+        elif df[column].dtype == object:
+            df[column] = df[column].map(_payload_text)
+    return df
+
+
+def _key_hash(df: pd.DataFrame, keys: List[str]) -> np.ndarray:
+    return pd.util.hash_pandas_object(df[keys], index=False).to_numpy()
+
+
+def _write(df: pd.DataFrame, path: str, fmt: str) -> None:
+    if fmt == "parquet":
+        if pq is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow), or use --format npz")
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    else:
+        np.savez(path, **{column: df[column].to_numpy() for column in df.columns})
+
+
+def _load(path: str) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        return pq.read_table(path).to_pandas()
+    with np.load(path, allow_pickle=True) as arrays:
+        return pd.DataFrame({name: arrays[name] for name in arrays.files})
+
+
+@dataclass
+class TableExport:
+    table: str
+    upserted: int = 0
+    deleted: int = 0
+    full: bool = False
+
+
+@dataclass
+class ExportRun:
+    run: int
+    snapshot_seconds: float
+    export_seconds: float = 0.0
+    tables: List[TableExport] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        changed = [t for t in self.tables if t.upserted or t.deleted]
+        detail = ", ".join(f"{t.table} +{t.upserted}/-{t.deleted}{' (full)' if t.full else ''}" for t in changed)
+        return (f"run {self.run}: snapshot {self.snapshot_seconds:.2f}s, export {self.export_seconds:.2f}s; "
+                + (detail or "no changes"))
+
+
+class SnapshotExporter:
+    """Incremental columnar export of a snapshot, with per-table state in the output directory."""
+
+    def __init__(self, out_dir: str, fmt: str = "parquet"):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.tables_dir = os.path.join(out_dir, "tables")
+        self.manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+        self.manifest = {"runs": 0, "tables": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.out_dir, SNAPSHOT_FILE)
+
+    def run(self, db_path: str, full: bool = False, pages: int = -1) -> ExportRun:
+        """Snapshot `db_path`, then export what changed since the previous run"""
+        os.makedirs(self.tables_dir, exist_ok=True)
+        result = ExportRun(self.manifest["runs"] + 1, snapshot_database(db_path, self.snapshot_path, pages))
+        started = time.perf_counter()
+        conn = sqlite3.connect(f"file:{os.path.abspath(self.snapshot_path)}?mode=ro", uri=True)
+        try:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+            for table in tables:
+                result.tables.append(self._export_table(conn, table, result.run, full))
+        finally:
+            conn.close()
+        for gone in set(self.manifest["tables"]) - set(tables):
+            shutil.rmtree(os.path.join(self.tables_dir, gone), ignore_errors=True)
+            del self.manifest["tables"][gone]
+
+        self.manifest["runs"] = result.run
+        self.manifest["exported_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        with open(f"{self.manifest_path}.tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+        result.export_seconds = time.perf_counter() - started
+        return result
+
+    def _export_table(self, conn: sqlite3.Connection, table: str, run: int, full: bool) -> TableExport:
+        columns, keys = _table_keys(conn, table)
+        table_dir = os.path.join(self.tables_dir, table)
+        state_path = os.path.join(table_dir, "state.npz")
+        meta = self.manifest["tables"].get(table)
+        # a new table, a schema change or --full starts the table over
+        if full or meta is None or meta["columns"] != columns or meta["format"] != self.fmt \
+                or not os.path.exists(state_path):
+            shutil.rmtree(table_dir, ignore_errors=True)
+            meta = None
+        os.makedirs(table_dir, exist_ok=True)
+        select = "rowid, *" if keys == ["rowid"] else "*"
+        export = TableExport(table, full=meta is None)
+
+        if table in APPEND_ONLY_TABLES and keys == ["id"]:
+            watermark = meta["watermark"] if meta else 0
+            changed = _read(conn, table, f"SELECT {select} FROM {table} WHERE id > ? ORDER BY id", (watermark,))
+            ids = np.array([row[0] for row in conn.execute(f"SELECT id FROM {table}")], dtype=np.int64)
+            previous = np.load(state_path)["ids"] if meta else np.zeros(0, dtype=np.int64)
+            removed = pd.DataFrame({"id": np.setdiff1d(previous, ids)})
+            np.savez(state_path, ids=ids)
+            watermark = int(ids.max()) if len(ids) else watermark
+        else:
+            current = _read(conn, table, f"SELECT {select} FROM {table}")
+            key_hash = _key_hash(current, keys)
+            row_hash = pd.util.hash_pandas_object(current, index=False).to_numpy()
+            if meta:
+                with np.load(state_path) as state:
+                    old_keys, old_rows = state["keys"], state["rows"]
+            else:
+                old_keys = old_rows = np.zeros(0, dtype=np.uint64)
+            changed = current[~np.isin(row_hash, old_rows)]
+            removed_keys = np.setdiff1d(old_keys, key_hash)
+            removed = None
+            if len(removed_keys):
+                # the deleted keys themselves come from the previous state of the export
+                before = read_table(self.out_dir, table)
+                removed = before.loc[np.isin(_key_hash(before, keys), removed_keys), keys]
+            np.savez(state_path, keys=key_hash, rows=row_hash)
+            watermark = None
+
+        ext = "parquet" if self.fmt == "parquet" else "npz"
+        if len(changed):
+            _write(changed, os.path.join(table_dir, f"part-{run:05d}.{ext}"), self.fmt)
+        if removed is not None and len(removed):
+            _write(removed, os.path.join(table_dir, f"deleted-{run:05d}.{ext}"), self.fmt)
+        export.upserted, export.deleted = len(changed), 0 if removed is None else len(removed)
+        self.manifest["tables"][table] = {"columns": columns, "keys": keys, "format": self.fmt, "watermark": watermark}
+        return export
+
+
+def read_table(out_dir: str, table: str) -> pd.DataFrame:
+    """The table as of the latest export: parts replayed in run order, later runs winning per key"""
+    with open(os.path.join(out_dir, MANIFEST_FILE)) as f:
+        meta = json.load(f)["tables"][table]
+    keys = meta["keys"]
+    table_dir = os.path.join(out_dir, "tables", table)
+
+    def run_of(path: str) -> int:
+        return int(os.path.basename(path).split("-")[1].split(".")[0])
+
+    parts = sorted(glob.glob(os.path.join(table_dir, "part-*")), key=run_of)
+    if not parts:
+        return pd.DataFrame(columns=(["rowid"] if keys == ["rowid"] else []) + meta["columns"])
+    frames = [_load(path) for path in parts]
+    rows = pd.concat(frames, ignore_index=True)
+    row_run = np.repeat([run_of(path) for path in parts], [len(f) for f in frames])
+    row_key = _key_hash(rows, keys)
+    # a key's newest part wins, unless the key was deleted in a later run
+    deleted = [pd.Series(run_of(path), index=_key_hash(_load(path), keys))
+               for path in glob.glob(os.path.join(table_dir, "deleted-*"))]
+    deleted_run = pd.concat(deleted).groupby(level=0).max() if deleted else pd.Series(dtype=np.int64)
+    latest = ~pd.Series(row_key).duplicated(keep="last").to_numpy()
+    alive = row_run > deleted_run.reindex(row_key).fillna(0).to_numpy()
+    return rows[latest & alive].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot the serving database and export changed rows per table")
+    parser.add_argument("--db", default="farmer_data.db", help="Path to the live SQLite database")
+    parser.add_argument("--out", default="analytics", help="Snapshot and export directory")
+    parser.add_argument("--format", choices=("parquet", "npz"), default="parquet" if pq is not None else "npz")
+    parser.add_argument("--full", action="store_true", help="Re-export every table from scratch")
+    parser.add_argument("--pages", type=int, default=-1, help="Pages copied per backup step (-1 = all at once)")
+    args = parser.parse_args()
+
+    print(SnapshotExporter(args.out, args.format).run(args.db, args.full, args.pages))
+
+
+if __name__ == "__main__":
+    main()
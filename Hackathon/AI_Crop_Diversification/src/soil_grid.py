@@ -0,0 +1,256 @@
+"""Gridded soil rasters (pH, organic matter, drainage class) stored as memory-mapped arrays.
+
+Usage: python src/soil_grid.py data/soil_points.csv data/soil_grid [--cell-deg 0.01] [--max-km 40]
+
+A grid directory holds header.json (georeference and layer files) and one .npy file per
+layer. Layers are opened with mmap_mode="r", so lookups only page in the cells they touch.
+The command above rasterises georeferenced soil points (IDW of the nearest samples) into a
+new grid, writing it band by band.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from features import DRAINAGE_LEVELS, drainage_code
+from geo import GeoIndex, idw_weights
+from tracing import traced
+
+
+GRID_VERSION = 1
+HEADER_FILE = "header.json"
+LAYER_DTYPES = {"ph": np.float32, "organic_matter_pct": np.float32, "drainage": np.int8}
+DRAINAGE_NODATA = -1  # float layers use NaN
+
+
+@dataclass(frozen=True)
+class GridHeader:
+    """Georeference of a north-up lat/lon grid: row 0 is the northern edge, column 0 the western."""
+
+    north: float
+    west: float
+    cell_deg: float
+    rows: int
+    cols: int
+    crs: str = "EPSG:4326"
+    version: int = GRID_VERSION
+
+    @property
+    def south(self) -> float:
+        return self.north - self.rows * self.cell_deg
+
+    @property
+    def east(self) -> float:
+        return self.west + self.cols * self.cell_deg
+
+    def cell_of(self, lat, lon) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(row, col, inside) for coordinates; row/col are clipped so they can always index."""
+        row = np.floor((self.north - np.asarray(lat, dtype=float)) / self.cell_deg).astype(np.int64)
+        col = np.floor((np.asarray(lon, dtype=float) - self.west) / self.cell_deg).astype(np.int64)
+        inside = (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.cols)
+        return np.clip(row, 0, self.rows - 1), np.clip(col, 0, self.cols - 1), inside
+
+    def window(self, south: float, west: float, north: float, east: float) -> Optional[Tuple[slice, slice]]:
+        """Row/column slices of the cells whose centres fall inside a bounding box (None if empty)."""
+        r0 = max(int(np.ceil((self.north - north) / self.cell_deg - 0.5)), 0)
+        r1 = min(int(np.floor((self.north - south) / self.cell_deg - 0.5)) + 1, self.rows)
+        c0 = max(int(np.ceil((west - self.west) / self.cell_deg - 0.5)), 0)
+        c1 = min(int(np.floor((east - self.west) / self.cell_deg - 0.5)) + 1, self.cols)
+        if r0 >= r1 or c0 >= c1:
+            return None
+        return slice(r0, r1), slice(c0, c1)
+
+    def centres(self, rows: slice, cols: slice) -> Tuple[np.ndarray, np.ndarray]:
+        """Latitudes of the rows' and longitudes of the columns' cell centres."""
+        lat = self.north - (np.arange(rows.start, rows.stop) + 0.5) * self.cell_deg
+        lon = self.west + (np.arange(cols.start, cols.stop) + 0.5) * self.cell_deg
+        return lat, lon
+
+
+def _points_in_polygon(lat: np.ndarray, lon: np.ndarray, poly_lat: np.ndarray, poly_lon: np.ndarray) -> np.ndarray:
+    """Even-odd rule for (rows, cols) cell centres against one polygon ring."""
+    inside = np.zeros(np.broadcast(lat, lon).shape, dtype=bool)
+    j = len(poly_lat) - 1
+    for i in range(len(poly_lat)):
+        yi, yj, xi, xj = poly_lat[i], poly_lat[j], poly_lon[i], poly_lon[j]
+        if yi != yj:
+            crosses = (yi > lat) != (yj > lat)
+            x_cross = xi + (lat - yi) * (xj - xi) / (yj - yi)
+            inside ^= crosses & (lon < x_cross)
+        j = i
+    return inside
+
+
+class SoilGrid:
+    """Read-only soil raster. Point lookups are index arithmetic; area means read one window."""
+
+    def __init__(self, header: GridHeader, layers: Dict[str, np.ndarray]):
+        self.header = header
+        self.layers = layers
+
+    @classmethod
+    def open(cls, path: str) -> "SoilGrid":
+        with open(os.path.join(path, HEADER_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version", GRID_VERSION) > GRID_VERSION:
+            raise ValueError(f"Soil grid {path} has version {meta['version']}; this build reads up to {GRID_VERSION}")
+        files = meta.pop("layers")
+        header = GridHeader(**meta)
+        layers = {}
+        for name, filename in files.items():
+            layer = np.load(os.path.join(path, filename), mmap_mode="r")
+            if layer.shape != (header.rows, header.cols):
+                raise ValueError(f"Soil grid layer {name} is {layer.shape}, header says {(header.rows, header.cols)}")
+            layers[name] = layer
+        return cls(header, layers)
+
+    @classmethod
+    def create(cls, path: str, header: GridHeader, layers: Sequence[str] = tuple(LAYER_DTYPES)) -> "SoilGrid":
+        """New grid filled with nodata, backed by writable memmaps (fill it band by band)."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {}
+        for name in layers:
+            arr = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+",
+                                            dtype=LAYER_DTYPES[name], shape=(header.rows, header.cols))
+            arr[:] = DRAINAGE_NODATA if name == "drainage" else np.nan
+            arrays[name] = arr
+        meta = asdict(header)
+        meta["layers"] = {name: f"{name}.npy" for name in layers}
+        with open(os.path.join(path, HEADER_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return cls(header, arrays)
+
+    def flush(self) -> None:
+        for layer in self.layers.values():
+            if isinstance(layer, np.memmap):
+                layer.flush()
+
+    @traced("soil_grid.sample")
+    def sample(self, lat, lon) -> pd.DataFrame:
+        """Batch point lookup: the value of the cell containing each coordinate (NaN/None outside)."""
+        row, col, inside = self.header.cell_of(np.atleast_1d(lat), np.atleast_1d(lon))
+        out = {}
+        for name, layer in self.layers.items():
+            values = layer[row, col]  # fancy indexing on a memmap reads only these cells
+            if name == "drainage":
+                names = np.asarray(DRAINAGE_LEVELS + (None,), dtype=object)
+                out[name] = names[np.where(inside & (values >= 0), values, len(DRAINAGE_LEVELS))]
+            else:
+                out[name] = np.where(inside, values, np.nan)
+        return pd.DataFrame(out)
+
+    def point(self, lat: float, lon: float) -> Optional[Dict[str, object]]:
+        """Soil at one coordinate, shaped as compute_scores' soil_override (None outside/no data)."""
+        header = self.header
+        row = math.floor((header.north - lat) / header.cell_deg)
+        col = math.floor((lon - header.west) / header.cell_deg)
+        if not (0 <= row < header.rows and 0 <= col < header.cols):
+            return None
+        out: Dict[str, object] = {}
+        for name, layer in self.layers.items():
+            value = layer[row, col].item()
+            if name == "drainage":
+                if value >= 0:
+                    out[name] = DRAINAGE_LEVELS[value]
+            elif not math.isnan(value):
+                out[name] = round(value, 2)
+        return out or None
+
+    @traced("soil_grid.area_mean")
+    def bbox_mean(self, south: float, west: float, north: float, east: float) -> Optional[Dict[str, object]]:
+        """Mean pH/organic matter and majority drainage over the cells inside a bounding box."""
+        window = self.header.window(south, west, north, east)
+        if window is None:
+            return None
+        return self._as_override({name: layer[window] for name, layer in self.layers.items()})
+
+    @traced("soil_grid.area_mean")
+    def polygon_mean(self, lats: Sequence[float], lons: Sequence[float]) -> Optional[Dict[str, object]]:
+        """Like bbox_mean, restricted to cells whose centre lies inside the polygon ring."""
+        poly_lat = np.asarray(lats, dtype=float)
+        poly_lon = np.asarray(lons, dtype=float)
+        window = self.header.window(poly_lat.min(), poly_lon.min(), poly_lat.max(), poly_lon.max())
+        if window is None:
+            return None
+        lat, lon = self.header.centres(*window)
+        mask = _points_in_polygon(lat[:, None], lon[None, :], poly_lat, poly_lon)
+        return self._as_override({name: layer[window][mask] for name, layer in self.layers.items()})
+
+    def around(self, lat: float, lon: float, area_ha: float) -> Optional[Dict[str, object]]:
+        """Mean over a square of `area_ha` hectares centred on a point (at least its own cell)."""
+        half_km = np.sqrt(max(area_ha, 0.0) * 0.01) / 2.0
+        half_lat = max(half_km / 111.32, self.header.cell_deg / 2)
+        half_lon = max(half_km / (111.32 * max(np.cos(np.radians(lat)), 1e-6)), self.header.cell_deg / 2)
+        return self.bbox_mean(lat - half_lat, lon - half_lon, lat + half_lat, lon + half_lon) or self.point(lat, lon)
+
+    @staticmethod
+    def _as_override(cells: Dict[str, np.ndarray]) -> Optional[Dict[str, object]]:
+        out: Dict[str, object] = {}
+        for name, values in cells.items():
+            values = np.asarray(values)
+            if name == "drainage":
+                counts = np.bincount(values[values >= 0].ravel(), minlength=len(DRAINAGE_LEVELS))
+                if counts.any():
+                    out[name] = DRAINAGE_LEVELS[int(counts.argmax())]
+            elif np.isfinite(values).any():
+                out[name] = round(float(np.nanmean(values, dtype=np.float64)), 2)
+        return out or None
+
+
+def rasterize_points(points: pd.DataFrame, path: str, cell_deg: float = 0.01, max_km: float = 40.0,
+                     k: int = 4, margin_deg: float = 0.25, band_cells: int = 1 << 16) -> SoilGrid:
+    """Build a grid from soil sample points: IDW pH/organic matter, nearest-point drainage.
+
+    Cells farther than `max_km` from any sample stay nodata. Rows are filled in bands of
+    about `band_cells` cells, so memory use does not grow with the grid.
+    """
+    north = float(points["lat"].max()) + margin_deg
+    west = float(points["lon"].min()) - margin_deg
+    rows = int(np.ceil((north - float(points["lat"].min()) + margin_deg) / cell_deg))
+    cols = int(np.ceil((float(points["lon"].max()) + margin_deg - west) / cell_deg))
+    grid = SoilGrid.create(path, GridHeader(north=north, west=west, cell_deg=cell_deg, rows=rows, cols=cols))
+
+    # cells as large as the search bound: one grid pass finds every sample within max_km
+    index = GeoIndex(points["lat"], points["lon"], cell_km=max_km)
+    ph = points["ph"].to_numpy(dtype=float)
+    om = points["organic_matter_pct"].to_numpy(dtype=float)
+    drainage = np.array([drainage_code(d) for d in points["drainage"]], dtype=np.int8)
+    band_rows = max(1, band_cells // cols)
+    for r0 in range(0, rows, band_rows):
+        band = slice(r0, min(r0 + band_rows, rows))
+        lat, lon = grid.header.centres(band, slice(0, cols))
+        lat_grid, lon_grid = np.meshgrid(lat, lon, indexing="ij")
+        dist, idx = index.query(lat_grid.ravel(), lon_grid.ravel(), k, max_km=max_km)
+        weights = idw_weights(dist, idx)
+        near = idx[:, 0] >= 0
+        shape = lat_grid.shape
+        safe = np.maximum(idx, 0)
+        grid.layers["ph"][band] = np.where(near, (weights * ph[safe]).sum(axis=1), np.nan).reshape(shape)
+        grid.layers["organic_matter_pct"][band] = np.where(near, (weights * om[safe]).sum(axis=1), np.nan).reshape(shape)
+        grid.layers["drainage"][band] = np.where(near, drainage[safe[:, 0]], DRAINAGE_NODATA).reshape(shape)
+    grid.flush()
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rasterise soil sample points into a memory-mapped soil grid")
+    parser.add_argument("points", help="CSV with lat, lon, ph, organic_matter_pct, drainage")
+    parser.add_argument("output", help="Grid directory to create")
+    parser.add_argument("--cell-deg", type=float, default=0.01, help="Cell size in degrees (0.01 ≈ 1.1 km)")
+    parser.add_argument("--max-km", type=float, default=40.0, help="Leave cells farther than this from any sample empty")
+    args = parser.parse_args()
+
+    grid = rasterize_points(pd.read_csv(args.points), args.output, args.cell_deg, args.max_km)
+    filled = int(np.isfinite(grid.layers["ph"]).sum())
+    print(f"Wrote {grid.header.rows}x{grid.header.cols} grid to {args.output} ({filled} cells with data)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Supply feedback from the planting intentions farmers have saved.
+
+The supply_index values in market.csv are static, so nothing damps a crop that the
+advisor recommends to every farmer in a region. FarmerDatabase keeps a planted-area
+counter per (region, crop) in region_crop_area, updated in the transaction that saves
+the selections. SupplyEstimator turns each crop's share of the region's planned area
+into a multiplier on its supply index, which compute_scores applies to market_score.
+
+Factors are quantised to FACTOR_STEP and factors of 1 are left out. The factors are part
+of the reuse data version, so only a change of a whole step starts a new reuse index.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from database import FarmerDatabase
+
+
+ELASTICITY = 0.5
+# planned area (ha) at which the feedback reaches half strength; a factor can only move
+# one FACTOR_STEP once about CONFIDENCE_AREA_HA / 9 (~56 ha) is planned in the region
+CONFIDENCE_AREA_HA = 500.0
+FACTOR_STEP = 0.1
+
+
+def supply_factors(planted: Mapping[str, float], crops: Sequence[str], elasticity: float = ELASTICITY,
+                   confidence_area_ha: float = CONFIDENCE_AREA_HA) -> Dict[str, float]:
+    """Supply index multiplier per crop from its share of the planned area.
+
+    A crop with exactly an even share of the region's planned area (1 / len(crops)) keeps
+    factor 1. Heavier planting raises its supply, lighter planting lowers it. The excess
+    over the even share is capped at +-1, so a single crop, even the only one planned,
+    moves at most `weight`. Only crops with a market row count, because the others have
+    no supply index to adjust.
+    """
+    total = sum(planted.get(crop, 0.0) for crop in crops)
+    if total <= 0 or not crops:
+        return {}
+    weight = elasticity * total / (total + confidence_area_ha)
+    return {
+        crop: 1.0 + weight * min(max(planted.get(crop, 0.0) / total * len(crops) - 1.0, -1.0), 1.0)
+        for crop in crops
+    }
+
+
+def quantise(factors: Mapping[str, float], step: float = FACTOR_STEP) -> Dict[str, float]:
+    """Factors rounded to `step`; those that round to 1 are dropped."""
+    rounded = {crop: round(round(f / step) * step, 6) for crop, f in factors.items()}
+    return {crop: f for crop, f in rounded.items() if f != 1.0}
+
+
+class SupplyEstimator:
+    """Per-region supply factors, reloaded only when a selection write has changed the counters."""
+
+    def __init__(self, db: FarmerDatabase, market_df: Optional[pd.DataFrame],
+                 elasticity: float = ELASTICITY, confidence_area_ha: float = CONFIDENCE_AREA_HA):
+        self.db = db
+        self.elasticity = elasticity
+        self.confidence_area_ha = confidence_area_ha
+        self.market_crops: Dict[str, Tuple[str, ...]] = {}
+        if market_df is not None:
+            rows = market_df.drop_duplicates(["region", "crop"])
+            for region, crops in rows.groupby("region")["crop"]:
+                self.market_crops[region] = tuple(crops)
+        self._factors: Dict[str, Tuple[int, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def factors(self, region: str) -> Dict[str, float]:
+        """Quantised supply multipliers of `region`'s market crops; crops at factor 1 are omitted."""
+        crops = self.market_crops.get(region)
+        if not crops:
+            return {}
+        generation = self.db.get_summary_generation()
+        with self._lock:
+            cached = self._factors.get(region)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        factors = quantise(supply_factors(self.db.get_planted_area(region), crops, self.elasticity,
+                                          self.confidence_area_ha))
+        with self._lock:
+            self._factors[region] = (generation, factors)
+        return factors
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Latency histogram bucket upper bounds in seconds (Prometheus-style, +Inf implied)
+BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+@dataclass
+class StageStats:
+    count: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+    bucket_counts: List[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+
+class _NoopSpan:
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.tracer.record(self.name, time.perf_counter() - self.start)
+
+
+class Tracer:
+    """Stage-level timer: process-wide histograms plus a per-thread breakdown of the current run.
+
+    Disabled by default; set CROP_TRACE=1 or call enable_for_run() to turn it on.
+    When disabled, span() and traced() cost one attribute check per call.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def is_active(self) -> bool:
+        return self.enabled or getattr(self._local, "enabled", False)
+
+    def enable_for_run(self, enabled: bool = True) -> None:
+        """Turn tracing on for the calling thread only (one Streamlit rerun)."""
+        self._local.enabled = enabled
+
+    def reset_run(self) -> None:
+        self._local.run = []
+
+    def current_run(self) -> List[Tuple[str, float]]:
+        return list(getattr(self._local, "run", []))
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.observe(seconds)
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            run.append((name, seconds))
+
+    def span(self, name: str):
+        if not self.is_active():
+            return _NOOP
+        return _Span(self, name)
+
+    def traced(self, name: Optional[str] = None) -> Callable[[Callable], Callable]:
+        def decorator(func: Callable) -> Callable:
+            stage = name or f"{func.__module__}.{func.__qualname__}"
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.is_active():
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {
+                    "count": s.count,
+                    "total_s": s.total_s,
+                    "mean_s": s.total_s / s.count if s.count else 0.0,
+                    "max_s": s.max_s,
+                    "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], s.bucket_counts)),
+                }
+                for name, s in self.stages.items()
+            }
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP crop_stage_seconds Latency of app and logic pipeline stages",
+            "# TYPE crop_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name in sorted(self.stages):
+                s = self.stages[name]
+                cumulative = 0
+                for bound, n in zip([str(b) for b in BUCKETS] + ["+Inf"], s.bucket_counts):
+                    cumulative += n
+                    lines.append(f'crop_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'crop_stage_seconds_sum{{stage="{name}"}} {s.total_s:.6f}')
+                lines.append(f'crop_stage_seconds_count{{stage="{name}"}} {s.count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str) -> None:
+        """Write metrics to `path`: Prometheus text for .prom/.txt, JSON otherwise."""
+        if path.endswith((".prom", ".txt")):
+            payload = self.to_prometheus()
+        else:
+            payload = json.dumps(self.snapshot(), indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+
+tracer = Tracer(enabled=os.environ.get("CROP_TRACE", "") not in ("", "0"))
+span = tracer.span
+traced = tracer.traced
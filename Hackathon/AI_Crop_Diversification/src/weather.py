@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import abc
+import datetime
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+FORECAST_COLUMNS = ["Date", "Min Temp (°C)", "Max Temp (°C)", "Humidity (%)", "Rainfall (mm)", "Wind Speed (km/h)"]
+
+# (column, threshold, message) – an alert fires when the value is strictly above the threshold
+ALERT_RULES: List[Tuple[str, float, str]] = [
+    ("Rainfall (mm)", 15, "🌧️ Heavy rainfall expected on {date} - Consider protecting crops"),
+    ("Max Temp (°C)", 35, "🌡️ High temperature warning on {date} - Ensure adequate irrigation"),
+    ("Wind Speed (km/h)", 15, "💨 Strong winds expected on {date} - Check crop support structures"),
+]
+
+
+class WeatherProvider(abc.ABC):
+    """Source of daily forecasts for a (region, district)."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def fetch(self, region: str, district: str, start: datetime.date, days: int = 7) -> pd.DataFrame:
+        """FORECAST_COLUMNS rows for `days` days from `start`."""
+
+
+class LocalWeatherProvider(WeatherProvider):
+    """Offline stand-in provider.
+
+    Reads rows from a CSV (region, district, date, temp_min_c, temp_max_c, humidity_pct,
+    rain_mm, wind_kmh) when one is available; any day not in the file is synthesised
+    deterministically from (region, district, date), so a given day always has the same value.
+    """
+
+    name = "local"
+
+    def __init__(self, csv_path: Optional[str] = None):
+        self.observations: Dict[Tuple[str, str, str], Tuple[float, ...]] = {}
+        if csv_path and os.path.exists(csv_path):
+            df = pd.read_csv(csv_path, dtype={"date": str})
+            cols = ["temp_min_c", "temp_max_c", "humidity_pct", "rain_mm", "wind_kmh"]
+            for key, values in zip(
+                zip(df["region"], df["district"], df["date"]), df[cols].itertuples(index=False, name=None)
+            ):
+                self.observations[key] = values
+
+    @staticmethod
+    def _synthetic_day(region: str, district: str, date: datetime.date) -> Tuple[float, ...]:
+        rng = random.Random(f"{region}|{district}|{date.isoformat()}")
+        temp_min = rng.randint(15, 25)
+        temp_max = rng.randint(25, 35)
+        humidity = rng.randint(40, 80)
+        rainfall = rng.randint(0, 20) if rng.random() < 0.3 else 0
+        wind_speed = rng.randint(5, 20)
+        return temp_min, temp_max, humidity, rainfall, wind_speed
+
+    def fetch(self, region: str, district: str, start: datetime.date, days: int = 7) -> pd.DataFrame:
+        rows = []
+        for i in range(days):
+            date = start + datetime.timedelta(days=i)
+            values = self.observations.get((region, district, date.isoformat()))
+            if values is None:
+                values = self._synthetic_day(region, district, date)
+            rows.append((date.strftime("%Y-%m-%d"),) + tuple(values))
+        return pd.DataFrame(rows, columns=FORECAST_COLUMNS)
+
+
+class CachedWeatherProvider(WeatherProvider):
+    """On-disk cache in front of another provider, keyed by (region, district, start date, days).
+
+    Entries older than `ttl_s` are refetched, and expired files are deleted by prune(),
+    which runs at most once per `ttl_s` when an entry is written. Concurrent callers for
+    the same key wait on one fetch, and every session/process reading the same cache
+    directory shares the stored result.
+    """
+
+    def __init__(self, provider: WeatherProvider, cache_dir: str, ttl_s: float = 3 * 3600):
+        self.provider = provider
+        self.cache_dir = cache_dir
+        self.ttl_s = ttl_s
+        self.name = f"cached:{provider.name}"
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._pruned_at = 0.0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, region: str, district: str, start: datetime.date, days: int) -> str:
+        safe = "".join(ch if ch.isalnum() else "_" for ch in f"{region}__{district}")
+        return os.path.join(self.cache_dir, f"{safe}__{start.isoformat()}__{days}.json")
+
+    def _read(self, path: str) -> Optional[pd.DataFrame]:
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_s:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return pd.DataFrame(json.load(f), columns=FORECAST_COLUMNS)
+        except (OSError, ValueError):
+            return None
+
+    def prune(self) -> int:
+        """Delete expired entries (and temp files left by interrupted writes); returns files removed."""
+        self._pruned_at = now = time.time()
+        removed = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith((".json", ".tmp")):
+                continue
+            try:
+                if now - entry.stat().st_mtime <= self.ttl_s:
+                    continue
+                os.remove(entry.path)
+            except OSError:
+                continue  # written or removed by another process meanwhile
+            removed += 1
+            with self._locks_guard:
+                lock = self._locks.get(entry.path)
+                if lock is not None and not lock.locked():
+                    del self._locks[entry.path]
+        return removed
+
+    def fetch(self, region: str, district: str, start: datetime.date, days: int = 7) -> pd.DataFrame:
+        path = self._path(region, district, start, days)
+        cached = self._read(path)
+        if cached is not None:
+            return cached
+
+        with self._locks_guard:
+            lock = self._locks.setdefault(path, threading.Lock())
+        with lock:
+            # another caller may have filled the entry while we waited
+            cached = self._read(path)
+            if cached is not None:
+                return cached
+            df = self.provider.fetch(region, district, start, days)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(df[FORECAST_COLUMNS].values.tolist(), f, ensure_ascii=False, default=float)
+            os.replace(tmp_path, path)
+        if time.time() - self._pruned_at > self.ttl_s:
+            self.prune()
+        return df
+
+
+def fetch_many(
+    provider: WeatherProvider, locations: Iterable[Tuple[str, str]], start: datetime.date, days: int = 7
+) -> pd.DataFrame:
+    """Forecasts for many (region, district) pairs stacked into one frame with region/district columns."""
+    frames = []
+    for region, district in locations:
+        df = provider.fetch(region, district, start, days)
+        frames.append(df.assign(region=region, district=district))
+    if not frames:
+        return pd.DataFrame(columns=["region", "district"] + FORECAST_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def weather_alerts(forecast: pd.DataFrame) -> pd.DataFrame:
+    """Threshold alerts over a whole forecast frame (one or many districts).
+
+    Each rule is a single vectorised mask; output rows keep the forecast order, then rule order.
+    Extra key columns (e.g. region, district) are carried through.
+    """
+    keys = [c for c in ("region", "district") if c in forecast.columns]
+    parts = []
+    for rule_idx, (column, threshold, message) in enumerate(ALERT_RULES):
+        mask = forecast[column].to_numpy(dtype=float) > threshold
+        if not mask.any():
+            continue
+        hits = forecast.loc[mask, keys + ["Date"]]
+        parts.append(hits.assign(
+            alert=column,
+            message=[message.format(date=d) for d in hits["Date"]],
+            _row=np.flatnonzero(mask),
+            _rule=rule_idx,
+        ))
+    if not parts:
+        return pd.DataFrame(columns=keys + ["Date", "alert", "message"])
+    alerts = pd.concat(parts, ignore_index=True).sort_values(["_row", "_rule"], kind="stable")
+    return alerts.drop(columns=["_row", "_rule"]).reset_index(drop=True)
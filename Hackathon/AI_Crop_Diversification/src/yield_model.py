@@ -0,0 +1,232 @@
+"""Optional learned yield model, trained offline from historical outcomes.
+
+Usage:
+    python src/yield_model.py train outcomes.csv [--crops data/crops.csv] [--models models]
+    python src/yield_model.py bench [--models models] [--crops-n 10000] [--farms 50]
+
+outcomes.csv has one row per observed harvest: crop, ph, drainage, organic_matter_pct,
+forecast_temp_c, forecast_rain_mm and the realised yield_t_ha. The model learns the
+multiplier on the crop's base_yield_t_ha from soil, climate and the agronomic sub-scores;
+each training run writes the next models/yield_model_v<N>.joblib and the newest one is
+used. Without an artifact (or without scikit-learn) the yield formula is used instead.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import functools
+import glob
+import os
+import re
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalog import CropCatalog
+from features import drainage_code
+from tracing import traced
+
+try:
+    import joblib
+    import sklearn
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from sklearn.model_selection import train_test_split
+except ImportError:  # the learned model is optional
+    joblib = sklearn = None
+
+
+ARTIFACT_FORMAT = 1
+ARTIFACT_PATTERN = "yield_model_v*.joblib"
+SITE_FEATURES = ("ph", "drainage", "organic_matter_pct", "forecast_temp_c", "forecast_rain_mm")
+SCORE_FEATURES = ("soil_ph_score", "drainage_score", "water_score", "temp_score")
+FEATURE_COLUMNS = SITE_FEATURES + SCORE_FEATURES + ("base_yield_t_ha",)
+
+
+def formula_yield(scored_df: pd.DataFrame) -> np.ndarray:
+    """The rule-based expected yield (t/ha)."""
+    return scored_df["base_yield_t_ha"].to_numpy() * (0.7 + 0.6 * scored_df["temp_score"].to_numpy()) * (
+        0.7 + 0.6 * scored_df["water_score"].to_numpy()
+    )
+
+
+def yield_features(scored_df: pd.DataFrame, site: Mapping[str, Any]) -> np.ndarray:
+    """(crops, features) matrix for one farm: its site values broadcast against every crop."""
+    out = np.empty((len(scored_df), len(FEATURE_COLUMNS)))
+    for j, name in enumerate(FEATURE_COLUMNS):
+        if name == "drainage":
+            out[:, j] = drainage_code(site["drainage"]) if isinstance(site["drainage"], str) else site["drainage"]
+        elif name in SITE_FEATURES:
+            out[:, j] = float(site[name])
+        else:
+            out[:, j] = scored_df[name].to_numpy()
+    return out
+
+
+class YieldModel:
+    """A loaded artifact: the regressor plus its metadata."""
+
+    def __init__(self, artifact: Dict[str, Any], path: str):
+        self.path = path
+        self.version = int(artifact["version"])
+        self.estimator = artifact["estimator"]
+        self.meta = {k: v for k, v in artifact.items() if k != "estimator"}
+
+    def __repr__(self) -> str:
+        return f"YieldModel(v{self.version}, trained {self.meta.get('trained_at')}, {self.meta.get('samples')} samples)"
+
+    @traced("yield_model.predict")
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Yield (t/ha) for a (rows, FEATURE_COLUMNS) matrix, in one estimator call."""
+        if len(features) == 0:
+            return np.zeros(0)
+        multiplier = self.estimator.predict(features)
+        return np.maximum(multiplier, 0.0) * features[:, FEATURE_COLUMNS.index("base_yield_t_ha")]
+
+    def predict_farms(self, farms: Sequence[Tuple[pd.DataFrame, Mapping[str, Any]]]) -> List[np.ndarray]:
+        """Yields for several (scored_df, site) farms with a single batched prediction."""
+        blocks = [yield_features(scored, site) for scored, site in farms]
+        flat = self.predict(np.vstack(blocks)) if blocks else np.zeros(0)
+        return np.split(flat, np.cumsum([len(b) for b in blocks])[:-1])
+
+
+def artifact_versions(model_dir: str) -> List[Tuple[int, str]]:
+    found = []
+    for path in glob.glob(os.path.join(model_dir, ARTIFACT_PATTERN)):
+        match = re.search(r"_v(\d+)\.joblib$", path)
+        if match:
+            found.append((int(match.group(1)), path))
+    return sorted(found)
+
+
+@functools.lru_cache(maxsize=None)
+def load_yield_model(model_dir: str) -> Optional[YieldModel]:
+    """Newest compatible artifact in `model_dir`, loaded once per process; None means use the formula."""
+    if joblib is None:
+        return None
+    for version, path in reversed(artifact_versions(model_dir)):
+        artifact = joblib.load(path)
+        if artifact.get("format") == ARTIFACT_FORMAT and tuple(artifact.get("features", ())) == FEATURE_COLUMNS:
+            return YieldModel(artifact, path)
+    return None
+
+
+def outcome_features(outcomes: pd.DataFrame, crops_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Feature matrix and multiplier target for historical outcomes (unknown crops are dropped)."""
+    position = pd.Index(crops_df["crop"]).get_indexer(outcomes["crop"])
+    known = position >= 0
+    outcomes = outcomes.loc[known]
+    rows = crops_df.iloc[position[known]].reset_index(drop=True)
+    # every outcome has its own site, so the sub-scores are evaluated row against row
+    drainage = np.array([drainage_code(d) for d in outcomes["drainage"]])
+    scores = CropCatalog(rows).score(
+        "",
+        ph=outcomes["ph"].to_numpy(dtype=float),
+        drainage=drainage,
+        forecast_temp=outcomes["forecast_temp_c"].to_numpy(dtype=float),
+        forecast_rain=outcomes["forecast_rain_mm"].to_numpy(dtype=float),
+        market_index=1.0,
+    )
+    frame = pd.DataFrame({
+        "ph": outcomes["ph"].to_numpy(dtype=float),
+        "drainage": drainage,
+        "organic_matter_pct": outcomes["organic_matter_pct"].to_numpy(dtype=float),
+        "forecast_temp_c": outcomes["forecast_temp_c"].to_numpy(dtype=float),
+        "forecast_rain_mm": outcomes["forecast_rain_mm"].to_numpy(dtype=float),
+        **{name: scores[name] for name in SCORE_FEATURES},
+        "base_yield_t_ha": rows["base_yield_t_ha"].to_numpy(dtype=float),
+    })
+    target = outcomes["yield_t_ha"].to_numpy(dtype=float) / frame["base_yield_t_ha"].to_numpy()
+    return frame[list(FEATURE_COLUMNS)].to_numpy(), target
+
+
+def train_yield_model(outcomes: pd.DataFrame, crops_df: pd.DataFrame, model_dir: str, seed: int = 0) -> YieldModel:
+    """Fit on historical outcomes and save the next artifact version."""
+    if joblib is None:
+        raise RuntimeError("Training the yield model needs scikit-learn (pip install scikit-learn)")
+    X, y = outcome_features(outcomes, crops_df)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    estimator = HistGradientBoostingRegressor(max_iter=150, learning_rate=0.1, random_state=seed)
+    estimator.fit(X_train, y_train)
+
+    base_test = X_test[:, FEATURE_COLUMNS.index("base_yield_t_ha")]
+    model_mae = float(np.mean(np.abs(estimator.predict(X_test) - y_test) * base_test))
+    formula = (0.7 + 0.6 * X_test[:, FEATURE_COLUMNS.index("temp_score")]) * (
+        0.7 + 0.6 * X_test[:, FEATURE_COLUMNS.index("water_score")])
+    formula_mae = float(np.mean(np.abs(formula - y_test) * base_test))
+
+    versions = artifact_versions(model_dir)
+    version = versions[-1][0] + 1 if versions else 1
+    artifact = {
+        "format": ARTIFACT_FORMAT,
+        "version": version,
+        "features": FEATURE_COLUMNS,
+        "estimator": estimator,
+        "trained_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sklearn_version": sklearn.__version__,
+        "samples": int(len(X)),
+        "mae_t_ha": model_mae,
+        "formula_mae_t_ha": formula_mae,
+    }
+    os.makedirs(model_dir, exist_ok=True)
+    path = os.path.join(model_dir, f"yield_model_v{version}.joblib")
+    joblib.dump(artifact, path)
+    load_yield_model.cache_clear()
+    return YieldModel(artifact, path)
+
+
+def benchmark(model: Optional[YieldModel], scored_df: pd.DataFrame, site: Mapping[str, Any], farms: int = 1,
+              repeat: int = 5) -> Dict[str, float]:
+    """Best-of-`repeat` latency (ms) of the formula and, if loaded, the model for `farms` farms."""
+    def best(fn) -> float:
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - started) * 1e3)
+        return min(times)
+
+    report = {"rows": float(len(scored_df) * farms), "formula_ms": best(lambda: [formula_yield(scored_df) for _ in range(farms)])}
+    if model is not None:
+        report["model_ms"] = best(lambda: model.predict_farms([(scored_df, site)] * farms))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or benchmark the learned yield model")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train", help="Fit on historical outcomes and save a new artifact version")
+    train.add_argument("outcomes", help="CSV of observed yields")
+    bench = sub.add_parser("bench", help="Compare model and formula inference latency")
+    bench.add_argument("--crops-n", type=int, default=10000, help="Crops per farm (sampled from crops.csv)")
+    bench.add_argument("--farms", type=int, default=50, help="Farms per batched call")
+    for p in (train, bench):
+        p.add_argument("--crops", default="data/crops.csv", help="Crop catalogue")
+        p.add_argument("--models", default="models", help="Artifact directory")
+    args = parser.parse_args()
+
+    crops = pd.read_csv(args.crops)
+    if args.command == "train":
+        model = train_yield_model(pd.read_csv(args.outcomes), crops, args.models)
+        print(f"Saved {model.path}: MAE {model.meta['mae_t_ha']:.3f} t/ha "
+              f"(formula {model.meta['formula_mae_t_ha']:.3f} t/ha) on held-out outcomes")
+        return
+
+    model = load_yield_model(os.path.abspath(args.models))
+    site = {"ph": 6.5, "drainage": "moderate", "organic_matter_pct": 2.0, "forecast_temp_c": 27.0, "forecast_rain_mm": 700.0}
+    sample = crops.sample(args.crops_n, replace=True, random_state=0).reset_index(drop=True)
+    catalog = CropCatalog(sample)
+    scored = pd.concat([sample, pd.DataFrame(catalog.score("", 6.5, drainage_code("moderate"), 27.0, 700.0, 1.0))], axis=1)
+    for farms in (1, args.farms):
+        report = benchmark(model, scored, site, farms)
+        line = f"{int(report['rows']):>9,} rows: formula {report['formula_ms']:.2f} ms"
+        if "model_ms" in report:
+            line += f", model {report['model_ms']:.2f} ms ({report['model_ms'] * 1e3 / report['rows']:.2f} µs/row)"
+        print(line)
+    if model is None:
+        print(f"No yield model in {args.models}; the formula is in use")
+
+
+if __name__ == "__main__":
+    main()